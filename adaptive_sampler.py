@@ -0,0 +1,128 @@
+import cv2
+import numpy as np
+from box_utils import iou
+
+sampling_modes = ["fixed", "adaptive"]
+
+
+def add_sampler_arguments(parser):
+    # command line arguments shared by the scripts that choose which tracked frames to save
+    parser.add_argument("--sampling", default="fixed", choices=sampling_modes, required=False,
+                        help="fixed saves every n-th frame, adaptive saves a frame when the boxes moved or the "
+                             "image changed enough since the last saved frame")
+    parser.add_argument("--min_interval", type=int, default=2, required=False,
+                        help="adaptive sampling saves at most one frame in this many video frames")
+    parser.add_argument("--max_interval", type=int, default=60, required=False,
+                        help="adaptive sampling saves at least one frame in this many video frames")
+    parser.add_argument("--motion_threshold", type=float, default=0.3, required=False,
+                        help="save when 1 - IoU of a box with its box in the last saved frame is above this")
+    parser.add_argument("--appearance_threshold", type=int, default=10, required=False,
+                        help="save when this many of the 64 bits of the difference hash of the frame changed "
+                             "since the last saved frame, 0 does not compare the images")
+
+
+def sampler_from_args(args):
+    if args.sampling == "fixed":
+        return FixedSampler(args.save_every)
+    return AdaptiveSampler(args.min_interval, args.max_interval, args.motion_threshold, args.appearance_threshold)
+
+
+def difference_hash(image):
+    # 64 bits that tell if every pixel of a 9x8 thumbnail is brighter than its left neighbour
+    gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA).astype(np.int16)
+    return small[:, 1:] > small[:, :-1]
+
+
+class FixedSampler:
+    """
+    Saves every save_every-th frame of the naming sequence
+    """
+
+    def __init__(self, save_every):
+        self.save_every = save_every
+        self.considered = 0
+        self.saved = 0
+
+    def reset(self):
+        pass
+
+    def should_save(self, save_counter, frame_index, boxes, image):
+        self.considered += 1
+        if save_counter % self.save_every == 0:
+            self.saved += 1
+            return True
+        return False
+
+    def report(self):
+        pass
+
+
+class AdaptiveSampler:
+    """
+    Saves a tracked frame when a box moved or changed its size, or the frame changed its appearance, enough since
+    the last saved frame, with at least min_interval and at most max_interval video frames between saved frames
+    The first frame after reset(), which is called when the trackers are started with new boxes, is always saved
+    """
+
+    def __init__(self, min_interval=2, max_interval=60, motion_threshold=0.3, appearance_threshold=10):
+        if min_interval < 1 or max_interval < min_interval:
+            raise AssertionError("The intervals of the sampler should be 1 <= min_interval <= max_interval")
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.motion_threshold = motion_threshold
+        self.appearance_threshold = appearance_threshold
+        # the boxes, the hash and the video frame of the last saved frame
+        self.last_boxes = None
+        self.last_hash = None
+        self.last_index = None
+        self.considered = 0
+        self.saved = 0
+        self.reasons = {"start": 0, "objects": 0, "motion": 0, "appearance": 0, "interval": 0}
+
+    def reset(self):
+        self.last_boxes = None
+
+    def motion(self, boxes):
+        # the largest change of a box since the last saved frame, the boxes are in the order of the trackers
+        old = np.asarray([b[1:] for b in self.last_boxes])
+        new = np.asarray([b[1:] for b in boxes])
+        return float((1 - iou(old, new)).max())
+
+    def reason(self, frame_index, boxes, image):
+        if self.last_boxes is None:
+            return "start"
+        interval = frame_index - self.last_index
+        if interval < self.min_interval:
+            return None
+        if interval >= self.max_interval:
+            return "interval"
+        if len(boxes) != len(self.last_boxes) or any(a[0] != b[0] for a, b in zip(boxes, self.last_boxes)):
+            return "objects"
+        if len(boxes) > 0 and self.motion(boxes) > self.motion_threshold:
+            return "motion"
+        if self.appearance_threshold > 0 and image is not None and self.last_hash is not None and \
+                np.count_nonzero(difference_hash(image) != self.last_hash) >= self.appearance_threshold:
+            return "appearance"
+        return None
+
+    def should_save(self, save_counter, frame_index, boxes, image):
+        """
+        boxes: list of [class_id, x1, y1, x2, y2] of the frame
+        image: the frame the hash is computed on, the small tracking frame is enough
+        """
+        self.considered += 1
+        reason = self.reason(frame_index, boxes, image)
+        if reason is None:
+            return False
+        self.reasons[reason] += 1
+        self.saved += 1
+        self.last_boxes = [list(b) for b in boxes]
+        self.last_index = frame_index
+        if self.appearance_threshold > 0 and image is not None:
+            self.last_hash = difference_hash(image)
+        return True
+
+    def report(self):
+        print("sampler: saved %d of %d tracked frames (%s)" %
+              (self.saved, self.considered, ", ".join("%s %d" % r for r in self.reasons.items())))
@@ -0,0 +1,186 @@
+import argparse
+import json
+import numpy as np
+import os
+import threading
+
+# the annotations of a session are kept in two append only binary files in the annotations/ folder
+# labels.bin has one record per box and frames.bin one record per saved frame pointing to its boxes,
+# both can be memory mapped and read column by column, for example labels["class_id"]
+# a frame that is saved again appends new records, the last record of a frame is the valid one
+label_dtype = np.dtype([("frame", "<i8"), ("class_id", "<i4"),
+                        ("cx", "<f4"), ("cy", "<f4"), ("w", "<f4"), ("h", "<f4")])
+frame_dtype = np.dtype([("frame", "<i8"), ("source_frame", "<i8"), ("offset", "<i8"), ("count", "<i4"),
+                        ("width", "<i4"), ("height", "<i4")])
+
+
+def store_paths(save_path):
+    return os.path.join(save_path, "annotations", "frames.bin"), os.path.join(save_path, "annotations", "labels.bin")
+
+
+class AnnotationStore:
+    """
+    Appends the boxes of the saved frames to the frames.bin and labels.bin files of a session
+    """
+
+    def __init__(self, save_path):
+        frames_path, labels_path = store_paths(save_path)
+        # a session that stopped during a write can end with a partial frame record, which is cut off
+        if os.path.exists(frames_path) and os.path.getsize(frames_path) % frame_dtype.itemsize != 0:
+            with open(frames_path, 'r+b') as f:
+                f.truncate(os.path.getsize(frames_path) // frame_dtype.itemsize * frame_dtype.itemsize)
+        # the boxes are written before their frame record, so the labels after the boxes of the last complete
+        # frame record belong to a frame that was never recorded and are cut off too
+        self.offset = 0
+        if os.path.exists(frames_path) and os.path.getsize(frames_path) > 0:
+            with open(frames_path, 'rb') as f:
+                f.seek(-frame_dtype.itemsize, os.SEEK_END)
+                last = np.frombuffer(f.read(frame_dtype.itemsize), dtype=frame_dtype)[0]
+            self.offset = int(last["offset"]) + int(last["count"])
+        if os.path.exists(labels_path) and os.path.getsize(labels_path) > self.offset * label_dtype.itemsize:
+            with open(labels_path, 'r+b') as f:
+                f.truncate(self.offset * label_dtype.itemsize)
+        self.frames_file = open(frames_path, 'ab')
+        self.labels_file = open(labels_path, 'ab')
+        self.lock = threading.Lock()
+
+    def append(self, frame, boxes, source_frame=-1, width=0, height=0):
+        """
+        boxes: list of [class_id, x1, y1, x2, y2] in normalized coordinates
+        """
+        labels = np.zeros(len(boxes), dtype=label_dtype)
+        if len(boxes) > 0:
+            b = np.asarray(boxes, dtype=np.float64)
+            labels["frame"] = frame
+            labels["class_id"] = b[:, 0]
+            labels["cx"] = (b[:, 1] + b[:, 3]) / 2
+            labels["cy"] = (b[:, 2] + b[:, 4]) / 2
+            labels["w"] = b[:, 3] - b[:, 1]
+            labels["h"] = b[:, 4] - b[:, 2]
+        record = np.zeros(1, dtype=frame_dtype)
+        with self.lock:
+            record[0] = (frame, source_frame, self.offset, len(boxes), width, height)
+            # the boxes are written before the frame record that points to them
+            self.labels_file.write(labels.tobytes())
+            self.labels_file.flush()
+            self.frames_file.write(record.tobytes())
+            self.frames_file.flush()
+            self.offset += len(boxes)
+
+    def close(self):
+        self.frames_file.close()
+        self.labels_file.close()
+
+
+def memmap(path, dtype):
+    # numpy can not memory map empty files
+    count = os.path.getsize(path) // dtype.itemsize if os.path.exists(path) else 0
+    if count == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r', shape=(count,))
+
+
+def read_store(save_path):
+    """
+    Memory maps the store of a session, returns the frame records and the label records
+    """
+    frames_path, labels_path = store_paths(save_path)
+    return memmap(frames_path, frame_dtype), memmap(labels_path, label_dtype)
+
+
+def latest_frames(frames):
+    # the index of the last record of every frame, in the order of the frame numbers
+    order = np.argsort(frames["frame"], kind="stable")
+    sorted_frames = frames["frame"][order]
+    last = np.ones(len(order), dtype=bool)
+    last[:-1] = sorted_frames[1:] != sorted_frames[:-1]
+    return order[last]
+
+
+def iterate_frames(save_path):
+    """
+    Yields the frame record and the labels of every saved frame
+    """
+    frames, labels = read_store(save_path)
+    for i in latest_frames(frames):
+        record = frames[i]
+        yield record, labels[record["offset"]:record["offset"] + record["count"]]
+
+
+def read_classes(save_path):
+    path = os.path.join(save_path, "annotations", "classes.txt")
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return [line.strip() for line in f if len(line.strip()) > 0]
+
+
+def export_yolo(save_path, output_path):
+    """
+    Writes the store as one yolo .txt file per frame into output_path
+    """
+    os.makedirs(output_path, exist_ok=True)
+    count = 0
+    for record, labels in iterate_frames(save_path):
+        lines = ["%d %0.6f %0.6f %0.6f %0.6f" % (l["class_id"], l["cx"], l["cy"], l["w"], l["h"]) for l in labels]
+        with open(os.path.join(output_path, str(record["frame"]) + ".txt"), 'w') as f:
+            f.write("\n".join(lines))
+        count += 1
+    return count
+
+
+def export_coco(save_path, output_path, image_format="jpg"):
+    """
+    Streams the store into a COCO json file, the boxes are converted to pixels with the size of every image
+    """
+    classes = read_classes(save_path)
+    count = 0
+    with open(output_path, 'w') as f:
+        f.write('{"images": [')
+        for record, _ in iterate_frames(save_path):
+            image = {"id": int(record["frame"]), "file_name": str(record["frame"]) + "." + image_format,
+                     "width": int(record["width"]), "height": int(record["height"])}
+            if record["source_frame"] >= 0:
+                image["source_frame"] = int(record["source_frame"])
+            f.write((", " if count > 0 else "") + json.dumps(image))
+            count += 1
+        f.write('],\n"annotations": [')
+        ann_id = 0
+        class_ids = set()
+        for record, labels in iterate_frames(save_path):
+            W, H = int(record["width"]), int(record["height"])
+            for l in labels:
+                bw, bh = float(l["w"]) * W, float(l["h"]) * H
+                x, y = float(l["cx"]) * W - bw / 2, float(l["cy"]) * H - bh / 2
+                annotation = {"id": ann_id, "image_id": int(record["frame"]), "category_id": int(l["class_id"]),
+                              "bbox": [round(x, 2), round(y, 2), round(bw, 2), round(bh, 2)],
+                              "area": round(bw * bh, 2), "iscrowd": 0}
+                f.write((", " if ann_id > 0 else "") + json.dumps(annotation))
+                class_ids.add(int(l["class_id"]))
+                ann_id += 1
+        if classes is None:
+            classes = [str(i) for i in range(max(class_ids) + 1)] if len(class_ids) > 0 else []
+        categories = [{"id": i, "name": name} for i, name in enumerate(classes)]
+        f.write('],\n"categories": ' + json.dumps(categories) + '}\n')
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exports the annotation store of a session")
+    parser.add_argument("-s", "--save_path", required=True, help="The path of the saved images and annotations")
+    parser.add_argument("-f", "--format", default="yolo", choices=["yolo", "coco"], help="the export format")
+    parser.add_argument("--output", default=None,
+                        help="output folder for yolo or json file for coco, by default inside the save path")
+    parser.add_argument("--image_format", default="jpg", help="extension of the saved images used in coco")
+    args = parser.parse_args()
+    if args.format == "yolo":
+        output = args.output or os.path.join(args.save_path, "labels")
+        count = export_yolo(args.save_path, output)
+    else:
+        output = args.output or os.path.join(args.save_path, "annotations.json")
+        count = export_coco(args.save_path, output, args.image_format)
+    print("exported", count, "frames to", output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+import cv2
+import numpy as np
+import os
+import threading
+import time
+from annotation_store import AnnotationStore
+from concurrent.futures import ThreadPoolExecutor
+from profiler import null_profiler
+from video_dataset import write_video_reference
+
+image_formats = ["jpg", "png", "webp", "npy", "video"]
+annotation_formats = ["txt", "store"]
+
+
+def add_writer_arguments(parser):
+    # command line arguments shared by the scripts that save annotations
+    parser.add_argument("--image_format", default="jpg", choices=image_formats, required=False,
+                        help="format of the saved images, npy saves the raw frame, video saves no images and "
+                             "keeps the video frame of every annotation so video_dataset.py decodes them again")
+    parser.add_argument("--annotation_format", default="txt", choices=annotation_formats, required=False,
+                        help="txt saves one yolo file per frame, store appends all the boxes to one indexed file "
+                             "that annotation_store.py exports to yolo or coco")
+    parser.add_argument("--image_quality", type=int, default=95, required=False,
+                        help="quality of the jpg and webp images from 0 to 100")
+    parser.add_argument("--png_compression", type=int, default=3, required=False,
+                        help="compression level of the png images from 0 to 9")
+    parser.add_argument("--writer_threads", type=int, default=2, required=False,
+                        help="number of threads that encode and write the images and annotations")
+    parser.add_argument("--writer_backlog", type=int, default=32, required=False,
+                        help="maximum number of frames waiting to be written")
+    parser.add_argument("--drop_writes", action="store_true", required=False,
+                        help="drop frames when the backlog is full instead of waiting for the writer")
+
+
+def writer_from_args(save_path, args, profiler=None):
+    return AnnotationWriter(save_path, image_format=args.image_format, quality=args.image_quality,
+                            png_compression=args.png_compression, workers=args.writer_threads,
+                            backlog=args.writer_backlog, drop=args.drop_writes,
+                            annotation_format=args.annotation_format, video_path=getattr(args, "input_video", None),
+                            profiler=profiler)
+
+
+def to_yolo(class_id, box):
+    # the yolo format requires the annotations in Class_id, Center-X, center-Y, Width, Height format in the ratios of W and H
+    x1, y1, x2, y2 = box
+    return str(class_id) + " %0.6f %0.6f %0.6f %0.6f" % ((x1 + x2) / 2, (y1 + y2) / 2, x2 - x1, y2 - y1)
+
+
+class AnnotationWriter:
+    """
+    Encodes and writes the images and yolo annotations on a thread pool so the tracking loop is not blocked
+    At most backlog frames are waiting to be written, when the backlog is full submit either waits or drops the frame
+    With images_only the annotations are left to another writer of the same folder, which saves them with
+    write_annotation
+    """
+
+    def __init__(self, save_path, image_format="jpg", quality=95, png_compression=3, workers=2, backlog=32,
+                 drop=False, annotation_format="txt", video_path=None, profiler=None, images_only=False):
+        # the options are kept to make writers of the same folder in other processes
+        self.options = dict(image_format=image_format, quality=quality, png_compression=png_compression,
+                            workers=workers, backlog=backlog, drop=drop, annotation_format=annotation_format,
+                            video_path=video_path)
+        if image_format not in image_formats:
+            raise AssertionError("The image format should be one of " + ", ".join(image_formats))
+        if annotation_format not in annotation_formats:
+            raise AssertionError("The annotation format should be one of " + ", ".join(annotation_formats))
+        if image_format == "video":
+            if video_path is None:
+                raise AssertionError("The video format needs the path of the video")
+            # only the store keeps the video frame of every annotation
+            annotation_format = "store"
+            if not images_only:
+                write_video_reference(save_path, video_path)
+        self.save_path = save_path
+        self.image_format = image_format
+        if image_format == "jpg":
+            self.params = [cv2.IMWRITE_JPEG_QUALITY, quality]
+        elif image_format == "webp":
+            self.params = [cv2.IMWRITE_WEBP_QUALITY, quality]
+        elif image_format == "png":
+            self.params = [cv2.IMWRITE_PNG_COMPRESSION, png_compression]
+        else:
+            self.params = []
+        self.drop = drop
+        self.profiler = profiler or null_profiler
+        self.images_only = images_only
+        self.store = AnnotationStore(save_path) if annotation_format == "store" and not images_only else None
+        self.executor = ThreadPoolExecutor(max_workers=max(1, workers))
+        self.slots = threading.Semaphore(max(1, backlog))
+        # counters of the writes
+        self.lock = threading.Condition()
+        self.queued = 0
+        self.pending = 0
+        self.written = 0
+        self.annotations = 0
+        self.dropped = 0
+        self.errors = 0
+        # the numbers of the queued frames that are not written yet
+        self.outstanding = set()
+
+    def image_path(self, save_counter):
+        return os.path.join(self.save_path, "images", str(save_counter) + "." + self.image_format)
+
+    def annotation_path(self, save_counter):
+        return os.path.join(self.save_path, "annotations", str(save_counter) + ".txt")
+
+    def submit(self, save_counter, frame, boxes, source_frame=-1, keep_image=False):
+        """
+        Queues the frame and its boxes to be saved as save_counter
+        boxes: list of [class_id, x1, y1, x2, y2] in normalized coordinates
+        source_frame: the index of the frame in the video, kept in the annotation store
+        keep_image: the image of save_counter was saved before and only the annotation is written again
+        Returns False when the frame was dropped
+        """
+        start = time.perf_counter()
+        acquired = self.slots.acquire(blocking=not self.drop)
+        # the time the tracking loop waited for a free slot in the backlog
+        self.profiler.add("wait_writer", start, time.perf_counter())
+        if not acquired:
+            with self.lock:
+                self.dropped += 1
+            return False
+        with self.lock:
+            self.queued += 1
+            self.pending += 1
+            number = self.queued
+            self.outstanding.add(number)
+        self.executor.submit(self.write, save_counter, frame, boxes, source_frame, number, keep_image)
+        return True
+
+    def write(self, save_counter, frame, boxes, source_frame=-1, number=None, keep_image=False):
+        try:
+            if not keep_image:
+                with self.profiler.stage("encode"):
+                    if self.image_format == "npy":
+                        np.save(self.image_path(save_counter), frame)
+                    elif self.image_format != "video":
+                        cv2.imwrite(self.image_path(save_counter), frame, self.params)
+            if not self.images_only:
+                # the boxes are indexed after the image exists so every record points to a saved image
+                self.write_annotation(save_counter, boxes, source_frame, frame.shape[1], frame.shape[0])
+            written = True
+        except Exception as e:
+            print("could not save", save_counter, ":", e)
+            written = False
+        self.slots.release()
+        with self.lock:
+            self.pending -= 1
+            self.outstanding.discard(number)
+            if written:
+                self.written += 1
+            else:
+                self.errors += 1
+            self.lock.notify_all()
+
+    def write_annotation(self, save_counter, boxes, source_frame=-1, width=0, height=0):
+        """
+        Writes the yolo annotation of a frame, or appends it to the store
+        """
+        with self.profiler.stage("annotation"):
+            if self.store is not None:
+                self.store.append(save_counter, boxes, source_frame, width, height)
+            else:
+                with open(self.annotation_path(save_counter), 'w') as f:
+                    f.write("\n".join(to_yolo(box[0], box[1:]) for box in boxes))
+        with self.lock:
+            self.annotations += 1
+
+    def flush(self):
+        # wait until all the queued frames are written
+        with self.lock:
+            while self.pending > 0:
+                self.lock.wait()
+
+    def wait_queued(self, queued):
+        # wait until the first queued frames are written, the frames queued after them are not waited for
+        with self.lock:
+            while len(self.outstanding) > 0 and min(self.outstanding) <= queued:
+                self.lock.wait()
+
+    def close(self):
+        self.flush()
+        self.executor.shutdown(wait=True)
+        if self.store is not None:
+            self.store.close()
+
+    def counts(self):
+        return dict(queued=self.queued, written=self.written, dropped=self.dropped, errors=self.errors)
+
+    def merge(self, counts):
+        # adds the counters of a writer of the same folder in another process
+        with self.lock:
+            for name, value in counts.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def report(self):
+        print("writer: %d queued, %d written, %d annotations, %d dropped, %d failed" %
+              (self.queued, self.written, self.annotations, self.dropped, self.errors))
@@ -0,0 +1,148 @@
+import cv2
+import numpy as np
+import time
+
+background_methods = ["mog2", "knn"]
+
+
+def add_auto_seed_arguments(parser):
+    # command line arguments of the automatic seeding of static camera videos
+    parser.add_argument("--auto_seed", default=None, choices=background_methods, required=False,
+                        help="find the moving objects with a background subtractor and track them without a window "
+                             "or a seed file, for videos of a fixed camera")
+    parser.add_argument("--auto_seed_width", type=int, default=320, required=False,
+                        help="width of the frames the background subtractor runs on")
+    parser.add_argument("--warmup_frames", type=int, default=30, required=False,
+                        help="number of frames the background is learned on before the first boxes are proposed")
+    parser.add_argument("--min_object_area", type=float, default=0.002, required=False,
+                        help="smallest moving region that is proposed as an object, as a fraction of the frame")
+    parser.add_argument("--reseed_patience", type=int, default=15, required=False,
+                        help="number of frames a tracked box may cover no moving pixels before it is seeded again")
+
+
+def auto_seeder_from_args(args, max_objects=1):
+    return AutoSeeder(args.auto_seed, width=args.auto_seed_width, warmup=args.warmup_frames,
+                      min_area=args.min_object_area, patience=args.reseed_patience, max_objects=max_objects)
+
+
+class AutoSeeder:
+    """
+    Proposes the boxes of the moving objects of a fixed camera video from a background subtractor and the
+    connected components of its foreground mask, on frames downscaled to width
+    reseed(item, boxes) is called by track_frames on every frame, it starts the trackers with the proposed boxes
+    when nothing is tracked and starts them again when a tracked box degenerates, which is when it gets too
+    small, leaves the frame, or covers no moving pixels for patience frames while other regions move
+    """
+
+    def __init__(self, method="mog2", width=320, warmup=30, min_area=0.002, max_area=0.5, patience=15,
+                 min_coverage=0.05, max_objects=1, class_id=0):
+        if method not in background_methods:
+            raise AssertionError("The background subtractor should be one of " + ", ".join(background_methods))
+        if method == "mog2":
+            self.subtractor = cv2.createBackgroundSubtractorMOG2(history=500, varThreshold=16, detectShadows=True)
+        else:
+            self.subtractor = cv2.createBackgroundSubtractorKNN(history=500, dist2Threshold=400, detectShadows=True)
+        self.width = width
+        self.warmup = warmup
+        self.min_area = min_area
+        self.max_area = max_area
+        self.patience = patience
+        self.min_coverage = min_coverage
+        self.max_objects = max_objects
+        self.class_id = class_id
+        self.kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (5, 5))
+        self.mask = None
+        self.lost = 0
+        self.frames = 0
+        self.seeds = 0
+        self.reseeds = {"degenerate": 0, "lost": 0}
+        self.seconds = 0.0
+
+    def apply(self, image):
+        # the foreground mask of the frame at the reduced resolution, the shadows are not foreground
+        h, w = image.shape[:2]
+        if w > self.width:
+            image = cv2.resize(image, (self.width, max(1, round(h * self.width / w))), interpolation=cv2.INTER_AREA)
+        mask = self.subtractor.apply(image)
+        mask = cv2.threshold(mask, 200, 255, cv2.THRESH_BINARY)[1]
+        # remove the noise and join the parts of an object
+        mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, self.kernel)
+        self.mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, self.kernel, iterations=2)
+        return self.mask
+
+    def propose(self):
+        """
+        Returns the boxes of the largest moving regions as [x1, y1, x2, y2] in normalized coordinates
+        """
+        h, w = self.mask.shape
+        count, _, stats, _ = cv2.connectedComponentsWithStats(self.mask, connectivity=8)
+        boxes = []
+        # the first component is the background
+        for x, y, bw, bh, area in stats[1:]:
+            if self.min_area * w * h <= area <= self.max_area * w * h:
+                boxes.append((area, [x / w, y / h, (x + bw) / w, (y + bh) / h]))
+        boxes.sort(key=lambda b: -b[0])
+        return [box for _, box in boxes[:self.max_objects]]
+
+    def coverage(self, box):
+        # the fraction of the pixels of the box that are moving
+        h, w = self.mask.shape
+        x1, y1 = max(int(box[0] * w), 0), max(int(box[1] * h), 0)
+        x2, y2 = min(int(np.ceil(box[2] * w)), w), min(int(np.ceil(box[3] * h)), h)
+        if x2 <= x1 or y2 <= y1:
+            return 0.0
+        return float(np.count_nonzero(self.mask[y1:y2, x1:x2])) / ((x2 - x1) * (y2 - y1))
+
+    def degenerate(self, box):
+        # the box collapsed, grew over most of the frame or is mostly outside of it
+        x1, y1, x2, y2 = box
+        area = max(x2 - x1, 0) * max(y2 - y1, 0)
+        inside = max(min(x2, 1) - max(x1, 0), 0) * max(min(y2, 1) - max(y1, 0), 0)
+        return area < self.min_area / 4 or area > self.max_area or inside < area / 2
+
+    def reseed(self, item, boxes):
+        """
+        boxes: the tracked [class_id, x1, y1, x2, y2] boxes of the frame
+        Returns the boxes to start the trackers with, or None to keep tracking
+        """
+        start = time.perf_counter()
+        self.apply(item.track)
+        self.frames += 1
+        seed = None
+        if self.frames > self.warmup:
+            seed = self.check(boxes)
+        self.seconds += time.perf_counter() - start
+        return seed
+
+    def check(self, boxes):
+        if len(boxes) == 0:
+            proposals = self.propose()
+            if len(proposals) == 0:
+                return None
+            self.seeds += 1
+            self.lost = 0
+            return [[self.class_id] + p for p in proposals]
+        if any(self.degenerate(b[1:]) for b in boxes):
+            # a broken box is not tracked any more even when there is nothing to replace it with
+            self.reseeds["degenerate"] += 1
+            self.lost = 0
+            return [[self.class_id] + p for p in self.propose()]
+        if all(self.coverage(b[1:]) < self.min_coverage for b in boxes):
+            self.lost += 1
+        else:
+            self.lost = 0
+        if self.lost < self.patience:
+            return None
+        # an object that stopped moving fades into the background, so its tracker is only replaced when
+        # something else moves
+        proposals = self.propose()
+        if len(proposals) == 0:
+            return None
+        self.reseeds["lost"] += 1
+        self.lost = 0
+        return [[self.class_id] + p for p in proposals]
+
+    def report(self):
+        print("auto seed: %d frames, %d seeds, %d degenerate and %d lost boxes seeded again, %0.2f ms per frame" %
+              (self.frames, self.seeds, self.reseeds["degenerate"], self.reseeds["lost"],
+               1000 * self.seconds / max(self.frames, 1)))
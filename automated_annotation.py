@@ -1,7 +1,16 @@
 import cv2
-import dlib
 import argparse
 import os
+import time
+from auto_seed import add_auto_seed_arguments, auto_seeder_from_args
+from adaptive_sampler import add_sampler_arguments, sampler_from_args
+from annotation_writer import add_writer_arguments, writer_from_args
+from frame_source import FrameSource, get_resize_ratio, get_stride, positive_int, scale_box
+from headless import run_headless
+from profiler import add_profiler_arguments, profiler_from_args, save_profile
+from seed_file import load_seeds
+from segment_parallel import run_segments
+from tracker_backends import add_tracker_arguments, create_trackers
 
 # command line arguments
 parser = argparse.ArgumentParser()
@@ -11,22 +20,65 @@ parser.add_argument("-n", "--save_every", type=int, default=1,
                     help="Only every n-th frame is saved as an annotation", required=False)
 parser.add_argument("-o", "--start_number", type=int, default=0,
                     help="Starting number of the annotations naming sequence", required=False)
+parser.add_argument("--seed_file", default=None, required=False,
+                    help="json or yolo file with the initial box, runs the tracking without a window")
+parser.add_argument("--segment_workers", default=0, type=int, required=False,
+                    help="with a seed file, cut the video into this many segments and track them on this many "
+                         "processes, 0 tracks the whole video in this process")
+parser.add_argument("--segment_overlap", default=30, type=int, required=False,
+                    help="number of frames a segment is tracked before its cut to compare its boxes with the "
+                         "previous segment")
+parser.add_argument("--queue_depth", type=positive_int, default=8, required=False,
+                    help="number of decoded frames that are prefetched by the decode thread")
+parser.add_argument("--skip_frames", default=1, type=positive_int, required=False,
+                    help="only every skip_frames-th frame is decoded and tracked")
+parser.add_argument("--sample_fps", default=None, type=float, required=False,
+                    help="number of frames to track per second of video, overrides skip_frames")
+parser.add_argument("--seek_threshold", default=50, type=int, required=False,
+                    help="seek instead of grabbing when more than this many frames are skipped, 0 never seeks")
+parser.add_argument("--track_width", default=None, type=positive_int, required=False,
+                    help="width of the frames the tracker runs on, by default the width of the window")
+parser.add_argument("--track_gray", action="store_true", required=False,
+                    help="track on grayscale frames")
+parser.add_argument("--output_width", default=None, type=positive_int, required=False,
+                    help="width of the saved images, by default the original width of the video")
+add_tracker_arguments(parser)
+add_auto_seed_arguments(parser)
+add_sampler_arguments(parser)
+add_writer_arguments(parser)
+add_profiler_arguments(parser)
 args = parser.parse_args()
 
 # store command line arguments to global variables
 frame = None
+item = None
 dragging = False
 temp_start_point = []
 tracking = False
 
-# initialize the dlib tracker as a global variable
-dlib_tracker = dlib.correlation_tracker()
+# the tracker backend is a global variable, it is created in main
+trackers = None
 
 # parse and save the command line arguments
 save_counter = args.start_number
 save_every = args.save_every
 input_vid = args.input_video
 save_path = args.save_path
+seed_file = args.seed_file
+queue_depth = args.queue_depth
+seek_threshold = args.seek_threshold
+track_width = args.track_width
+track_gray = args.track_gray
+output_width = args.output_width
+skip_frames = args.skip_frames
+# time based sampling is converted to a frame stride
+if args.sample_fps is not None:
+    fps_cap = cv2.VideoCapture(input_vid)
+    skip_frames = get_stride(fps_cap, skip_frames, args.sample_fps)
+    fps_cap.release()
+# the background model of the automatic seeding is learned from every tracked frame in order
+if args.auto_seed is not None and args.segment_workers > 1:
+    raise AssertionError("The automatic seeding cannot track the video in segments")
 
 # check if the path already exists
 if os.path.exists(save_path):
@@ -41,10 +93,17 @@ os.mkdir(save_path)
 os.mkdir(os.path.join(save_path, "images"))
 os.mkdir(os.path.join(save_path, "annotations"))
 
+# the images and annotations are encoded and written on a thread pool
+# the stages of the pipeline are timed when --profile is set
+profiler = profiler_from_args(args)
+writer = writer_from_args(save_path, args, profiler)
+# the saved frames are every n-th frame or the frames where the box moved or the image changed
+sampler = sampler_from_args(args)
+
 
 # the call back function of cv2 window
 def draw_annotation(event, x, y, flags, params):
-    global dragging, temp_start_point, frame, tracking, dlib_tracker, save_counter
+    global dragging, temp_start_point, frame, tracking, trackers, save_counter
     # this temporary frame is used for drawing rectangles so that the main frame is not effected
     temp_frame = frame.copy()
     # the dragging feature is enabled and the top xy coords of the image are added to a local variables
@@ -62,31 +121,21 @@ def draw_annotation(event, x, y, flags, params):
         temp_start_point = []
         # enable tracking
         tracking = True
-        # dlib requires the image format in rgb so cvt the BGR frame to RGB
-        tracker_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        # define an rectangle in the format x_left, y_top, x_right, y_bottom
-        rect = dlib.rectangle(*points)
+        # define an rectangle in the format x_left, y_top, x_right, y_bottom in the tracking resolution
+        h, w, _ = frame.shape
+        th, tw = item.track.shape[:2]
+        rect = scale_box(points, tw / w, th / h)
         # initialize the tracker to start tracking
-        dlib_tracker.start_track(tracker_rgb, rect)
-        # check if it is the n-th frame defined by user
-        if save_counter % save_every == 0:
-            # save the image to the save path
-            cv2.imwrite(save_path + "/images/" + str(save_counter) + ".jpg", frame)
-            # the yolo format requires the annotations in Class_id, Center-X, center-Y, Width, Height format in the ratios of W and H
-            h, w, _ = frame.shape
-            with open(save_path + "/annotations/" + str(save_counter) + ".txt", 'w') as f:
-                x1, y1, x2, y2 = points
-                aw = x2 - x1
-                ah = y2 - y1
-                cx = (x1 + x2) / 2
-                cy = (y1 + y2) / 2
-                ax = cx / w
-                ay = cy / h
-                aw /= w
-                ah /= h
-                f.write("0 " + " %0.6f %0.6f %0.6f %0.6f" % (ax, ay, aw, ah))
-        # increment counter by one
-        save_counter += 1
+        trackers.start(item.track, [rect])
+        # the new box starts the sampling again
+        sampler.reset()
+        boxes = [[0] + scale_box(points, 1 / w, 1 / h)]
+        # check if the sampler saves the frame
+        if sampler.should_save(save_counter, item.index, boxes, item.track):
+            # save the image and the annotation in the ratios of W and H
+            writer.submit(save_counter, item.image, boxes, item.index)
+        # the name of the next frame is skip_frames video frames later, like in the headless mode
+        save_counter += skip_frames
     else:
         # here we continuously update the frame with the bounding box
         if dragging:
@@ -95,52 +144,101 @@ def draw_annotation(event, x, y, flags, params):
                 cv2.imshow("Automated Labelling", temp_frame)
 
 
+# runs the tracker through the whole video without a window using the boxes of the seed file
+# or the boxes of the moving object found by the automatic seeding
+def headless_main():
+    global save_counter
+    cap = cv2.VideoCapture(input_vid)
+    frame_size = (cap.get(cv2.CAP_PROP_FRAME_WIDTH), cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    cap.release()
+    seeds = load_seeds(seed_file, None, frame_size=frame_size) if seed_file is not None else {}
+    # there is only one object of the class in the video
+    seeds = {k: v[:1] for k, v in seeds.items()}
+    if args.auto_seed is not None:
+        # the largest moving region is tracked and seeded again when its box degenerates
+        seeder = auto_seeder_from_args(args, max_objects=1)
+        save_counter = run_headless(input_vid, writer, seeds, save_counter, save_every,
+                                    track_width=track_width or 600, resize_above=0 if track_width else 1000,
+                                    skip_frames=skip_frames, queue_depth=queue_depth, seek_threshold=seek_threshold,
+                                    track_gray=track_gray, output_width=output_width, tracker=args.tracker,
+                                    tracker_workers=args.tracker_workers, profiler=profiler, sampler=sampler,
+                                    reseed=seeder.reseed)
+        seeder.report()
+        return
+    if args.segment_workers > 1:
+        # the overlapping segments of the video are tracked in parallel processes
+        save_counter = run_segments(input_vid, writer, seeds, save_counter, save_every, args.segment_workers,
+                                    skip_frames=skip_frames, track_width=track_width or 600,
+                                    resize_above=0 if track_width else 1000, queue_depth=queue_depth,
+                                    seek_threshold=seek_threshold, track_gray=track_gray, output_width=output_width,
+                                    tracker=args.tracker, sampler=sampler, overlap=args.segment_overlap)
+        return
+    save_counter = run_headless(input_vid, writer, seeds, save_counter, save_every,
+                                track_width=track_width or 600, resize_above=0 if track_width else 1000,
+                                skip_frames=skip_frames, queue_depth=queue_depth, seek_threshold=seek_threshold,
+                                track_gray=track_gray, output_width=output_width, tracker=args.tracker,
+                                tracker_workers=args.tracker_workers, profiler=profiler, sampler=sampler)
+
+
 # the main function
 def main():
+    if seed_file is not None or args.auto_seed is not None:
+        headless_main()
+        writer.close()
+        writer.report()
+        save_profile(profiler, args)
+        return
     # create a window which will display the UI
     cv2.namedWindow("Automated Labelling")
     # add the callback function
     cv2.setMouseCallback("Automated Labelling", draw_annotation)
     # define the global variables
-    global frame, tracking, dlib_tracker, save_counter, input_vid, save_every, save_path
+    global frame, item, tracking, trackers, save_counter, input_vid, save_every, save_path
+    # initialize the tracker backend
+    trackers = create_trackers(args.tracker, args.tracker_workers)
     # initialize video capture
     cap = cv2.VideoCapture(input_vid)
-    # read the first frame
-    ret, frame = cap.read()
     # resize ratio is used so that the frame doesn't get too big
-    resize_ratio = 1.0
-    H, W, _ = frame.shape
-    if W > 1000:
-        # define resize ratio so that the width is frame_width
-        resize_ratio = 600 / W
+    resize_ratio = get_resize_ratio(cap, 600, resize_above=1000)
+    # the tracking and saved frames have their own resolutions
+    track_ratio = get_resize_ratio(cap, track_width) if track_width else None
+    output_ratio = get_resize_ratio(cap, output_width)
+    # the frames are decoded, resized and converted to rgb on a separate thread
+    source = FrameSource(cap, resize_ratio, skip_frames=skip_frames, queue_depth=queue_depth,
+                         seek_threshold=seek_threshold, track_ratio=track_ratio, track_gray=track_gray,
+                         output_ratio=output_ratio, profiler=profiler)
+    # read the first frame
+    item = source.read()
     timer = 0
     paused = True
     # start the main loop
-    while ret:
-        # resize the frame so that the width = frame_width px
-        frame = cv2.resize(frame, None, fx=resize_ratio, fy=resize_ratio)
+    while item is not None:
+        frame = item.display
         h, w, _ = frame.shape
+        th, tw = item.track.shape[:2]
         # this is used for drawing the rectangle so the original frame is not effected
         temp_frame = frame.copy()
         assigned = False
         # we have an option to pause the stream to redefine the annotation
         if not paused and tracking:
             # track the object initialized in the call back function
-            tracker_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            # update the frame in dlib tracker
-            dlib_tracker.update(tracker_rgb)
-            # get the position of the tracking object in the updated frame
-            pos = dlib_tracker.get_position()
-            x1 = int(pos.left())
-            y1 = int(pos.top())
-            x2 = int(pos.right())
-            y2 = int(pos.bottom())
+            with profiler.stage("track", 1):
+                pos = trackers.update(item.track)[0]
+            # get the position of the tracking object in the updated frame in the ratios of W and H
+            box = scale_box(pos, 1 / tw, 1 / th)
+            x1, y1, x2, y2 = [int(v) for v in scale_box(box, w, h)]
             # draw the bounding box on the frame
             cv2.rectangle(temp_frame, (x1, y1), (x2, y2), (0, 255, 0))
             assigned = True
+        # show the frame rate and the time of every stage
+        profiler.draw_hud(temp_frame)
+        display_start = time.perf_counter()
         # update the frame with the new tracked object frame
         cv2.imshow("Automated Labelling", temp_frame)
         key_press = cv2.waitKey(timer) & 0xFF
+        # the time waiting for a key while paused is not part of the pipeline
+        if not paused:
+            profiler.add("display", display_start, time.perf_counter())
         if key_press == ord('q'):
             break
         # pause the next frame or play from the next frame
@@ -149,7 +247,7 @@ def main():
                 timer = 0
                 paused = True
                 print("paused at: ", save_counter)
-                dlib_tracker = dlib.correlation_tracker()
+                trackers.start(item.track, [])
                 cv2.imshow("Automated Labelling", frame)
                 assigned = False
                 tracking = False
@@ -160,23 +258,23 @@ def main():
         if not paused and tracking:
             # check if the object is in fact tracked
             if assigned:
-                # check if the counter satisfies the skip condition
-                if save_counter % save_every == 0:
-                    cv2.imwrite(save_path + "/images/" + str(save_counter) + ".jpg", frame)
-                    with open(save_path + "/annotations/" + str(save_counter) + ".txt", 'w') as f:
-                        aw = x2 - x1
-                        ah = y2 - y1
-                        cx = (x1 + x2) / 2
-                        cy = (y1 + y2) / 2
-                        ax = cx / w
-                        ay = cy / h
-                        aw /= w
-                        ah /= h
-                        f.write("0 " + " %0.6f %0.6f %0.6f %0.6f" % (ax, ay, aw, ah))
-                # increment the save counter
-                save_counter += 1
+                # check if the sampler saves the frame
+                if sampler.should_save(save_counter, item.index, [[0] + box], item.track):
+                    writer.submit(save_counter, item.image, [[0] + box], item.index)
+                # the save counter follows the video frames, so -n saves every n-th video frame
+                save_counter += skip_frames
+        if not paused:
+            profiler.frame()
         # read the next frame
-        ret, frame = cap.read()
+        item = source.read()
+    source.stop()
+    source.report()
+    sampler.report()
+    trackers.close()
+    # wait for the pending images and annotations to be written
+    writer.close()
+    writer.report()
+    save_profile(profiler, args)
 
 
 if __name__ == "__main__":
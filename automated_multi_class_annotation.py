@@ -1,10 +1,22 @@
 import cv2
-import dlib
 import argparse
 import os
 import sys
-import numpy as np
+import time
 from dialogue_box import *
+from adaptive_sampler import add_sampler_arguments, sampler_from_args
+from annotation_writer import add_writer_arguments, writer_from_args
+from checkpoint import Checkpointer, add_checkpoint_arguments, read_checkpoint
+from class_picker import ClassPicker
+from frame_history import NullHistory, add_history_arguments, history_from_args
+from frame_source import FrameSource, get_resize_ratio, get_stride, positive_int, scale_box
+from headless import run_headless
+from keyframe_interpolation import KeyframeAnnotator
+from overlay import BoxOverlay
+from profiler import add_profiler_arguments, profiler_from_args, save_profile
+from tracker_backends import add_tracker_arguments, create_trackers
+from seed_file import load_seeds
+from segment_parallel import run_segments
 
 # command line arguments
 parser = argparse.ArgumentParser()
@@ -15,13 +27,50 @@ parser.add_argument("-n", "--save_every", type=int, default=10,
 parser.add_argument("-o", "--start_number", type=int, default=0,
                     help="Starting number of the annotations naming sequence", required=False)
 parser.add_argument("-c", "--classes", required=True, default="object", help="the class names separataed by ','")
-parser.add_argument("-w", "--width", type=int, required=False, default=800, help="the width of the window")
+parser.add_argument("-w", "--width", type=positive_int, required=False, default=800, help="the width of the window")
 parser.add_argument("--small_object", type=float, default=0.1,
                     help="threshold for small object, the lower the value, the smaller the object")
 parser.add_argument("--frame_delay", type=int, default=1,
                     help="delay between two consecutive frames in ms")
+parser.add_argument("--class_picker", default="window", choices=["window", "tk"], required=False,
+                    help="pick the class of a new box from a menu in the window with the number keys, or from a "
+                         "tk dialog")
 parser.add_argument("--start_frame", default=0, type=int, required=False, help="starting frame in the video")
-parser.add_argument("--skip_frames", default=1, type=int, required=False, help="number of frames to skip")
+parser.add_argument("--skip_frames", default=1, type=positive_int, required=False, help="number of frames to skip")
+parser.add_argument("--sample_fps", default=None, type=float, required=False,
+                    help="number of frames to track per second of video, overrides skip_frames")
+parser.add_argument("--seek_threshold", default=50, type=int, required=False,
+                    help="seek instead of grabbing when more than this many frames are skipped, 0 never seeks")
+parser.add_argument("--seed_file", default=None, required=False,
+                    help="json or yolo file with the initial boxes, runs the tracking without a window")
+parser.add_argument("--segment_workers", default=0, type=int, required=False,
+                    help="with a seed file, cut the video into this many segments and track them on this many "
+                         "processes, 0 tracks the whole video in this process")
+parser.add_argument("--segment_overlap", default=30, type=int, required=False,
+                    help="number of frames a segment is tracked before its cut to compare its boxes with the "
+                         "previous segment")
+parser.add_argument("--queue_depth", type=positive_int, default=8, required=False,
+                    help="number of decoded frames that are prefetched by the decode thread")
+parser.add_argument("--track_width", default=None, type=positive_int, required=False,
+                    help="width of the frames the trackers run on, by default the width of the window")
+parser.add_argument("--track_gray", action="store_true", required=False,
+                    help="track on grayscale frames")
+parser.add_argument("--output_width", default=None, type=positive_int, required=False,
+                    help="width of the saved images, by default the original width of the video")
+add_tracker_arguments(parser)
+parser.add_argument("--keyframe_every", default=0, type=int, required=False,
+                    help="pause every n frames to correct the boxes and interpolate the boxes in between "
+                         "instead of tracking them, 0 tracks every frame")
+parser.add_argument("--interpolation", default="linear", choices=["linear", "spline"], required=False,
+                    help="interpolation of the boxes between keyframes")
+parser.add_argument("--verify_iou", default=0.0, type=float, required=False,
+                    help="run the tracker over the interpolated frames and use its box where the IoU with the "
+                         "interpolated box is lower than this, 0 does not run the tracker")
+add_sampler_arguments(parser)
+add_history_arguments(parser)
+add_checkpoint_arguments(parser)
+add_writer_arguments(parser)
+add_profiler_arguments(parser)
 args = parser.parse_args()
 
 print("Note: Please try to set the number of object trackers as per your system configuration")
@@ -36,13 +85,22 @@ window_name = "Automated Labelling"
 # current rectangles
 all_bounding_boxes = {}
 all_current_position = {}
-# create a dictionary to store the dlib trackers with keys as class names and a list that containes dlib tracker objects
-idx_trackers = {}
+# the class name and the index in all_bounding_boxes of every tracked box, in the order of the trackers
+idx_trackers = []
+# the dlib trackers of all the boxes, updated together with one call per frame
+trackers = None
 
 # save colors as a dictionary to use later in algorithms
 color = {"track": (0, 255, 0),
          "text": (0, 0, 0),
-         "line": (150, 255, 180)}
+         "line": (150, 255, 180),
+         "drag": (255, 0, 0)}
+# the boxes drawn over the frame are cached and only redrawn around the cursor on mouse events
+overlay = BoxOverlay(color)
+# the menu that picks the class of a new box, created in main
+picker = None
+# the last position of the mouse, used to draw the window again after a key press
+mouse = [0, 0]
 
 # parse and save the command line arguments
 save_counter = args.start_number
@@ -54,12 +112,30 @@ small_thresh = args.small_object
 time_delay = args.frame_delay
 start_pos = args.start_frame
 skip_frames = args.skip_frames
+seed_file = args.seed_file
+queue_depth = args.queue_depth
+seek_threshold = args.seek_threshold
+track_width = args.track_width
+track_gray = args.track_gray
+output_width = args.output_width
+tracker_workers = args.tracker_workers
+tracker_name = args.tracker
+keyframe_every = args.keyframe_every
+# time based sampling is converted to a frame stride
+if args.sample_fps is not None:
+    fps_cap = cv2.VideoCapture(input_vid)
+    skip_frames = get_stride(fps_cap, skip_frames, args.sample_fps)
+    fps_cap.release()
+    print("sampling every", skip_frames, "frames")
 # warning if save_every%skip_frames != 0 then they may never coincide
-if save_every % skip_frames != 0 or save_counter % skip_frames != 0:
+if (args.sampling == "fixed" and save_every % skip_frames != 0) or save_counter % skip_frames != 0:
     raise AssertionError(
         "\n1. please make sure the skip_frames is a factorial of save_every_frame(n) to avoid errors while saving images\n" +
         "for example: n=10 and skip_frames=2 will work but n=10 and skip_frames=3 will not work very well\n"
         "2. Please make sure the skip_frames is a factorial of start_number(o)\n")
+# the interpolated boxes are only known after the next keyframe, so they cannot be sampled by their motion
+if args.sampling == "adaptive" and keyframe_every > 0:
+    raise AssertionError("The adaptive sampling needs the tracked boxes and does not work with keyframe_every")
 # create the number of classes from command line arguments
 classes = args.classes.split(',')
 classes = [w.strip() for w in classes]
@@ -68,9 +144,25 @@ set_classes(classes)
 if len(classes) == 0:
     raise AssertionError("The classes should not be empty!")
 
+# a resumed session continues in its save path from the frame, the boxes and the name of its checkpoint
+checkpoint = None
+if args.resume:
+    if seed_file is not None:
+        raise AssertionError("Only the sessions of the window can be resumed, a headless run is started again")
+    save_path = save_path.rstrip("/")
+    checkpoint = read_checkpoint(save_path)
+    if checkpoint["classes"] != classes:
+        raise AssertionError("The classes should be the classes of the session: " + ",".join(checkpoint["classes"]))
+    # the names of the resumed frames only go on from the checkpoint with the same stride and save interval
+    for name, value in (("skip_frames", skip_frames), ("save_every", save_every), ("start_number", args.start_number)):
+        if checkpoint[name] != value:
+            raise AssertionError("The " + name + " should be the " + name + " of the session: " + str(checkpoint[name]))
+    start_pos = checkpoint["frame"]
+    save_counter = checkpoint["save_counter"]
+    print("resuming at frame", start_pos, "with the name", save_counter)
 # check if the path already exists
-if os.path.exists(save_path):
-    raise AssertionError("The save path already exists please enter a new path")
+elif os.path.exists(save_path):
+    raise AssertionError("The save path already exists please enter a new path, or continue it with --resume")
     # print("okay fix this in prod")
 else:
     # make sure the path does not include a / at the end
@@ -81,6 +173,13 @@ else:
     os.mkdir(os.path.join(save_path, "images"))
     os.mkdir(os.path.join(save_path, "annotations"))
 
+# the images and annotations are encoded and written on a thread pool
+# the stages of the pipeline are timed when --profile is set
+profiler = profiler_from_args(args)
+writer = writer_from_args(save_path, args, profiler)
+# the saved frames are every n-th frame or the frames where the boxes moved or the image changed
+sampler = sampler_from_args(args)
+
 # this is used to save the yolo format class id
 class_idx = {k: i for i, k in enumerate(classes)}
 
@@ -106,133 +205,232 @@ def get_points_order(pts):
     return res
 
 
+# the class ids and boxes of all_bounding_boxes in the ratios of the window width and height
+def get_normalized_boxes(w, h):
+    return [[class_idx[key]] + scale_box(points, 1 / w, 1 / h) for key, val in all_bounding_boxes.items()
+            for points in val]
+
+
+# the state of the session on a frame that a checkpoint needs to continue from it
+# counter is the name of the frame and next_counter the counter after the frame, which is one more when the frame
+# was tracked, the next frame is named from it
+def session_state(index, counter, next_counter, w, h):
+    return {"frame": index, "save_counter": counter, "next_counter": next_counter, "classes": classes,
+            "video": input_vid, "skip_frames": skip_frames, "save_every": save_every,
+            "start_number": args.start_number, "boxes": dict((key, [scale_box(p, 1 / w, 1 / h) for p in val])
+                                                             for key, val in all_bounding_boxes.items())}
+
+
+# adds a new box with its class, a box without a class is dropped
+def add_box(cls, points):
+    if cls is None:
+        return
+    if cls not in all_bounding_boxes:
+        all_bounding_boxes[cls] = []
+    all_bounding_boxes[cls].append(points)
+    overlay.set_boxes(all_bounding_boxes)
+
+
+# draws the boxes with the highlight of the hovered boxes, the cross lines, the rectangle being dragged and the
+# class menu, the overlay only redraws the regions that changed
+def redraw():
+    x, y = mouse
+    drag_start = tuple(temp_start_point) if dragging and not tracking and len(temp_start_point) > 0 else None
+    with profiler.stage("overlay"):
+        overlay.render(x, y, cross=not tracking, drag_start=drag_start)
+        picker.draw(overlay)
+    cv2.imshow(window_name, overlay.canvas)
+
+
 # the call back function of cv2 window
 def draw_annotation(event, x, y, flags, params):
     global dragging, temp_start_point, frame, tracking, save_counter, classes
-    # this temporary frame is used for drawing rectangles so that the main frame is not effected
-    temp_frame = frame.copy()
-    # draw all the bounding boxes and corresponding class labels
-    for key, val in all_bounding_boxes.items():
-        for v in val:
-            x1, y1, x2, y2 = v
-            temp_box = temp_frame[y1:y2, x1:x2]
-            # print(temp_frame[y1:y2, x1:x2][:, :, 0].shape)
-            cv2.rectangle(temp_frame, (x1, y1), (x2, y2), (0, 255, 0))
-            cv2.putText(temp_frame, key, (x1, y1), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color["text"], thickness=2)
-            if x1 < x < x2 and y1 < y < y2:
-                temp_frame[y1:y2, x1:x2, 0] = np.array([[190] * temp_box.shape[1]] * temp_box.shape[0])
-    if not tracking:
-        h, w, _ = temp_frame.shape
-        cv2.line(temp_frame, (x, 0), (x, h), color["line"])
-        cv2.line(temp_frame, (0, y), (w, y), color["line"])
-    cv2.imshow(window_name, temp_frame)
+    # no frame was shown yet
+    if overlay.frame is None:
+        return
+    mouse[0], mouse[1] = x, y
+    # a click on the class menu picks the class of the new box
+    if event == cv2.EVENT_LBUTTONDOWN and picker.click(x, y):
+        redraw()
+        return
     # if a rectangle is double clicked, the bounding box is deleted
     if event == cv2.EVENT_RBUTTONDBLCLK and not tracking:
-        delete_these = []
-        # iterate over bounding boxes to identify the box selected
-        for key, val in all_bounding_boxes.items():
-            for i, v in enumerate(val):
-                x1, y1, x2, y2 = v
-                # check click condition
-                if x1 < x < x2 and y1 < y < y2:
-                    delete_these.append([key, i, (y2 - y1) * (x2 - x1)])
-        # sort so that the smallest area item is selected
-        delete_these = sorted(delete_these, key=lambda inp: inp[2])
-        # delete from dictionary separately as dictionary cannot be altered during a loop
-        for key, i, _ in delete_these:
+        # the spatial index finds the boxes under the cursor, the smallest one is deleted
+        selected = overlay.smallest_at(x, y)
+        if selected is not None:
+            key, i = selected
             del all_bounding_boxes[key][i]
-            break
+            overlay.set_boxes(all_bounding_boxes)
     # the dragging feature is enabled and the top xy coords of the image are added to a local variable
     if event == cv2.EVENT_LBUTTONDOWN and not tracking:
         print("recog lbutton down")
         dragging = True
         temp_start_point = [x, y]
     # check if drawing the bounding box is done
-    elif event == cv2.EVENT_LBUTTONUP and not tracking:
+    elif event == cv2.EVENT_LBUTTONUP and not tracking and dragging:
         # disable drawing
         dragging = False
         # store the points in a variable
         points = [temp_start_point[0], temp_start_point[1], x, y]
         points = get_points_order(points)
         # check if the small object thresh condition is satisfied
-        if not area_of(points, temp_frame.shape):
+        if not area_of(points, frame.shape):
             pass
         else:
             temp_start_point = []
             # enable tracking
             # tracking = True
-            # get class from a dialog box dropdown
-            cls = select_class_name(classes)
-            # append bounding box to all bounding boxes
-            if cls not in all_bounding_boxes:
-                all_bounding_boxes[cls] = []
-            all_bounding_boxes[cls].append(points)
-    elif not tracking:
-        # here we continuously update the frame with the bounding box
-        if dragging:
-            if len(temp_start_point) > 0:
-                cv2.rectangle(temp_frame, tuple(temp_start_point), (x, y), (255, 0, 0))
-            cv2.imshow(window_name, temp_frame)
+            if args.class_picker == "tk":
+                # get class from a dialog box dropdown
+                add_box(select_class_name(classes), points)
+            else:
+                # the class is picked from the menu in the window, the box is added when it is picked
+                picker.open(points)
+    redraw()
+
+
+# runs the trackers through the whole video without a window using the boxes of the seed file
+def headless_main():
+    global save_counter
+    cap = cv2.VideoCapture(input_vid)
+    frame_size = (cap.get(cv2.CAP_PROP_FRAME_WIDTH), cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    cap.release()
+    seeds = load_seeds(seed_file, classes, start_frame=start_pos, frame_size=frame_size)
+    if args.segment_workers > 1:
+        # the overlapping segments of the video are tracked in parallel processes
+        save_counter = run_segments(input_vid, writer, seeds, save_counter, save_every, args.segment_workers,
+                                    skip_frames=skip_frames, track_width=track_width or opencv_window_width,
+                                    queue_depth=queue_depth, seek_threshold=seek_threshold, track_gray=track_gray,
+                                    output_width=output_width, tracker=tracker_name, sampler=sampler,
+                                    overlap=args.segment_overlap)
+        return
+    save_counter = run_headless(input_vid, writer, seeds, save_counter, save_every,
+                                track_width=track_width or opencv_window_width, skip_frames=skip_frames,
+                                queue_depth=queue_depth, seek_threshold=seek_threshold, track_gray=track_gray,
+                                output_width=output_width, tracker_workers=tracker_workers, tracker=tracker_name,
+                                profiler=profiler, sampler=sampler)
 
 
 # the main function
 def main():
+    if seed_file is not None:
+        headless_main()
+        writer.close()
+        writer.report()
+        save_profile(profiler, args)
+        return
     # create a window which will display the UI
     cv2.namedWindow(window_name)
     # add the callback function
     cv2.setMouseCallback(window_name, draw_annotation)
     # define the global variables
-    global frame, tracking, idx_trackers, start_pos, save_counter, input_vid, save_every, save_path, opencv_window_width
-    global skip_frames, time_delay
+    global frame, tracking, idx_trackers, trackers, start_pos, save_counter, input_vid, save_every, save_path, opencv_window_width
+    global skip_frames, time_delay, picker
+    picker = ClassPicker(classes, color, add_box)
+    # the trackers are updated in this process or sharded over tracker_workers processes
+    trackers = create_trackers(tracker_name, tracker_workers)
+    # in keyframe mode the boxes between keyframes are interpolated instead of tracked
+    keyframes = None
+    if keyframe_every > 0:
+        keyframes = KeyframeAnnotator(args.interpolation, trackers if args.verify_iou > 0 else None, args.verify_iou)
     # initialize video capture
     cap = cv2.VideoCapture(input_vid)
     cap.set(cv2.CAP_PROP_POS_FRAMES, start_pos)
     print(input_vid)
-    # read the first frame
-    ret, frame = cap.read()
-    H, W, _ = frame.shape
     # define resize ratio so that the width is frame_width
-    resize_ratio = opencv_window_width / W
+    resize_ratio = get_resize_ratio(cap, opencv_window_width)
+    # the tracking and saved frames have their own resolutions
+    track_ratio = get_resize_ratio(cap, track_width) if track_width else None
+    output_ratio = get_resize_ratio(cap, output_width)
+    # the frames are decoded, resized and converted to rgb on a separate thread
+    source = FrameSource(cap, resize_ratio, skip_frames=skip_frames, queue_depth=queue_depth, start_pos=start_pos,
+                         seek_threshold=seek_threshold, track_ratio=track_ratio, track_gray=track_gray,
+                         output_ratio=output_ratio, profiler=profiler)
+    # the recent frames are kept to step back to them, the buffered keyframe segments cannot be tracked again
+    history = history_from_args(args) if keyframes is None else NullHistory()
+    from_history = False
+    shown = False
+    # the state of the session is saved every few seconds to resume it after a crash
+    checkpointer = Checkpointer(save_path, writer, args.checkpoint_every)
+    # read the first frame
+    item = source.read()
+    restored = checkpoint is not None and item is not None
+    # the frame of the checkpoint is shown paused, the counter it had after it was tracked is applied on play
+    resume_counter = checkpoint["next_counter"] if restored else None
+    if restored:
+        # the boxes of the checkpoint are shown on its frame, 'p' starts the trackers from them
+        h, w = item.display.shape[:2]
+        for key, val in checkpoint["boxes"].items():
+            all_bounding_boxes[key] = [[int(round(v)) for v in scale_box(b, w, h)] for b in val]
+        overlay.set_boxes(all_bounding_boxes)
     timer = 0
     paused = True
+    stop = False
     # start the main loop
-    while ret:
+    while item is not None:
+        # a frame of the video is added to the history when it is shown the first time
+        if not from_history and not shown:
+            history.push(item, save_counter)
+        shown = False
+        frame_counter = save_counter
+        # a frame shown again from the history keeps its name and its annotation is saved again if it was saved before
+        was_saved = from_history and history.current().saved
+        saved = False
         current_points = []
-        # resize the frame so that the width = frame_width px
-        frame = cv2.resize(frame, None, fx=resize_ratio, fy=resize_ratio)
+        frame = item.display
+        overlay.set_frame(frame)
         h, w, _ = frame.shape
+        th, tw = item.track.shape[:2]
         # this is used for drawing the rectangle so the original frame is not effected
         temp_frame = frame.copy()
         assigned = False
         # update object positions with tracking
-        if not paused and tracking:
+        if not paused and tracking and keyframes is not None:
+            # the frames between keyframes are only buffered, their boxes are interpolated later
+            assigned = True
+        elif not paused and tracking:
             # track the object initialized in the call back function
-            tracker_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            # iterate over the trackers to get the updated positions
-            for key, dlib_trackers in idx_trackers.items():
-                for ind, dlib_tracker in enumerate(dlib_trackers):
-                    dlib_tracker.update(tracker_rgb)
-                    # get the position of the tracking object in the updated frame
-                    pos = dlib_tracker.get_position()
-                    x1 = int(pos.left())
-                    y1 = int(pos.top())
-                    x2 = int(pos.right())
-                    y2 = int(pos.bottom())
-                    # update all bounding box positions which are used in call back function
-                    all_bounding_boxes[key][ind] = [x1, y1, x2, y2]
-                    # draw the bounding box on the frame
-                    cv2.rectangle(temp_frame, (x1, y1), (x2, y2), color["track"])
-                    # draw the class name
-                    cv2.putText(temp_frame, key, (x1, y1), cv2.FONT_HERSHEY_SIMPLEX, 0.5,
-                                color["text"], thickness=2)
-                    assigned = True
-                    # add the annotations and class name to current_points list
-                    current_points.append([x1, y1, x2, y2, key])
+            tracker_rgb = item.track
+            # update all the trackers and get the positions of the tracking objects in the updated frame
+            with profiler.stage("track", len(idx_trackers)):
+                positions = trackers.update(tracker_rgb)
+            draw_start = time.perf_counter()
+            for (key, ind), pos in zip(idx_trackers, positions):
+                # the position in the ratios of W and H
+                box = scale_box(pos, 1 / tw, 1 / th)
+                x1, y1, x2, y2 = [int(v) for v in scale_box(box, w, h)]
+                # update all bounding box positions which are used in call back function
+                all_bounding_boxes[key][ind] = [x1, y1, x2, y2]
+                # draw the bounding box on the frame
+                cv2.rectangle(temp_frame, (x1, y1), (x2, y2), color["track"])
+                # draw the class name
+                cv2.putText(temp_frame, key, (x1, y1), cv2.FONT_HERSHEY_SIMPLEX, 0.5,
+                            color["text"], thickness=2)
+                assigned = True
+                # add the class id and normalized annotations to current_points list
+                current_points.append([class_idx[key]] + box)
+            overlay.set_boxes(all_bounding_boxes)
+            profiler.add("draw", draw_start, time.perf_counter())
+        # show the frame rate and the time of every stage
+        profiler.draw_hud(temp_frame)
+        display_start = time.perf_counter()
         # update the frame with the new tracked object frame
         cv2.imshow(window_name, temp_frame)
+        if paused and (from_history or restored):
+            # show the boxes of the frame that was stepped back to or resumed from
+            redraw()
+            restored = False
         key_press = cv2.waitKey(timer) & 0xFF
+        # the time waiting for a key while paused is not part of the pipeline
+        if not paused:
+            profiler.add("display", display_start, time.perf_counter())
+        # while the class menu is open the keys pick the class and the video does not move on
+        while picker.handle_key(key_press):
+            redraw()
+            key_press = cv2.waitKey(0) & 0xFF
         if key_press == ord('q'):
-            break
+            # the tracked frame is still saved and checkpointed before the loop stops
+            stop = True
         # pause the next frame or play from the next frame
         elif key_press == ord('p'):
             if not paused:
@@ -246,46 +444,113 @@ def main():
                 timer = time_delay
                 paused = False
                 tracking = True
-                # delete all trackers and will be reinitialized with object positions
-                delete_trackers = [w for w in idx_trackers.keys()]
-                for tracker in delete_trackers:
-                    del idx_trackers[tracker]
-                tracker_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                # initialize trackers for all bounding boxes
-                for key, val in all_bounding_boxes.items():
-                    idx_trackers[key] = []
-                    for x1, y1, x2, y2 in val:
-                        rect = dlib.rectangle(x1, y1, x2, y2)
-                        idx_trackers[key].append(dlib.correlation_tracker())
-                        idx_trackers[key][-1].start_track(tracker_rgb, rect)
+                if keyframes is not None:
+                    # the boxes on the paused frame are a keyframe, the frames up to it can be interpolated
+                    if save_counter % save_every == 0:
+                        keyframes.buffer(item.index, save_counter, item.image, item.track)
+                    for counter, image, boxes, index in keyframes.add_keyframe(item.index,
+                                                                               get_normalized_boxes(w, h), item.track):
+                        writer.submit(counter, image, boxes, index)
+                else:
+                    # the old trackers are replaced by trackers initialized with the object positions
+                    idx_trackers = []
+                    boxes = []
+                    for key, val in all_bounding_boxes.items():
+                        for ind, points in enumerate(val):
+                            idx_trackers.append((key, ind))
+                            # the boxes are drawn in the display resolution and tracked in the tracking resolution
+                            boxes.append(scale_box(points, tw / w, th / h))
+                    trackers.start(item.track, boxes)
+                    # the corrected boxes start the sampling again
+                    sampler.reset()
+                if resume_counter is not None:
+                    # the next frames get the names they had in the session that stopped
+                    save_counter = resume_counter
+                    resume_counter = None
         # check if it is not paused and it the object is being tracked
         if not paused and tracking:
             # check if the object is in fact tracked
             if assigned:
-                # check if the counter satisfies the skip condition
-                if save_counter % save_every == 0:
-                    if len(current_points) > 0:
-                        lines = []
-                        cv2.imwrite(save_path + "/images/" + str(save_counter) + ".jpg", frame)
-                        # iterate over the frames to save the annotations in txt files
-                        for x1, y1, x2, y2, cls in current_points:
-                            aw = x2 - x1
-                            ah = y2 - y1
-                            cx = (x1 + x2) / 2
-                            cy = (y1 + y2) / 2
-                            ax = cx / w
-                            ay = cy / h
-                            aw /= w
-                            ah /= h
-                            lines.append(str(class_idx[cls]) + " %0.6f %0.6f %0.6f %0.6f" % (ax, ay, aw, ah))
-                        with open(save_path + "/annotations/" + str(save_counter) + ".txt", 'w') as f:
-                            f.write("\n".join(lines))
+                if keyframes is not None:
+                    # check if the counter satisfies the skip condition
+                    if save_counter % save_every == 0:
+                        keyframes.buffer(item.index, save_counter, item.image, item.track)
+                # check if the sampler saves the frame
+                elif len(current_points) > 0 and (was_saved or sampler.should_save(save_counter, item.index,
+                                                                                   current_points, item.track)):
+                    # the image of a frame saved before is kept, the copy in the history is compressed
+                    saved = writer.submit(save_counter, item.image, current_points, item.index, keep_image=was_saved)
                 # increment the save counter
                 save_counter += 1
-        # read the next frame
-        for _ in range(skip_frames):
-            ret, frame = cap.read()
-            save_counter += 1
+        if not paused:
+            profiler.frame()
+        if was_saved and not saved and history.current().boxes != all_bounding_boxes:
+            # the boxes of a frame that was saved before were corrected, its annotation is replaced
+            saved = writer.submit(frame_counter, item.image, get_normalized_boxes(w, h), item.index, keep_image=True)
+        # the boxes of the frame are kept in the history for when it is stepped back to
+        history.record(all_bounding_boxes, saved)
+        # the buffered frames between keyframes are only saved at the next keyframe, they are not checkpointed
+        # the session can be continued from the frame where it stopped with --resume
+        if (checkpointer.due() or stop and args.checkpoint_every > 0) and \
+                (keyframes is None or len(keyframes.pending) == 0):
+            next_counter = resume_counter if resume_counter is not None else save_counter
+            checkpointer.save(session_state(item.index, frame_counter, next_counter, w, h))
+        if stop:
+            break
+        if paused and key_press == ord('b'):
+            # step back one frame, the boxes of the frame are restored and tracked again from there on play
+            previous = history.back()
+            if previous is None:
+                print("the previous frame is not in the history anymore")
+                shown = True
+                continue
+            # the writes of the frames that are saved again must not be overtaken by the earlier writes
+            writer.flush()
+            item = previous
+            from_history = True
+            save_counter = history.current().save_counter
+            all_bounding_boxes.clear()
+            all_bounding_boxes.update(history.boxes())
+            overlay.set_boxes(all_bounding_boxes)
+            print("back at: ", save_counter)
+            continue
+        # the frames after a frame that was stepped back to are read from the history again
+        item = history.forward()
+        from_history = item is not None
+        if from_history:
+            save_counter = history.current().save_counter
+        else:
+            # read the next frame, the frame source skips skip_frames - 1 frames in between
+            item = source.read()
+            save_counter += skip_frames
+        # stop on the next keyframe so the boxes can be corrected
+        if keyframes is not None and not paused and item is not None and \
+                item.index - keyframes.last_index >= keyframe_every:
+            timer = 0
+            paused = True
+            tracking = False
+            print("keyframe at: ", save_counter)
+    if keyframes is not None:
+        # the boxes on the frame where the video was paused close the last segment
+        if paused and item is not None and keyframes.last_index is not None:
+            for counter, image, boxes, index in keyframes.add_keyframe(item.index, get_normalized_boxes(w, h),
+                                                                       item.track):
+                writer.submit(counter, image, boxes, index)
+        for counter, image, boxes, index in keyframes.finish():
+            writer.submit(counter, image, boxes, index)
+        keyframes.report()
+    source.stop()
+    source.report()
+    sampler.report()
+    history.close()
+    history.report()
+    checkpointer.close()
+    checkpointer.report()
+    trackers.close()
+    # wait for the pending images and annotations to be written
+    writer.close()
+    writer.report()
+    save_profile(profiler, args)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,266 @@
+import argparse
+import cv2
+import json
+import math
+import os
+import re
+import shutil
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from frame_source import get_stride
+from json_files import write_json_atomic
+from seed_file import load_seeds
+from synthetic_benchmark import scripts
+
+# every job of the manifest is a headless run of an annotation script in its own process, the jobs get
+# non-overlapping ranges of image names so their folders can be merged into one dataset
+#
+# manifest format, the defaults are used by every job that does not set them:
+# {
+#     "defaults": {"script": "multi", "classes": "elephant,tree", "save_every": 10, "skip_frames": 2,
+#                  "args": ["--tracker", "mosse"]},
+#     "jobs": [{"video": "clips/a.mp4", "seeds": "clips/a.json"},
+#              {"video": "clips/b.mp4", "seeds": "clips/b.json", "name": "b_night", "sample_fps": 5}]
+# }
+# a plain list of jobs is a manifest without defaults
+
+# the summary line printed by the headless runs
+processed_line = re.compile(r"processed (\d+) frames in [\d.]+ s \([\d.]+ fps\), saved (\d+) annotations")
+
+
+def available_cores():
+    # the cores this process may run on, which can be less than the cores of the machine
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def read_manifest(path):
+    with open(path) as f:
+        data = json.load(f)
+    if isinstance(data, list):
+        data = {"jobs": data}
+    defaults = data.get("defaults", {})
+    jobs = []
+    names = set()
+    for i, entry in enumerate(data.get("jobs", [])):
+        job = dict(defaults, **entry)
+        # the arguments of a job are added to the default arguments
+        job["args"] = list(defaults.get("args", [])) + list(entry.get("args", []))
+        if "video" not in job or "seeds" not in job:
+            raise AssertionError("Job " + str(i) + " of the manifest needs a video and a seeds file")
+        job.setdefault("script", "multi")
+        if job["script"] not in scripts:
+            raise AssertionError("The script of job " + str(i) + " should be one of " + ", ".join(scripts))
+        if job["script"] == "multi" and "classes" not in job:
+            raise AssertionError("Job " + str(i) + " runs the multi class script and needs the classes")
+        # the folder of the job is named after the video unless a name is given
+        name = job.get("name") or os.path.splitext(os.path.basename(job["video"]))[0]
+        base = name
+        n = 1
+        while name in names:
+            name = base + "_" + str(n)
+            n += 1
+        names.add(name)
+        job["name"] = name
+        jobs.append(job)
+    if len(jobs) == 0:
+        raise AssertionError("The manifest " + path + " does not contain any jobs")
+    return jobs
+
+
+def plan_job(job, block):
+    """
+    Finds the stride, the save interval and the number of names a job needs
+    The save interval is a multiple of the stride and the range of the job starts on a multiple of the save
+    interval and of block, which replaces the divisibility check of the scripts
+    """
+    cap = cv2.VideoCapture(job["video"])
+    if not cap.isOpened():
+        raise AssertionError("Could not open the video " + job["video"])
+    frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    frame_size = (cap.get(cv2.CAP_PROP_FRAME_WIDTH), cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    skip_frames = get_stride(cap, int(job.get("skip_frames", 1)), job.get("sample_fps"))
+    cap.release()
+    classes = [c.strip() for c in job["classes"].split(',')] if job["script"] == "multi" else None
+    seeds = load_seeds(job["seeds"], classes, start_frame=int(job.get("start_frame", 0)), frame_size=frame_size)
+    save_every = int(job.get("save_every", 10 if job["script"] == "multi" else 1))
+    if save_every % skip_frames != 0:
+        # the frames that are saved have to be on the stride
+        save_every = -(-save_every // skip_frames) * skip_frames
+        print("%s: saving every %d frames to match the stride of %d frames" % (job["name"], save_every, skip_frames))
+    # a headless run names the frames from the first seed to the end of the video
+    needed = max(frame_count - min(seeds.keys()), 1) + skip_frames
+    align = block * save_every // math.gcd(block, save_every)
+    return {"skip_frames": skip_frames, "save_every": save_every, "length": -(-needed // save_every) * save_every,
+            "align": align}
+
+
+class BatchState:
+    """
+    The jobs of a batch with their name ranges and status, saved after every change so a batch that was
+    stopped runs only the unfinished jobs again
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.jobs = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                self.jobs = json.load(f)["jobs"]
+
+    def save(self):
+        write_json_atomic(self.path, {"jobs": self.jobs}, indent=2)
+
+    def update(self, name, **values):
+        with self.lock:
+            self.jobs[name].update(values)
+            self.save()
+
+    def allocate(self, jobs, output, first_number, block):
+        """
+        Gives every new job of the manifest the next free range of names, the jobs of an earlier run keep theirs
+        """
+        with self.lock:
+            end = max([first_number] + [s["start_number"] + s["length"] for s in self.jobs.values()])
+            for job in jobs:
+                if job["name"] in self.jobs:
+                    continue
+                plan = plan_job(job, block)
+                start = -(-end // plan["align"]) * plan["align"]
+                self.jobs[job["name"]] = {"video": job["video"], "seeds": job["seeds"],
+                                          "save_path": os.path.join(output, job["name"]), "start_number": start,
+                                          "length": plan["length"], "skip_frames": plan["skip_frames"],
+                                          "save_every": plan["save_every"], "status": "pending"}
+                end = start + plan["length"]
+            self.save()
+
+
+def job_command(job, state):
+    command = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), scripts[job["script"]]),
+               "-i", job["video"], "-s", state["save_path"] + ".partial", "--seed_file", job["seeds"],
+               "-o", str(state["start_number"]), "-n", str(state["save_every"]),
+               "--skip_frames", str(state["skip_frames"])]
+    if job["script"] == "multi":
+        command += ["-c", job["classes"]]
+    return command + [str(a) for a in job["args"]]
+
+
+def run_job(job, batch, log_dir, threads):
+    """
+    Runs one job into a .partial folder that is renamed when the job succeeds
+    """
+    state = batch.jobs[job["name"]]
+    partial = state["save_path"] + ".partial"
+    # the folder of a job that was stopped is removed, the scripts do not write into an existing folder
+    if os.path.exists(partial):
+        shutil.rmtree(partial)
+    batch.update(job["name"], status="running")
+    # the libraries of a job use as many threads as the job has cores so the jobs do not compete for them
+    env = dict(os.environ, OMP_NUM_THREADS=str(threads), OPENCV_FOR_THREADS_NUM=str(threads))
+    start = time.perf_counter()
+    with open(os.path.join(log_dir, job["name"] + ".log"), 'w') as log:
+        code = subprocess.call(job_command(job, state), stdout=log, stderr=subprocess.STDOUT, env=env)
+    elapsed = time.perf_counter() - start
+    with open(os.path.join(log_dir, job["name"] + ".log")) as log:
+        found = processed_line.findall(log.read())
+    frames, saved = [int(v) for v in found[-1]] if len(found) > 0 else (0, 0)
+    used = frames * state["skip_frames"]
+    if code == 0 and used > state["length"]:
+        print("%s: used %d names but only %d were reserved" % (job["name"], used, state["length"]))
+        code = -1
+    if code == 0:
+        if os.path.exists(state["save_path"]):
+            shutil.rmtree(state["save_path"])
+        os.rename(partial, state["save_path"])
+    batch.update(job["name"], status="done" if code == 0 else "failed", exit_code=code, seconds=elapsed,
+                 frames=frames, saved=saved)
+    return job["name"]
+
+
+def summarize(batch, names):
+    jobs = [batch.jobs[n] for n in names]
+    done = [j for j in jobs if j["status"] == "done"]
+    frames = sum(j.get("frames", 0) for j in done)
+    busy = sum(j.get("seconds", 0.0) for j in done)
+    return {"jobs": len(jobs), "done": len(done), "failed": sum(j["status"] == "failed" for j in jobs),
+            "frames": frames, "saved": sum(j.get("saved", 0) for j in done),
+            "job_seconds": busy, "job_fps": frames / max(busy, 1e-9),
+            "first_name": min(j["start_number"] for j in jobs),
+            "last_name": max(j["start_number"] + j["length"] for j in jobs) - 1}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Runs the headless annotation of the videos of a manifest on a "
+                                                 "pool of processes and gives every video its own range of names")
+    parser.add_argument("manifest", help="json file with the videos, seed files and options of the jobs")
+    parser.add_argument("-s", "--save_path", required=True,
+                        help="folder for the job folders, the state, the logs and the statistics of the batch")
+    parser.add_argument("-o", "--start_number", type=int, default=0, help="first name of the whole batch")
+    parser.add_argument("--name_block", type=int, default=1000,
+                        help="the name ranges of the jobs start at multiples of this")
+    parser.add_argument("--cores_per_job", type=int, default=2,
+                        help="cores a job uses for decoding, tracking and writing")
+    parser.add_argument("--jobs", type=int, default=None,
+                        help="number of jobs run at the same time, by default the available cores / cores_per_job")
+    parser.add_argument("--retry_failed", action="store_true", help="run the failed jobs of an earlier run again")
+    args = parser.parse_args()
+
+    jobs = read_manifest(args.manifest)
+    output = args.save_path.rstrip("/")
+    log_dir = os.path.join(output, "logs")
+    os.makedirs(log_dir, exist_ok=True)
+    batch = BatchState(os.path.join(output, "batch_state.json"))
+    batch.allocate(jobs, output, args.start_number, args.name_block)
+    for job in jobs:
+        s = batch.jobs[job["name"]]
+        print("%-30s names %d to %d, every %d frames saved, stride %d" %
+              (job["name"], s["start_number"], s["start_number"] + s["length"] - 1, s["save_every"],
+               s["skip_frames"]))
+    # the jobs that were running when an earlier batch stopped are run again
+    todo = [job for job in jobs if batch.jobs[job["name"]]["status"] in ("pending", "running") or
+            (args.retry_failed and batch.jobs[job["name"]]["status"] == "failed")]
+    skipped = len(jobs) - len(todo)
+    workers = args.jobs or max(1, available_cores() // max(args.cores_per_job, 1))
+    workers = min(workers, max(len(todo), 1))
+    print("running %d jobs on %d processes, %d finished in an earlier run" % (len(todo), workers, skipped))
+    start = time.perf_counter()
+    # the threads of the pool only wait for the processes of the jobs
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(run_job, job, batch, log_dir, args.cores_per_job) for job in todo]
+        for future in as_completed(futures):
+            name = future.result()
+            s = batch.jobs[name]
+            if s["status"] == "done":
+                print("%-30s %6d frames %6d saved in %7.1f s (%0.1f fps)" %
+                      (name, s["frames"], s["saved"], s["seconds"], s["frames"] / max(s["seconds"], 1e-9)))
+            else:
+                print("%-30s failed with exit code %d, see %s" %
+                      (name, s["exit_code"], os.path.join(log_dir, name + ".log")))
+    wall = time.perf_counter() - start
+    stats = summarize(batch, [job["name"] for job in jobs])
+    run_frames = sum(batch.jobs[job["name"]].get("frames", 0) for job in todo
+                     if batch.jobs[job["name"]]["status"] == "done")
+    run_seconds = sum(batch.jobs[job["name"]].get("seconds", 0.0) for job in todo
+                      if batch.jobs[job["name"]]["status"] == "done")
+    stats.update({"processes": workers, "cores": available_cores(), "wall_seconds": wall,
+                  "run_frames": run_frames, "batch_fps": run_frames / max(wall, 1e-9),
+                  "speedup": run_seconds / max(wall, 1e-9)})
+    with open(os.path.join(output, "batch_stats.json"), 'w') as f:
+        json.dump(stats, f, indent=2)
+    print("%d of %d jobs done, %d failed, %d frames and %d annotations, names %d to %d" %
+          (stats["done"], stats["jobs"], stats["failed"], stats["frames"], stats["saved"], stats["first_name"],
+           stats["last_name"]))
+    print("this run: %d frames in %0.1f s, %0.1f fps over all jobs, %0.1f fps per job, %0.2fx speedup on %d "
+          "processes" % (run_frames, wall, stats["batch_fps"], run_frames / max(run_seconds, 1e-9), stats["speedup"],
+                         workers))
+    if stats["failed"] > 0:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
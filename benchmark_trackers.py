@@ -0,0 +1,129 @@
+import argparse
+import cv2
+import json
+import numpy as np
+import time
+from box_utils import iou
+from frame_source import FrameSource, get_resize_ratio, positive_int, scale_box
+from seed_file import load_seeds
+from tracker_backends import available_trackers, create_trackers
+
+
+def load_frames(input_vid, seeds, track_width=None, track_gray=False, max_frames=300, skip_frames=1):
+    # decode the tracking frames once so every backend runs on exactly the same frames
+    start_pos = min(seeds.keys())
+    cap = cv2.VideoCapture(input_vid)
+    cap.set(cv2.CAP_PROP_POS_FRAMES, start_pos)
+    source = FrameSource(cap, None, skip_frames=skip_frames, start_pos=start_pos,
+                         track_ratio=get_resize_ratio(cap, track_width), track_gray=track_gray, output_ratio=None)
+    frames = []
+    item = source.read()
+    while item is not None and len(frames) < max_frames:
+        frames.append((item.index, item.track))
+        item = source.read()
+    source.stop()
+    return frames
+
+
+def run_backend(name, frames, seeds, workers=0):
+    """
+    Tracks the seed boxes through the frames with the backend called name
+    Returns the timings and the normalized boxes of every frame
+    """
+    trackers = create_trackers(name, workers)
+    seed_frames = sorted(seeds.keys())
+    next_seed = 0
+    count = 0
+    boxes = []
+    update_time = 0.0
+    updates = 0
+    object_updates = 0
+    for index, image in frames:
+        h, w = image.shape[:2]
+        if next_seed < len(seed_frames) and index >= seed_frames[next_seed]:
+            # skip over the seeds that were jumped over and restart on the latest one
+            while next_seed + 1 < len(seed_frames) and index >= seed_frames[next_seed + 1]:
+                next_seed += 1
+            seed = seeds[seed_frames[next_seed]]
+            count = len(seed)
+            trackers.start(image, [scale_box(s[1:], w, h) for s in seed])
+            positions = [s[1:] for s in seed]
+            next_seed += 1
+        else:
+            start = time.perf_counter()
+            positions = trackers.update(image)
+            update_time += time.perf_counter() - start
+            updates += 1
+            object_updates += count
+            positions = [scale_box(pos, 1 / w, 1 / h) for pos in positions]
+        boxes.append(np.asarray(positions, dtype=np.float64).reshape(-1, 4))
+    trackers.close()
+    return {"tracker": name,
+            "frames": updates,
+            "fps": updates / max(update_time, 1e-9),
+            "update_ms": 1000 * update_time / max(updates, 1),
+            "per_object_ms": 1000 * update_time / max(object_updates, 1),
+            "boxes": boxes}
+
+
+def drift(boxes, reference):
+    # mean, lowest and last frame IoU of the boxes against the boxes of the reference run
+    frame_iou = [iou(a, b).mean() for a, b in zip(boxes, reference) if len(a) > 0 and len(a) == len(b)]
+    if len(frame_iou) == 0:
+        return {"mean_iou": None, "min_iou": None, "last_iou": None}
+    return {"mean_iou": float(np.mean(frame_iou)), "min_iou": float(np.min(frame_iou)),
+            "last_iou": float(frame_iou[-1])}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Runs the tracker backends on the same video and seed boxes")
+    parser.add_argument("-i", "--input_video", help="The relative path of the video", required=True)
+    parser.add_argument("--seed_file", required=True, help="json or yolo file with the initial boxes")
+    parser.add_argument("-c", "--classes", default=None, help="the class names separated by ',' used in the seed file")
+    parser.add_argument("--trackers", default=",".join(available_trackers()),
+                        help="the backends to compare separated by ','")
+    parser.add_argument("--reference", default=None,
+                        help="the backend the IoU drift is measured against, by default the first backend")
+    parser.add_argument("--track_width", type=positive_int, default=None, help="width of the tracking frames")
+    parser.add_argument("--track_gray", action="store_true", help="track on grayscale frames")
+    parser.add_argument("--tracker_workers", type=int, default=0, help="processes for the dlib trackers")
+    parser.add_argument("--max_frames", type=int, default=300, help="number of frames to track")
+    parser.add_argument("--skip_frames", type=positive_int, default=1, help="only every skip_frames-th frame is tracked")
+    parser.add_argument("--output", default=None, help="json file to save the results")
+    args = parser.parse_args()
+
+    classes = None if args.classes is None else [c.strip() for c in args.classes.split(',')]
+    cap = cv2.VideoCapture(args.input_video)
+    frame_size = (cap.get(cv2.CAP_PROP_FRAME_WIDTH), cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    cap.release()
+    seeds = load_seeds(args.seed_file, classes, frame_size=frame_size)
+    frames = load_frames(args.input_video, seeds, args.track_width, args.track_gray, args.max_frames,
+                         args.skip_frames)
+    names = [name.strip() for name in args.trackers.split(',')]
+    reference = args.reference or names[0]
+    if reference not in names:
+        names.insert(0, reference)
+
+    results = {}
+    for name in names:
+        print("running", name)
+        results[name] = run_backend(name, frames, seeds, args.tracker_workers)
+    for name in names:
+        results[name].update(drift(results[name]["boxes"], results[reference]["boxes"]))
+
+    print("%-14s %8s %10s %14s %9s %9s %9s" %
+          ("tracker", "fps", "frame ms", "per object ms", "mean iou", "min iou", "last iou"))
+    for name in names:
+        r = results[name]
+        ious = ["%9.3f" % r[k] if r[k] is not None else "%9s" % "-" for k in ["mean_iou", "min_iou", "last_iou"]]
+        print("%-14s %8.1f %10.3f %14.4f %s" % (name, r["fps"], r["update_ms"], r["per_object_ms"], " ".join(ious)))
+
+    if args.output is not None:
+        summary = {"video": args.input_video, "reference": reference, "frames": len(frames),
+                   "results": [{k: v for k, v in results[name].items() if k != "boxes"} for name in names]}
+        with open(args.output, 'w') as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,25 @@
+import numpy as np
+
+
+def iou(a, b):
+    """
+    Intersection over union of the boxes of a and b pair by pair
+    a, b: arrays of shape (N, 4) in the format x_left, y_top, x_right, y_bottom
+    """
+    a = np.asarray(a, dtype=np.float64).reshape(-1, 4)
+    b = np.asarray(b, dtype=np.float64).reshape(-1, 4)
+    iw = np.clip(np.minimum(a[:, 2], b[:, 2]) - np.maximum(a[:, 0], b[:, 0]), 0, None)
+    ih = np.clip(np.minimum(a[:, 3], b[:, 3]) - np.maximum(a[:, 1], b[:, 1]), 0, None)
+    inter = iw * ih
+    union = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1]) + (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1]) - inter
+    return inter / np.maximum(union, 1e-12)
+
+
+def iou_matrix(a, b):
+    """
+    Intersection over union of every box of a with every box of b, an array of shape (len(a), len(b))
+    """
+    a = np.asarray(a, dtype=np.float64).reshape(-1, 4)
+    b = np.asarray(b, dtype=np.float64).reshape(-1, 4)
+    n, m = len(a), len(b)
+    return iou(np.repeat(a, m, axis=0), np.tile(b, (n, 1))).reshape(n, m)
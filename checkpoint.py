@@ -0,0 +1,72 @@
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from json_files import write_json_atomic
+
+
+def add_checkpoint_arguments(parser):
+    # command line arguments of the session checkpoints
+    parser.add_argument("--resume", action="store_true", required=False,
+                        help="continue the session in the existing save path from its last checkpoint")
+    parser.add_argument("--checkpoint_every", type=float, default=5.0, required=False,
+                        help="seconds between two checkpoints of the session, 0 saves no checkpoints")
+
+
+def checkpoint_path(save_path):
+    return os.path.join(save_path, "checkpoint.json")
+
+
+def read_checkpoint(save_path):
+    path = checkpoint_path(save_path)
+    if not os.path.exists(path):
+        raise AssertionError("There is no checkpoint in " + save_path + " to resume from")
+    with open(path) as f:
+        return json.load(f)
+
+
+def write_checkpoint(save_path, state):
+    write_json_atomic(checkpoint_path(save_path), state)
+
+
+class Checkpointer:
+    """
+    Saves the state of the session at most every `every` seconds
+    A checkpoint is written on a thread once the frames queued before it are written, so every frame named before
+    the checkpoint is on disk when it is saved and the loop does not wait for the writer
+    """
+
+    def __init__(self, save_path, writer, every=5.0):
+        self.save_path = save_path
+        self.writer = writer
+        self.every = every
+        self.last = time.perf_counter()
+        self.saved = 0
+        self.seconds = 0.0
+        self.executor = ThreadPoolExecutor(max_workers=1)
+
+    def due(self):
+        return self.every > 0 and time.perf_counter() - self.last >= self.every
+
+    def save(self, state):
+        state["time"] = time.strftime("%Y-%m-%d %H:%M:%S")
+        self.last = time.perf_counter()
+        self.executor.submit(self.write, self.writer.queued, state)
+
+    def write(self, queued, state):
+        try:
+            self.writer.wait_queued(queued)
+            start = time.perf_counter()
+            write_checkpoint(self.save_path, state)
+            self.saved += 1
+            self.seconds += time.perf_counter() - start
+        except Exception as e:
+            print("could not save the checkpoint:", e)
+
+    def close(self):
+        # wait for the last checkpoint
+        self.executor.shutdown(wait=True)
+
+    def report(self):
+        if self.saved > 0:
+            print("checkpoints: %d saved, %0.2f ms each" % (self.saved, 1000 * self.seconds / self.saved))
@@ -0,0 +1,107 @@
+import cv2
+
+# key codes returned by cv2.waitKey(...) & 0xFF
+enter_keys = [10, 13]
+escape_key = 27
+tab_key = 9
+
+
+class ClassPicker:
+    """
+    A menu of the class names drawn under a new box inside the OpenCV window
+    The class is picked with the number keys (1 is the first class, 0 the tenth), a click on the menu or enter,
+    which picks the highlighted class, by default the last picked one. Tab moves the highlight and escape drops
+    the box. Starting a new box outside the menu keeps the highlighted class for the open box
+    on_pick(class name, box) is called with the picked class
+    """
+
+    def __init__(self, classes, colors, on_pick, font_scale=0.5):
+        self.classes = classes
+        self.colors = colors
+        self.on_pick = on_pick
+        self.font_scale = font_scale
+        # the size of the menu items is measured once
+        sizes = [cv2.getTextSize(self.label(i), cv2.FONT_HERSHEY_SIMPLEX, font_scale, 1) for i in range(len(classes))]
+        self.item_w = max(s[0][0] for s in sizes) + 10
+        self.item_h = max(s[0][1] + s[1] for s in sizes) + 8
+        self.last = 0
+        self.selected = 0
+        self.pending = None
+        self.origin = (0, 0)
+
+    def label(self, i):
+        return (str((i + 1) % 10) + " " if i < 10 else "  ") + self.classes[i]
+
+    def open(self, box):
+        # the highlight starts on the class of the previous box
+        self.pending = box
+        self.selected = self.last
+
+    def pick(self, i):
+        box = self.pending
+        self.pending = None
+        self.last = i
+        self.on_pick(self.classes[i], box)
+
+    def handle_key(self, key_press):
+        """
+        Returns True when the menu is open, the key is then used by the menu
+        """
+        if self.pending is None:
+            return False
+        if ord('0') <= key_press <= ord('9'):
+            i = (key_press - ord('1')) % 10
+            if i < len(self.classes):
+                self.pick(i)
+        elif key_press in enter_keys:
+            self.pick(self.selected)
+        elif key_press == tab_key:
+            self.selected = (self.selected + 1) % len(self.classes)
+        elif key_press == escape_key:
+            self.pending = None
+        return True
+
+    def item_at(self, x, y):
+        ox, oy = self.origin
+        i = (y - oy) // self.item_h
+        if ox <= x < ox + self.item_w and y >= oy and i < len(self.classes):
+            return i
+        return None
+
+    def click(self, x, y):
+        """
+        Handles a left click, returns True when the click picked a class from the menu
+        """
+        if self.pending is None:
+            return False
+        i = self.item_at(x, y)
+        if i is not None:
+            self.pick(i)
+            return True
+        # a click outside the menu starts the next box, the open box keeps the highlighted class
+        self.pick(self.selected)
+        return False
+
+    def draw(self, overlay):
+        """
+        Draws the open box and the menu on the canvas of the overlay, which restores the region on the next render
+        """
+        if self.pending is None:
+            return
+        canvas = overlay.canvas
+        h, w = canvas.shape[:2]
+        x1, y1, x2, y2 = self.pending
+        cv2.rectangle(canvas, (x1, y1), (x2, y2), self.colors["drag"])
+        overlay.mark(x1, y1, x2 + 1, y2 + 1)
+        # the menu is below the box, or above it when it does not fit
+        menu_h = self.item_h * len(self.classes)
+        ox = max(0, min(x1, w - self.item_w))
+        oy = y2 + 2 if y2 + 2 + menu_h <= h else max(0, y1 - 2 - menu_h)
+        self.origin = (ox, oy)
+        for i in range(len(self.classes)):
+            top = oy + i * self.item_h
+            background = self.colors["drag"] if i == self.selected else self.colors["text"]
+            cv2.rectangle(canvas, (ox, top), (ox + self.item_w, top + self.item_h), background, thickness=-1)
+            cv2.putText(canvas, self.label(i), (ox + 5, top + self.item_h - 6), cv2.FONT_HERSHEY_SIMPLEX,
+                        self.font_scale, (255, 255, 255), thickness=1)
+        overlay.mark(ox, oy, ox + self.item_w + 1, oy + menu_h + 1)
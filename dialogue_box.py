@@ -1,8 +1,8 @@
 from tkinter import *
 
+root = None
 window = None
 selected_val = None
-flag = True
 
 
 def get_selected_val():
@@ -23,32 +23,34 @@ def set_classes(classes):
 
 
 def on_quit():
-    global flag
-    print("called")
-    flag = False
     window.destroy()
 
 
 def select_class_name(classes):
-    global selected_val, option, flag, window, optionVar
-    window = Tk()
+    global selected_val, option, window, optionVar, root
+    # one hidden root is kept for all the dialogs instead of starting tk for every box
+    if root is None:
+        root = Tk()
+        root.withdraw()
+    window = Toplevel(root)
     selected_val = None
     window.title("Class Selection")
     w, h = 200, 100
     x = window.winfo_pointerx()
     y = window.winfo_pointery()  # height of the screen
     window.geometry('%dx%d+%d+%d' % (w, h, x, y))
-    window.protocol("WM_DESTROY_WINDOW", on_quit)
+    window.protocol("WM_DELETE_WINDOW", on_quit)
     optionVar = StringVar()
     optionVar.set("class")
     option = OptionMenu(window, optionVar, *classes)
     option.pack()
     btnShow = Button(window, text="Select", command=select)
     btnShow.pack()
-    flag = True
-    show()
-    while flag:
-        pass
+    # wait until the dialog is closed while tk handles its events
+    root.wait_window(window)
+    # closing the dialog without choosing a class returns None
+    if selected_val not in classes:
+        return None
     return selected_val
 
 
@@ -0,0 +1,182 @@
+import copy
+import cv2
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from frame_source import Frame
+
+
+def add_history_arguments(parser):
+    # command line arguments of the rewind history of the window
+    parser.add_argument("--history_mb", type=int, default=256, required=False,
+                        help="memory for the compressed recent frames that can be stepped back to with 'b' and "
+                             "tracked again, 0 keeps no history")
+    parser.add_argument("--history_quality", type=int, default=90, required=False,
+                        help="jpg quality of the frames kept in the history from 0 to 100, the frames saved before "
+                             "keep their image when they are tracked again")
+
+
+def encode(image, quality):
+    if image is None:
+        return None
+    ok, buffer = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise AssertionError("Could not compress a frame for the history")
+    return buffer
+
+
+def decode(buffer):
+    if buffer is None:
+        return None
+    return cv2.imdecode(buffer, cv2.IMREAD_UNCHANGED)
+
+
+class HistoryEntry:
+    __slots__ = ["index", "save_counter", "data", "size", "boxes", "saved"]
+
+    def __init__(self, index, save_counter, data):
+        self.index = index
+        self.save_counter = save_counter
+        # the future of the compressed image, display and tracking frames
+        self.data = data
+        self.size = 0
+        # the boxes of the frame when it was left, by class name like all_bounding_boxes
+        self.boxes = {}
+        self.saved = False
+
+
+class FrameHistory:
+    """
+    Keeps the recent frames compressed in memory within budget_mb together with their name and boxes,
+    so the window can step back over them and track forward again from corrected boxes without decoding
+    the video again
+    The frames are compressed on a thread so the tracking loop does not wait for them
+    The trackers cannot be copied, so stepping back restores the boxes of the frame and the trackers are
+    started again from them
+    """
+
+    def __init__(self, budget_mb=256, quality=90):
+        self.budget = budget_mb * 1024 * 1024
+        self.quality = quality
+        self.entries = deque()
+        # the position of the shown frame in the entries
+        self.cursor = -1
+        self.lock = threading.Lock()
+        self.bytes = 0
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.rewinds = 0
+        self.replayed = 0
+
+    def compress(self, item, entry):
+        display = encode(item.display, self.quality)
+        # the rgb tracking frame of the display size is made again from the display frame
+        same_track = item.track.ndim == 3 and item.track.shape == item.display.shape
+        track = None if same_track else encode(item.track, self.quality)
+        # the saved image is often the display frame too
+        same_image = item.image is not None and item.image.shape == item.display.shape
+        image = None if same_image else encode(item.image, self.quality)
+        size = sum(b.nbytes for b in (display, track, image) if b is not None)
+        with self.lock:
+            entry.size = size
+            self.bytes += size
+        return display, track, image, same_track, same_image
+
+    def push(self, item, save_counter):
+        """
+        Adds the frame that is shown next after the frames of the history
+        """
+        entry = HistoryEntry(item.index, save_counter, None)
+        entry.data = self.executor.submit(self.compress, item, entry)
+        self.entries.append(entry)
+        # the oldest frames are dropped when the history is over its budget, the frames are compressed in order
+        with self.lock:
+            while len(self.entries) > 1 and self.bytes > self.budget and self.entries[0].data.done():
+                self.bytes -= self.entries.popleft().size
+        self.cursor = len(self.entries) - 1
+
+    def record(self, boxes, saved):
+        """
+        Keeps the boxes of the shown frame, and if it was saved, when the frame is left
+        """
+        entry = self.entries[self.cursor]
+        entry.boxes = copy.deepcopy(boxes)
+        entry.saved = entry.saved or saved
+
+    def current(self):
+        return self.entries[self.cursor]
+
+    def boxes(self):
+        # a copy of the boxes of the shown frame that can be changed
+        return copy.deepcopy(self.entries[self.cursor].boxes)
+
+    def replaying(self):
+        # the shown frame is an older frame of the history
+        return self.cursor < len(self.entries) - 1
+
+    def frame(self, entry):
+        display, track, image, same_track, same_image = entry.data.result()
+        display = decode(display)
+        track = cv2.cvtColor(display, cv2.COLOR_BGR2RGB) if same_track else decode(track)
+        image = display if same_image else decode(image)
+        return Frame(entry.index, image, display, track)
+
+    def back(self, steps=1):
+        """
+        Returns the frame steps frames before the shown frame, or None when it is not in the history anymore
+        """
+        if self.cursor - steps < 0:
+            return None
+        if not self.replaying():
+            self.rewinds += 1
+        self.cursor -= steps
+        return self.frame(self.entries[self.cursor])
+
+    def forward(self):
+        """
+        Returns the next frame of the history, or None when the shown frame is the last one
+        """
+        if not self.replaying():
+            return None
+        self.cursor += 1
+        self.replayed += 1
+        return self.frame(self.entries[self.cursor])
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+    def report(self):
+        print("history: %d frames in %0.1f MB, %d rewinds, %d frames shown again" %
+              (len(self.entries), self.bytes / 1024 / 1024, self.rewinds, self.replayed))
+
+
+class NullHistory:
+    """
+    The history used when it is turned off, it keeps no frames
+    """
+
+    def push(self, item, save_counter):
+        pass
+
+    def record(self, boxes, saved):
+        pass
+
+    def replaying(self):
+        return False
+
+    def back(self, steps=1):
+        return None
+
+    def forward(self):
+        return None
+
+    def close(self):
+        pass
+
+    def report(self):
+        pass
+
+
+def history_from_args(args):
+    if args.history_mb <= 0:
+        return NullHistory()
+    return FrameHistory(args.history_mb, args.history_quality)
@@ -0,0 +1,209 @@
+import argparse
+import cv2
+import threading
+import time
+from collections import namedtuple
+from profiler import null_profiler
+from queue import Queue, Empty, Full
+
+# a decoded frame: index in the video, BGR image at the output resolution which is saved,
+# resized BGR frame for the window and the RGB or grayscale frame at the tracking resolution
+Frame = namedtuple("Frame", ["index", "image", "display", "track"])
+
+
+def scale_box(box, sx, sy):
+    # map a x_left, y_top, x_right, y_bottom box from one resolution to another
+    x1, y1, x2, y2 = box
+    return [x1 * sx, y1 * sy, x2 * sx, y2 * sy]
+
+
+def resize(image, ratio):
+    if ratio == 1.0:
+        return image
+    return cv2.resize(image, None, fx=ratio, fy=ratio, interpolation=cv2.INTER_AREA)
+
+
+def positive_int(value):
+    # argparse type of the widths, strides and queue sizes, which have to be at least 1
+    number = int(value)
+    if number <= 0:
+        raise argparse.ArgumentTypeError("should be a positive number, not " + value)
+    return number
+
+
+def get_stride(cap, skip_frames=1, sample_fps=None):
+    # time based sampling, for example sample_fps=2 keeps 2 frames of every second of the video
+    if sample_fps is None:
+        return skip_frames
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    if fps <= 0:
+        raise AssertionError("The frame rate of the video is unknown, use skip_frames instead of sample_fps")
+    return max(1, int(round(fps / sample_fps)))
+
+
+def get_resize_ratio(cap, width=None, resize_above=0):
+    # define resize ratio so that the width is frame_width
+    W = cap.get(cv2.CAP_PROP_FRAME_WIDTH)
+    if width is None or W <= resize_above or W == 0:
+        return 1.0
+    return width / W
+
+
+class FrameSource:
+    """
+    Decodes, resizes and converts the frames of a video capture on a producer thread
+    The frames are kept in a bounded queue of queue_depth ready frames so the tracking loop only consumes them
+    Only every skip_frames-th frame is decoded, the frames in between are grabbed without being retrieved
+    or jumped over with a seek when there are more than seek_threshold of them
+    The display, tracking and output resolutions are ratios of the original resolution,
+    display_ratio=None does not make a display frame and output_ratio=None does not make an output image
+    The decode, resize and color conversion stages are timed by the profiler
+    """
+
+    def __init__(self, cap, display_ratio=1.0, skip_frames=1, queue_depth=8, start_pos=0, seek_threshold=50,
+                 track_ratio=None, track_gray=False, output_ratio=1.0, profiler=None):
+        self.cap = cap
+        self.profiler = profiler or null_profiler
+        self.display_ratio = display_ratio
+        # by default the trackers run on the displayed frame
+        self.track_ratio = track_ratio if track_ratio is not None else (display_ratio or 1.0)
+        self.track_gray = track_gray
+        self.output_ratio = output_ratio
+        self.skip_frames = skip_frames
+        self.seek_threshold = seek_threshold
+        self.queue = Queue(maxsize=max(1, queue_depth))
+        self.index = start_pos
+        # number of reads and the number of times (and seconds) the consumer waited on the decoder
+        self.reads = 0
+        self.stalls = 0
+        self.stall_time = 0.0
+        # decode cost actually paid: decoded, grabbed and seeked over frames and the seconds spent on them
+        self.decoded = 0
+        self.grabbed = 0
+        self.seeks = 0
+        self.spanned = 0
+        self.decode_time = 0.0
+        self.skip_time = 0.0
+        # the exception that stopped the producer, raised by read() after the frames before it
+        self.error = None
+        self.ended = False
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.produce, daemon=True)
+        self.thread.start()
+
+    def decode(self, n):
+        # skip n - 1 frames without decoding them to images and read the n-th frame
+        start = time.perf_counter()
+        skip = n - 1
+        if 0 < self.seek_threshold < skip:
+            # jump to the frame, the decoder only has to start from the closest keyframe
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, self.index + skip)
+            self.seeks += 1
+        else:
+            for _ in range(skip):
+                if not self.cap.grab():
+                    return False, None
+                self.grabbed += 1
+        read_start = time.perf_counter()
+        self.skip_time += read_start - start
+        ret, frame = self.cap.read()
+        end = time.perf_counter()
+        if skip > 0:
+            self.profiler.add("skip", start, read_start)
+        self.profiler.add("decode", read_start, end)
+        if ret:
+            self.spanned += n
+            self.decoded += 1
+            self.decode_time += end - read_start
+        return ret, frame
+
+    def put(self, item):
+        # wait for a free slot in the queue, but give up when the source is stopped
+        while not self.stopped.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return
+            except Full:
+                continue
+
+    def produce(self):
+        end = None
+        try:
+            n = 1
+            while not self.stopped.is_set():
+                ret, frame = self.decode(n)
+                if not ret:
+                    break
+                self.put(self.prepare(self.index + n - 1, frame))
+                self.index += n
+                n = self.skip_frames
+        except Exception as e:
+            # the consumer gets the error instead of waiting for a frame that never comes
+            end = e
+        finally:
+            # None marks the end of the video
+            self.put(end)
+
+    def prepare(self, index, frame):
+        display = None
+        with self.profiler.stage("resize"):
+            if self.display_ratio is not None:
+                # resize the frame so that the width = frame_width px
+                display = cv2.resize(frame, None, fx=self.display_ratio, fy=self.display_ratio)
+            # the tracking frame is made from the display frame when it is small enough, which is cheaper
+            base, base_ratio = frame, 1.0
+            if display is not None and self.track_ratio <= self.display_ratio:
+                base, base_ratio = display, self.display_ratio
+            track = resize(base, self.track_ratio / base_ratio)
+            image = resize(frame, self.output_ratio) if self.output_ratio is not None else None
+        with self.profiler.stage("convert"):
+            if self.track_gray:
+                track = cv2.cvtColor(track, cv2.COLOR_BGR2GRAY)
+            else:
+                # dlib requires the image format in rgb so cvt the BGR frame to RGB
+                track = cv2.cvtColor(track, cv2.COLOR_BGR2RGB)
+        return Frame(index, image, display, track)
+
+    def read(self):
+        """
+        Returns the next Frame or None at the end of the video
+        Raises the exception that stopped the decode thread
+        """
+        if not self.ended:
+            self.reads += 1
+            if self.queue.empty():
+                # the decoder has not kept up with the tracking loop
+                self.stalls += 1
+                start = time.perf_counter()
+                item = self.queue.get()
+                end = time.perf_counter()
+                self.stall_time += end - start
+                self.profiler.add("wait_decode", start, end)
+            else:
+                item = self.queue.get()
+            if isinstance(item, Frame):
+                return item
+            self.ended = True
+            self.error = item
+        if self.error is not None:
+            raise self.error
+        return None
+
+    def stop(self):
+        # stop the producer and release the video capture
+        self.stopped.set()
+        while True:
+            try:
+                self.queue.get_nowait()
+            except Empty:
+                break
+        self.thread.join()
+        self.cap.release()
+
+    def report(self):
+        print("frame source: %d reads, %d stalls waiting on decode (%0.1f%%), %0.2f s stalled" %
+              (self.reads, self.stalls, 100 * self.stalls / max(self.reads, 1), self.stall_time))
+        # compare the time spent with the time a full decode of every spanned frame would take
+        full_decode = self.spanned * self.decode_time / max(self.decoded, 1)
+        print("sampling: decoded %d of %d frames, %d grabbed, %d seeks, %0.2f s spent vs ~%0.2f s for a full decode" %
+              (self.decoded, self.spanned, self.grabbed, self.seeks, self.decode_time + self.skip_time, full_decode))
@@ -0,0 +1,120 @@
+import cv2
+import time
+from adaptive_sampler import FixedSampler
+from frame_source import FrameSource, get_resize_ratio, scale_box
+from profiler import null_profiler
+from tracker_backends import create_trackers
+
+
+def track_frames(input_vid, seeds, start_pos=None, end_frame=None, track_width=None, resize_above=0, skip_frames=1,
+                 queue_depth=8, seek_threshold=50, track_gray=False, output_width=None, tracker_workers=0,
+                 tracker="dlib", profiler=None, verbose=True, reseed=None):
+    """
+    Tracks the seed boxes through the video and yields every frame with its boxes
+    seeds: dictionary of frame index -> list of [class_id, x1, y1, x2, y2] in normalized coordinates
+    the trackers are (re)initialized with the latest seed on or before every frame, the frames from start_pos
+    (by default the first seed) up to end_frame (by default the end of the video) are yielded as
+    (Frame, boxes, seeded) where seeded is True when the trackers were restarted on the frame
+    reseed: called with every frame and its boxes, returns the boxes to restart the trackers with or None
+    """
+    profiler = profiler or null_profiler
+    seed_frames = sorted(seeds.keys())
+    if start_pos is None:
+        start_pos = seed_frames[0] if len(seed_frames) > 0 else 0
+    # the trackers of all the objects and the class id of every tracker, the tracker processes are forked
+    # before the decode thread is started
+    trackers = create_trackers(tracker, tracker_workers)
+    # initialize video capture
+    cap = cv2.VideoCapture(input_vid)
+    cap.set(cv2.CAP_PROP_POS_FRAMES, start_pos)
+    # the trackers run at track_width and the images are saved at output_width, there is no display frame
+    track_ratio = get_resize_ratio(cap, track_width, resize_above)
+    output_ratio = get_resize_ratio(cap, output_width)
+    # the frames are decoded, resized and converted on a separate thread
+    source = FrameSource(cap, None, skip_frames=skip_frames, queue_depth=queue_depth, start_pos=start_pos,
+                         seek_threshold=seek_threshold, track_ratio=track_ratio, track_gray=track_gray,
+                         output_ratio=output_ratio, profiler=profiler)
+    class_ids = []
+    next_seed = 0
+    try:
+        # read the first frame
+        item = source.read()
+        if item is None:
+            raise AssertionError("Could not read frame " + str(start_pos) + " of " + input_vid)
+        while item is not None and (end_frame is None or item.index < end_frame):
+            frame_index = item.index
+            h, w = item.track.shape[:2]
+            tracker_rgb = item.track
+            boxes = []
+            seeded = False
+            if next_seed < len(seed_frames) and frame_index >= seed_frames[next_seed]:
+                # skip over the seeds that were jumped over by skip_frames and use the latest one
+                while next_seed + 1 < len(seed_frames) and frame_index >= seed_frames[next_seed + 1]:
+                    next_seed += 1
+                # reinitialize the trackers with the seed boxes
+                seed = seeds[seed_frames[next_seed]]
+                class_ids = [s[0] for s in seed]
+                with profiler.stage("start", len(seed)):
+                    trackers.start(tracker_rgb, [scale_box(s[1:], w, h) for s in seed])
+                boxes = [list(s) for s in seed]
+                seeded = True
+                next_seed += 1
+            elif len(class_ids) > 0:
+                # update the trackers and get the positions of the tracked objects in the updated frame
+                with profiler.stage("track", len(class_ids)):
+                    positions = trackers.update(tracker_rgb)
+                boxes = [[class_id] + scale_box(pos, 1 / w, 1 / h) for class_id, pos in zip(class_ids, positions)]
+            if reseed is not None:
+                with profiler.stage("seed"):
+                    seed = reseed(item, boxes)
+                if seed is not None:
+                    class_ids = [s[0] for s in seed]
+                    with profiler.stage("start", len(seed)):
+                        trackers.start(tracker_rgb, [scale_box(s[1:], w, h) for s in seed])
+                    boxes = [list(s) for s in seed]
+                    seeded = True
+            yield item, boxes, seeded
+            profiler.frame()
+            # read the next frame
+            item = source.read()
+    finally:
+        source.stop()
+        if verbose:
+            source.report()
+        trackers.close()
+
+
+def run_headless(input_vid, writer, seeds, save_counter=0, save_every=1, track_width=None, resize_above=0,
+                 skip_frames=1, queue_depth=8, seek_threshold=50, track_gray=False, output_width=None,
+                 tracker_workers=0, tracker="dlib", profiler=None, sampler=None, reseed=None):
+    """
+    Runs the tracking pipeline without a window through the whole video
+    seeds: dictionary of frame index -> list of [class_id, x1, y1, x2, y2] in normalized coordinates
+    the trackers are (re)initialized on every seeded frame and the annotations are saved by the writer in the
+    same images/ and annotations/ layout as the interactive mode
+    profiler: times the decoding, the tracker updates and the writes
+    sampler: chooses the frames that are saved, by default every save_every-th frame
+    reseed: restarts the trackers with new boxes, see track_frames
+    """
+    sampler = sampler or FixedSampler(save_every)
+    start_number = save_counter
+    saved = 0
+    start_time = time.time()
+    for item, boxes, seeded in track_frames(input_vid, seeds, track_width=track_width, resize_above=resize_above,
+                                       skip_frames=skip_frames, queue_depth=queue_depth,
+                                       seek_threshold=seek_threshold, track_gray=track_gray,
+                                       output_width=output_width, tracker_workers=tracker_workers, tracker=tracker,
+                                       profiler=profiler, reseed=reseed):
+        if seeded:
+            sampler.reset()
+        # check if the sampler saves the frame
+        if len(boxes) > 0 and sampler.should_save(save_counter, item.index, boxes, item.track):
+            if writer.submit(save_counter, item.image, boxes, item.index):
+                saved += 1
+        save_counter += skip_frames
+    elapsed = time.time() - start_time
+    processed = (save_counter - start_number) // skip_frames
+    print("processed %d frames in %0.2f s (%0.1f fps), saved %d annotations" %
+          (processed, elapsed, processed / max(elapsed, 1e-6), saved))
+    sampler.report()
+    return save_counter
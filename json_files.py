@@ -0,0 +1,10 @@
+import json
+import os
+
+
+def write_json_atomic(path, data, indent=None):
+    # the file is written to a temporary file and renamed so a crash never leaves half of it
+    temp = path + ".tmp"
+    with open(temp, 'w') as f:
+        json.dump(data, f, indent=indent)
+    os.replace(temp, path)
@@ -0,0 +1,198 @@
+import numpy as np
+from box_utils import iou
+
+
+def interpolate_boxes(key_frames, key_boxes, frames, method="linear"):
+    """
+    Interpolates the boxes of all the objects between keyframes at once
+    key_frames: increasing frame indices of the K keyframes
+    key_boxes: array of shape (K, N, 4) with the boxes of N objects on every keyframe, nan where an object is missing
+    frames: the M frame indices to interpolate, between the first and the last keyframe
+    method: linear, or spline for a cubic hermite spline through the keyframes
+    Returns an array of shape (M, N, 4), nan where an object is missing on one of the surrounding keyframes
+    """
+    f = np.asarray(key_frames, dtype=np.float64)
+    P = np.asarray(key_boxes, dtype=np.float64)
+    frames = np.asarray(frames, dtype=np.float64)
+    if len(f) == 1:
+        return np.repeat(P[:1], len(frames), axis=0)
+    # the segment of every frame and the position inside the segment
+    seg = np.clip(np.searchsorted(f, frames, side="right") - 1, 0, len(f) - 2)
+    gap = (f[seg + 1] - f[seg])[:, None, None]
+    t = (frames - f[seg])[:, None, None] / gap
+    p1, p2 = P[seg], P[seg + 1]
+    if method == "linear":
+        return p1 + t * (p2 - p1)
+    # the tangents are the averaged slopes of the neighbouring segments, or the one slope that is known
+    d = (P[1:] - P[:-1]) / (f[1:] - f[:-1])[:, None, None]
+    m = np.empty_like(P)
+    m[0], m[-1] = d[0], d[-1]
+    left, right = d[:-1], d[1:]
+    m[1:-1] = np.where(np.isnan(left), right, np.where(np.isnan(right), left, (left + right) / 2))
+    m1, m2 = m[seg] * gap, m[seg + 1] * gap
+    # cubic hermite basis functions
+    t2, t3 = t * t, t * t * t
+    return (2 * t3 - 3 * t2 + 1) * p1 + (t3 - 2 * t2 + t) * m1 + (-2 * t3 + 3 * t2) * p2 + (t3 - t2) * m2
+
+
+def match_boxes(old, new):
+    """
+    Greedily pairs the boxes of the same class by the distance of their centers
+    old, new: lists of [class_id, x1, y1, x2, y2]
+    Returns a list of (old index, new index) pairs
+    """
+    if len(old) == 0 or len(new) == 0:
+        return []
+    old_a, new_a = np.asarray(old, dtype=np.float64), np.asarray(new, dtype=np.float64)
+    old_c = (old_a[:, 1:3] + old_a[:, 3:5]) / 2
+    new_c = (new_a[:, 1:3] + new_a[:, 3:5]) / 2
+    dist = np.linalg.norm(old_c[:, None, :] - new_c[None, :, :], axis=2)
+    # boxes of different classes are never paired
+    dist[old_a[:, None, 0] != new_a[None, :, 0]] = np.inf
+    pairs = []
+    for flat in np.argsort(dist, axis=None):
+        i, j = np.unravel_index(flat, dist.shape)
+        if np.isinf(dist[i, j]):
+            break
+        if all(i != a and j != b for a, b in pairs):
+            pairs.append((int(i), int(j)))
+    return pairs
+
+
+class KeyframeAnnotator:
+    """
+    Collects the boxes drawn on keyframes and fills the boxes of the frames in between by interpolation
+    The frames to save are buffered until the keyframes around them are known
+    With a tracker, the tracker runs over the buffered frames of every segment and its box replaces the
+    interpolated box on the frames where the two disagree (IoU below verify_iou)
+    """
+
+    def __init__(self, method="linear", trackers=None, verify_iou=0.0):
+        self.method = method
+        self.trackers = trackers
+        self.verify_iou = verify_iou
+        self.key_frames = []
+        # every track is the class id and a dictionary of keyframe index -> normalized box
+        self.tracks = []
+        self.last_boxes = []
+        self.last_tracks = []
+        # the track images of the keyframes are kept to start the verification tracker
+        self.key_images = {}
+        # buffered frames: index, save_counter, image, track image
+        self.pending = []
+        self.corrected = 0
+
+    @property
+    def last_index(self):
+        return self.key_frames[-1] if len(self.key_frames) > 0 else None
+
+    def buffer(self, index, save_counter, image, track):
+        self.pending.append((index, save_counter, image, track))
+
+    def add_keyframe(self, index, boxes, track=None):
+        """
+        Adds the boxes [class_id, x1, y1, x2, y2] in normalized coordinates of a keyframe
+        Returns the frames that can be saved now as a list of (save_counter, image, boxes, frame index)
+        """
+        if len(self.key_frames) > 0 and index <= self.key_frames[-1]:
+            # the same keyframe was edited again, its boxes are replaced
+            for t in self.tracks:
+                t[1].pop(self.key_frames[-1], None)
+            self.key_frames.pop()
+            self.last_boxes, self.last_tracks = self.previous_keyframe()
+        # connect the boxes to the tracks of the previous keyframe
+        pairs = dict((j, i) for i, j in match_boxes(self.last_boxes, boxes))
+        track_ids = []
+        for j, box in enumerate(boxes):
+            if j in pairs:
+                track_id = self.last_tracks[pairs[j]]
+            else:
+                self.tracks.append([box[0], {}])
+                track_id = len(self.tracks) - 1
+            self.tracks[track_id][1][index] = list(box[1:])
+            track_ids.append(track_id)
+        self.key_frames.append(index)
+        self.last_boxes, self.last_tracks = [list(b) for b in boxes], track_ids
+        if track is not None:
+            self.key_images[index] = track
+        if self.method == "linear":
+            return self.flush(self.key_frames[-1])
+        # with a spline the last segment changes with the next keyframe, so it waits for it
+        return self.flush(self.key_frames[-2] if len(self.key_frames) > 1 else None)
+
+    def previous_keyframe(self):
+        if len(self.key_frames) == 0:
+            return [], []
+        index = self.key_frames[-1]
+        ids = [i for i, t in enumerate(self.tracks) if index in t[1]]
+        return [[self.tracks[i][0]] + self.tracks[i][1][index] for i in ids], ids
+
+    def finish(self):
+        # the frames after the last keyframe have no boxes to interpolate to and are dropped
+        return self.flush(self.last_index)
+
+    def flush(self, done):
+        if done is None:
+            return []
+        ready = [p for p in self.pending if p[0] <= done]
+        self.pending = [p for p in self.pending if p[0] > done]
+        if len(ready) == 0:
+            return []
+        key_frames = np.asarray(self.key_frames)
+        key_boxes = np.full((len(key_frames), len(self.tracks), 4), np.nan)
+        for n, (class_id, boxes) in enumerate(self.tracks):
+            for k, index in enumerate(self.key_frames):
+                if index in boxes:
+                    key_boxes[k, n] = boxes[index]
+        frames = [p[0] for p in ready]
+        inside = [i for i, index in enumerate(frames) if index >= key_frames[0]]
+        boxes = interpolate_boxes(key_frames, key_boxes, [frames[i] for i in inside], self.method)
+        results = []
+        for i, frame_boxes in zip(inside, boxes):
+            index, save_counter, image, track = ready[i]
+            results.append([index, save_counter, image, track, frame_boxes])
+        if self.trackers is not None and self.verify_iou > 0:
+            self.verify(results)
+        saved = []
+        for index, save_counter, image, track, frame_boxes in results:
+            labels = [[self.tracks[n][0]] + box.tolist() for n, box in enumerate(frame_boxes)
+                      if not np.isnan(box).any()]
+            if len(labels) > 0:
+                saved.append((save_counter, image, labels, index))
+        # forget the keyframe images that no segment needs anymore
+        for index in list(self.key_images.keys()):
+            if index < done:
+                del self.key_images[index]
+        return saved
+
+    def verify(self, results):
+        # run the tracker through the buffered frames of every segment, starting from its first keyframe
+        key_frames = np.asarray(self.key_frames)
+        segment = None
+        valid = []
+        for frame in results:
+            index, track, frame_boxes = frame[0], frame[3], frame[4]
+            h, w = track.shape[:2]
+            start = key_frames[np.searchsorted(key_frames, index, side="right") - 1]
+            if start != segment:
+                segment = start
+                start_boxes = np.asarray([t[1].get(start, [np.nan] * 4) for t in self.tracks], dtype=np.float64)
+                valid = [n for n in range(len(self.tracks)) if not np.isnan(start_boxes[n]).any()]
+                if start not in self.key_images or len(valid) == 0:
+                    valid = []
+                    continue
+                self.trackers.start(self.key_images[start], [(start_boxes[n] * [w, h, w, h]).tolist() for n in valid])
+                if index == start:
+                    continue
+            if len(valid) == 0:
+                continue
+            tracked = np.asarray(self.trackers.update(track), dtype=np.float64) / [w, h, w, h]
+            overlap = iou(tracked, frame_boxes[valid])
+            for k, n in enumerate(valid):
+                if not np.isnan(frame_boxes[n]).any() and overlap[k] < self.verify_iou:
+                    frame_boxes[n] = tracked[k]
+                    self.corrected += 1
+
+    def report(self):
+        print("keyframes: %d keyframes, %d objects, %d interpolated boxes replaced by the tracker" %
+              (len(self.key_frames), len(self.tracks), self.corrected))
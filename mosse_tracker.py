@@ -0,0 +1,97 @@
+import cv2
+import numpy as np
+
+
+def gaussian_response(size, sigma):
+    # the desired correlation output, a peak at the center of the patch
+    grid = np.arange(size) - size // 2
+    g = np.exp(-(grid[:, None] ** 2 + grid[None, :] ** 2) / (2 * sigma ** 2))
+    return np.fft.fft2(g).astype(np.complex64)
+
+
+class BatchedMosseTrackers:
+    """
+    MOSSE correlation filter trackers of all the boxes updated together in one batched pass per frame
+    Every target is sampled to a patch of size x size pixels so the patches, filters and FFTs of all the
+    targets are stacked arrays, the cost per object is a few small FFTs instead of a full tracker update
+    The box size is kept from the start, only the position is tracked
+    """
+
+    def __init__(self, size=64, padding=2.0, learning_rate=0.125, sigma=2.0, eps=1e-5):
+        self.size = size
+        self.padding = padding
+        self.learning_rate = learning_rate
+        self.eps = eps
+        self.G = gaussian_response(size, sigma)
+        self.window = np.outer(np.hanning(size), np.hanning(size)).astype(np.float32)
+        # sampling offsets of the patch pixels relative to the center, in fractions of the search window
+        self.grid = ((np.arange(size) - size // 2) / size).astype(np.float32)
+        self.centers = np.zeros((0, 2))
+        self.sizes = np.zeros((0, 2))
+        self.A = None
+        self.B = None
+        # peak to sidelobe ratio of the last update, low values mean the target is probably lost
+        self.confidence = np.zeros(0)
+
+    def gray(self, image):
+        if image.ndim == 3:
+            image = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+        return image.astype(np.float32)
+
+    def sample(self, image):
+        # cut out the search windows of all the targets with a single remap into a stack of patches
+        n, s = len(self.centers), self.size
+        windows = self.sizes * self.padding
+        xs = self.centers[:, 0:1] + self.grid[None, :] * windows[:, 0:1]
+        ys = self.centers[:, 1:2] + self.grid[None, :] * windows[:, 1:2]
+        map_x = np.broadcast_to(xs[:, None, :], (n, s, s)).reshape(n * s, s).astype(np.float32)
+        map_y = np.broadcast_to(ys[:, :, None], (n, s, s)).reshape(n * s, s).astype(np.float32)
+        patches = cv2.remap(image, map_x, map_y, cv2.INTER_LINEAR, borderMode=cv2.BORDER_REFLECT)
+        patches = np.log1p(patches.reshape(n, s, s))
+        # normalize every patch to zero mean and unit deviation and taper the borders
+        patches -= patches.mean(axis=(1, 2), keepdims=True)
+        patches /= patches.std(axis=(1, 2), keepdims=True) + self.eps
+        return np.fft.fft2(patches * self.window, axes=(1, 2))
+
+    def boxes(self):
+        half = self.sizes / 2
+        return np.hstack([self.centers - half, self.centers + half]).tolist()
+
+    def start(self, image, boxes):
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        self.centers = (boxes[:, :2] + boxes[:, 2:]) / 2
+        self.sizes = np.maximum(boxes[:, 2:] - boxes[:, :2], 1)
+        self.confidence = np.zeros(len(boxes))
+        if len(boxes) == 0:
+            return []
+        F = self.sample(self.gray(image))
+        self.A = self.G * np.conj(F)
+        self.B = F * np.conj(F)
+        return self.boxes()
+
+    def update(self, image):
+        if len(self.centers) == 0:
+            return []
+        image = self.gray(image)
+        s = self.size
+        # correlate all the filters with their search windows at once
+        F = self.sample(image)
+        response = np.fft.ifft2(self.A / (self.B + self.eps) * F, axes=(1, 2)).real
+        flat = response.reshape(len(response), -1)
+        peak = flat.argmax(axis=1)
+        dy, dx = np.divmod(peak, s)
+        # move the centers by the offset of the peaks scaled from the patch to the search window
+        shift = np.stack([dx - s // 2, dy - s // 2], axis=1) / s
+        self.centers = self.centers + shift * self.sizes * self.padding
+        peak_values = flat[np.arange(len(flat)), peak]
+        self.confidence = (peak_values - flat.mean(axis=1)) / (flat.std(axis=1) + self.eps)
+        # train the filters on the windows around the new positions
+        F = self.sample(image)
+        rate = self.learning_rate
+        self.A = rate * self.G * np.conj(F) + (1 - rate) * self.A
+        self.B = rate * F * np.conj(F) + (1 - rate) * self.B
+        return self.boxes()
+
+    def close(self):
+        self.A = None
+        self.B = None
@@ -0,0 +1,126 @@
+import cv2
+import numpy as np
+
+
+class GridIndex:
+    """
+    Buckets the boxes into the cells of a regular grid so the boxes under a point are found by looking
+    at the boxes of one cell instead of all the boxes
+    boxes: array of shape (N, 4) with x_left, y_top, x_right, y_bottom in pixels
+    """
+
+    def __init__(self, boxes, cell=64):
+        self.cell = cell
+        self.boxes = np.asarray(boxes, dtype=np.int64).reshape(-1, 4)
+        self.cells = {}
+        for i, (x1, y1, x2, y2) in enumerate(self.boxes):
+            for cx in range(x1 // cell, x2 // cell + 1):
+                for cy in range(y1 // cell, y2 // cell + 1):
+                    self.cells.setdefault((cx, cy), []).append(i)
+
+    def query(self, x, y):
+        # the indices of the boxes that contain the point
+        found = []
+        for i in self.cells.get((x // self.cell, y // self.cell), []):
+            x1, y1, x2, y2 = self.boxes[i]
+            if x1 < x < x2 and y1 < y < y2:
+                found.append(i)
+        return found
+
+
+class BoxOverlay:
+    """
+    Draws the boxes and class names over the frame for the mouse callback
+    The frame with the boxes is rendered once when the frame or the boxes change, every mouse event only
+    restores the regions changed by the previous event (highlight, cross lines and the dragged rectangle)
+    and draws them again at the new position
+    """
+
+    def __init__(self, colors, highlight=190, cell=64):
+        self.colors = colors
+        self.highlight = highlight
+        self.cell = cell
+        self.frame = None
+        self.keys = []
+        self.boxes = np.zeros((0, 4), dtype=np.int64)
+        self.layer = None
+        self.canvas = None
+        self.index = None
+        self.dirty = []
+
+    def set_frame(self, frame):
+        self.frame = frame
+        self.layer = None
+
+    def set_boxes(self, boxes):
+        """
+        boxes: dictionary of class name -> list of [x1, y1, x2, y2] in the frame pixels
+        """
+        self.keys = [(key, ind) for key, val in boxes.items() for ind in range(len(val))]
+        self.boxes = np.asarray([v for val in boxes.values() for v in val], dtype=np.int64).reshape(-1, 4)
+        self.layer = None
+        self.index = None
+
+    def clip(self, x1, y1, x2, y2):
+        h, w = self.frame.shape[:2]
+        return max(0, min(x1, w)), max(0, min(y1, h)), max(0, min(x2, w)), max(0, min(y2, h))
+
+    def query(self, x, y):
+        # the indices of the boxes under the point, the index is built again after the boxes change
+        if self.index is None:
+            self.index = GridIndex([self.clip(*box) for box in self.boxes.tolist()], self.cell)
+        return self.index.query(x, y)
+
+    def hit(self, x, y):
+        """
+        The (class name, index) of the boxes under the point
+        """
+        return [self.keys[i] for i in self.query(x, y)]
+
+    def smallest_at(self, x, y):
+        # the box under the point with the smallest area, None when there is no box
+        found = self.query(x, y)
+        if len(found) == 0:
+            return None
+        areas = [(self.boxes[i, 2] - self.boxes[i, 0]) * (self.boxes[i, 3] - self.boxes[i, 1]) for i in found]
+        return self.keys[found[int(np.argmin(areas))]]
+
+    def build(self):
+        self.layer = self.frame.copy()
+        for (key, _), (x1, y1, x2, y2) in zip(self.keys, self.boxes.tolist()):
+            cv2.rectangle(self.layer, (x1, y1), (x2, y2), self.colors["track"])
+            cv2.putText(self.layer, key, (x1, y1), cv2.FONT_HERSHEY_SIMPLEX, 0.5, self.colors["text"], thickness=2)
+        self.canvas = self.layer.copy()
+        self.dirty = []
+
+    def mark(self, x1, y1, x2, y2):
+        x1, y1, x2, y2 = self.clip(x1, y1, x2, y2)
+        if x2 > x1 and y2 > y1:
+            self.dirty.append((x1, y1, x2, y2))
+        return x1, y1, x2, y2
+
+    def render(self, x, y, cross=False, drag_start=None):
+        """
+        Returns the frame with the boxes, the highlight of the boxes under x, y, the cross lines through x, y
+        when cross is set and the rectangle from drag_start to x, y when it is given
+        """
+        if self.layer is None:
+            self.build()
+        # restore the regions drawn by the previous call
+        for x1, y1, x2, y2 in self.dirty:
+            self.canvas[y1:y2, x1:x2] = self.layer[y1:y2, x1:x2]
+        self.dirty = []
+        h, w = self.canvas.shape[:2]
+        for i in self.query(x, y):
+            x1, y1, x2, y2 = self.mark(*self.boxes[i].tolist())
+            self.canvas[y1:y2, x1:x2, 0] = self.highlight
+        if cross:
+            cv2.line(self.canvas, (x, 0), (x, h), self.colors["line"])
+            cv2.line(self.canvas, (0, y), (w, y), self.colors["line"])
+            self.mark(x, 0, x + 1, h)
+            self.mark(0, y, w, y + 1)
+        if drag_start is not None:
+            sx, sy = drag_start
+            cv2.rectangle(self.canvas, (sx, sy), (x, y), self.colors["drag"])
+            self.mark(min(sx, x), min(sy, y), max(sx, x) + 1, max(sy, y) + 1)
+        return self.canvas
@@ -0,0 +1,148 @@
+import dlib
+import numpy as np
+from multiprocessing import shared_memory
+from worker_processes import mp_context
+
+# the trackers of a frame are updated together: start(image, boxes) initializes one tracker per box and
+# update(image) returns the new boxes in the same order, boxes are x_left, y_top, x_right, y_bottom in pixels
+
+
+def to_rect(box):
+    return dlib.rectangle(*[int(round(v)) for v in box])
+
+
+def from_rect(pos):
+    return [pos.left(), pos.top(), pos.right(), pos.bottom()]
+
+
+class DlibTrackers:
+    """
+    Updates one dlib correlation tracker per box one after another in this process
+    """
+
+    def __init__(self):
+        self.trackers = []
+
+    def start(self, image, boxes):
+        self.trackers = []
+        for box in boxes:
+            self.trackers.append(dlib.correlation_tracker())
+            self.trackers[-1].start_track(image, to_rect(box))
+        return [list(box) for box in boxes]
+
+    def update(self, image):
+        positions = []
+        for dlib_tracker in self.trackers:
+            dlib_tracker.update(image)
+            positions.append(from_rect(dlib_tracker.get_position()))
+        return positions
+
+    def close(self):
+        self.trackers = []
+
+
+def attach(name):
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        # the main process owns the shared memory, the workers must not unlink it when they exit
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(shm._name, "shared_memory")
+    except Exception:
+        pass
+    return shm
+
+
+def tracker_worker(conn):
+    # a worker owns a shard of the trackers and reads the frames from the shared memory of the main process
+    shm = None
+    trackers = DlibTrackers()
+    while True:
+        message = conn.recv()
+        if message[0] == "close":
+            break
+        command, name, shape, dtype, boxes = message
+        if shm is None or shm.name != name:
+            if shm is not None:
+                shm.close()
+            shm = attach(name)
+        image = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+        if command == "start":
+            conn.send(trackers.start(image, boxes))
+        else:
+            conn.send(trackers.update(image))
+        # release the view on the shared buffer so it can be closed
+        del image
+    if shm is not None:
+        shm.close()
+    conn.close()
+
+
+class ParallelDlibTrackers:
+    """
+    Shards the dlib correlation trackers over a pool of worker processes
+    The frame is copied once into shared memory instead of being pickled for every worker
+    and the boxes are returned in the same order as they were started
+    """
+
+    def __init__(self, workers):
+        self.workers = workers
+        self.connections = []
+        self.processes = []
+        for _ in range(workers):
+            parent, child = mp_context.Pipe()
+            process = mp_context.Process(target=tracker_worker, args=(child,), daemon=True)
+            process.start()
+            self.connections.append(parent)
+            self.processes.append(process)
+        self.shm = None
+        self.shared_image = None
+        # the indices of the boxes that are tracked by every worker
+        self.shards = [[] for _ in range(workers)]
+        self.count = 0
+
+    def share(self, image):
+        # copy the frame into the shared memory, which is reallocated when the frame size changes
+        if self.shared_image is None or self.shared_image.shape != image.shape or \
+                self.shared_image.dtype != image.dtype:
+            self.release()
+            self.shm = shared_memory.SharedMemory(create=True, size=image.nbytes)
+            self.shared_image = np.ndarray(image.shape, dtype=image.dtype, buffer=self.shm.buf)
+        np.copyto(self.shared_image, image)
+        return self.shm.name, image.shape, image.dtype.str
+
+    def run(self, command, image, shard_boxes):
+        name, shape, dtype = self.share(image)
+        # all the workers run at the same time, workers without boxes answer right away
+        for conn, boxes in zip(self.connections, shard_boxes):
+            conn.send((command, name, shape, dtype, boxes))
+        # put the boxes of every shard back in the original order
+        positions = [None] * self.count
+        for conn, shard in zip(self.connections, self.shards):
+            for ind, box in zip(shard, conn.recv()):
+                positions[ind] = box
+        return positions
+
+    def start(self, image, boxes):
+        self.count = len(boxes)
+        # deal the boxes to the workers round robin so every worker gets about the same number of trackers
+        self.shards = [list(range(i, self.count, self.workers)) for i in range(self.workers)]
+        return self.run("start", image, [[list(boxes[ind]) for ind in shard] for shard in self.shards])
+
+    def update(self, image):
+        return self.run("update", image, [None] * self.workers)
+
+    def release(self):
+        if self.shm is not None:
+            self.shared_image = None
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+
+    def close(self):
+        for conn in self.connections:
+            conn.send(("close",))
+        for process in self.processes:
+            process.join()
+        self.connections = []
+        self.processes = []
+        self.release()
@@ -0,0 +1,232 @@
+import csv
+import cv2
+import json
+import os
+import threading
+import time
+from collections import deque
+
+profile_formats = ["json", "csv", "chrome"]
+
+
+def add_profiler_arguments(parser):
+    # command line arguments shared by the scripts that can be profiled
+    parser.add_argument("--profile", action="store_true", required=False,
+                        help="time every stage of the pipeline, show the frame rate in the window and print a summary")
+    parser.add_argument("--profile_output", default=None, required=False,
+                        help="file to save the profile to, implies --profile")
+    parser.add_argument("--profile_format", default="json", choices=profile_formats, required=False,
+                        help="json saves the totals of every stage, csv every timed event and chrome a trace for "
+                             "chrome://tracing or perfetto")
+
+
+def profiler_from_args(args):
+    if not args.profile and args.profile_output is None:
+        return null_profiler
+    # the single events are only kept when they are saved
+    keep_events = args.profile_output is not None and args.profile_format != "json"
+    return Profiler(keep_events=keep_events)
+
+
+class StageTimer:
+    __slots__ = ["profiler", "name", "objects", "start"]
+
+    def __init__(self, profiler, name, objects):
+        self.profiler = profiler
+        self.name = name
+        self.objects = objects
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.add(self.name, self.start, time.perf_counter(), self.objects)
+
+
+class Profiler:
+    """
+    Times the stages of the pipeline on all the threads
+    with profiler.stage("decode"): ... adds the time of the block to the stage, objects is the number of
+    objects handled in the block, for example the boxes of a tracker update, to report the average time per object
+    of the stage, which is the time of the whole block divided by the objects and not the time of one object
+    frame() marks the end of a frame of the main loop for the frame rate
+    """
+
+    enabled = True
+
+    def __init__(self, keep_events=False, window=2.0):
+        self.origin = time.perf_counter()
+        self.keep_events = keep_events
+        self.window = window
+        self.lock = threading.Lock()
+        # stage -> [count, seconds, longest, objects]
+        self.totals = {}
+        # stage, thread, start and duration of every event when they are kept
+        self.events = []
+        self.threads = {}
+        # the events and frames of the last window seconds for the live display
+        self.recent = deque()
+        self.frame_times = deque()
+        self.frames = 0
+        self.hud_lines = []
+        self.hud_time = 0.0
+
+    def stage(self, name, objects=0):
+        return StageTimer(self, name, objects)
+
+    def add(self, name, start, end, objects=0):
+        duration = end - start
+        with self.lock:
+            total = self.totals.get(name)
+            if total is None:
+                total = self.totals[name] = [0, 0.0, 0.0, 0]
+            total[0] += 1
+            total[1] += duration
+            total[2] = max(total[2], duration)
+            total[3] += objects
+            self.recent.append((end, name, duration))
+            # the old events are dropped here too so the queue stays short when nothing is displayed
+            while end - self.recent[0][0] > self.window:
+                self.recent.popleft()
+            if self.keep_events:
+                thread = threading.get_ident()
+                if thread not in self.threads:
+                    self.threads[thread] = threading.current_thread().name
+                self.events.append((name, thread, start - self.origin, duration))
+
+    def frame(self):
+        now = time.perf_counter()
+        self.frames += 1
+        self.frame_times.append(now)
+        while now - self.frame_times[0] > self.window:
+            self.frame_times.popleft()
+
+    def live_stats(self):
+        # frame rate and milliseconds per frame of every stage over the last window seconds
+        now = time.perf_counter()
+        with self.lock:
+            while len(self.recent) > 0 and now - self.recent[0][0] > self.window:
+                self.recent.popleft()
+            recent = list(self.recent)
+        frames = max(len(self.frame_times) - 1, 1)
+        span = self.frame_times[-1] - self.frame_times[0] if len(self.frame_times) > 1 else 0.0
+        fps = (len(self.frame_times) - 1) / span if span > 0 else 0.0
+        stages = {}
+        for _, name, duration in recent:
+            stages[name] = stages.get(name, 0.0) + duration
+        return fps, 1000 * span / frames, {name: 1000 * total / frames for name, total in stages.items()}
+
+    def draw_hud(self, image):
+        """
+        Draws the frame rate, the frame time and the time of every stage per frame on the image
+        """
+        now = time.perf_counter()
+        # the text is only computed again a few times per second
+        if now - self.hud_time > 0.25:
+            self.hud_time = now
+            fps, frame_ms, stages = self.live_stats()
+            self.hud_lines = ["%0.1f fps  %0.1f ms/frame" % (fps, frame_ms)]
+            for name, ms in sorted(stages.items(), key=lambda s: -s[1]):
+                self.hud_lines.append("%-10s %6.2f ms" % (name, ms))
+        for i, line in enumerate(self.hud_lines):
+            y = 18 + 16 * i
+            cv2.putText(image, line, (8, y), cv2.FONT_HERSHEY_SIMPLEX, 0.45, (0, 0, 0), thickness=3)
+            cv2.putText(image, line, (8, y), cv2.FONT_HERSHEY_SIMPLEX, 0.45, (255, 255, 255), thickness=1)
+
+    def summary(self):
+        elapsed = time.perf_counter() - self.origin
+        with self.lock:
+            totals = dict((k, list(v)) for k, v in self.totals.items())
+        stages = {}
+        for name, (count, seconds, longest, objects) in totals.items():
+            stages[name] = {"count": count, "total_s": seconds, "mean_ms": 1000 * seconds / max(count, 1),
+                            "max_ms": 1000 * longest, "per_frame_ms": 1000 * seconds / max(self.frames, 1)}
+            if objects > 0:
+                stages[name]["mean_per_object_ms"] = 1000 * seconds / objects
+        return {"frames": self.frames, "elapsed_s": elapsed, "fps": self.frames / max(elapsed, 1e-9),
+                "stages": stages}
+
+    def report(self):
+        summary = self.summary()
+        print("profile: %d frames in %0.2f s (%0.1f fps)" % (summary["frames"], summary["elapsed_s"], summary["fps"]))
+        print("%-14s %8s %10s %10s %10s %12s %13s" %
+              ("stage", "count", "total s", "mean ms", "max ms", "ms / frame", "avg ms / obj"))
+        for name, s in sorted(summary["stages"].items(), key=lambda s: -s[1]["total_s"]):
+            per_object = "%13.4f" % s["mean_per_object_ms"] if "mean_per_object_ms" in s else "%13s" % "-"
+            print("%-14s %8d %10.3f %10.3f %10.3f %12.3f %s" %
+                  (name, s["count"], s["total_s"], s["mean_ms"], s["max_ms"], s["per_frame_ms"], per_object))
+
+    def export(self, path, fmt="json"):
+        if fmt not in profile_formats:
+            raise AssertionError("The profile format should be one of " + ", ".join(profile_formats))
+        with self.lock:
+            events = list(self.events)
+            threads = dict(self.threads)
+        if fmt == "json":
+            with open(path, 'w') as f:
+                json.dump(self.summary(), f, indent=2)
+        elif fmt == "csv":
+            with open(path, 'w', newline='') as f:
+                out = csv.writer(f)
+                out.writerow(["stage", "thread", "start_ms", "duration_ms"])
+                for name, thread, start, duration in events:
+                    out.writerow([name, threads[thread], "%0.4f" % (1000 * start), "%0.4f" % (1000 * duration)])
+        else:
+            # complete events of the chrome trace event format, the times are in microseconds
+            pid = os.getpid()
+            trace = [{"name": "thread_name", "ph": "M", "pid": pid, "tid": thread, "args": {"name": name}}
+                     for thread, name in threads.items()]
+            trace += [{"name": name, "cat": "stage", "ph": "X", "pid": pid, "tid": thread,
+                       "ts": round(1e6 * start, 1), "dur": round(1e6 * duration, 1)}
+                      for name, thread, start, duration in events]
+            with open(path, 'w') as f:
+                json.dump({"traceEvents": trace, "displayTimeUnit": "ms"}, f)
+        print("saved the profile to", path)
+
+
+class NullTimer:
+    __slots__ = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+class NullProfiler:
+    """
+    The profiler used when profiling is off, every call does nothing
+    """
+
+    enabled = False
+    timer = NullTimer()
+
+    def stage(self, name, objects=0):
+        return self.timer
+
+    def add(self, name, start, end, objects=0):
+        pass
+
+    def frame(self):
+        pass
+
+    def draw_hud(self, image):
+        pass
+
+    def report(self):
+        pass
+
+    def export(self, path, fmt="json"):
+        pass
+
+
+null_profiler = NullProfiler()
+
+
+def save_profile(profiler, args):
+    # print the summary and save the profile when it was asked for
+    profiler.report()
+    if args.profile_output is not None:
+        profiler.export(args.profile_output, args.profile_format)
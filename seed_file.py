@@ -0,0 +1,93 @@
+import json
+import os
+
+# seed files describe the initial bounding boxes of one or more start frames for the headless mode
+#
+# json format (keys are frame indices of the video):
+# {
+#     "0": [{"class": "elephant", "box": [0.10, 0.20, 0.45, 0.80]}],
+#     "250": [{"class": 1, "pixel_box": [120, 40, 610, 300]}]
+# }
+# "box" is x_left, y_top, x_right, y_bottom normalized by the width and height of the video
+# "pixel_box" is the same rectangle in pixels of the original video
+#
+# yolo format:
+# a single .txt file in the yolo annotation format seeds the start frame
+# a directory of <frame_index>.txt files seeds every frame that has a file
+
+
+def yolo_to_corners(cx, cy, bw, bh):
+    # convert a yolo center-x, center-y, width, height box to x_left, y_top, x_right, y_bottom
+    return [cx - bw / 2, cy - bh / 2, cx + bw / 2, cy + bh / 2]
+
+
+def get_class_id(cls, classes):
+    # class ids can be given as numbers or as the class names passed with -c
+    if classes is None:
+        # the single class script only has one class
+        return 0
+    if isinstance(cls, int) or str(cls).isdigit():
+        class_id = int(cls)
+        if class_id >= len(classes):
+            raise AssertionError("The class id " + str(class_id) + " in the seed file is not in the classes")
+        return class_id
+    if cls not in classes:
+        raise AssertionError("The class " + str(cls) + " in the seed file is not in the classes")
+    return classes.index(cls)
+
+
+def read_yolo_seeds(path, classes):
+    boxes = []
+    with open(path) as f:
+        for line in f:
+            values = line.split()
+            if len(values) != 5:
+                continue
+            cx, cy, bw, bh = [float(v) for v in values[1:]]
+            boxes.append([get_class_id(values[0], classes)] + yolo_to_corners(cx, cy, bw, bh))
+    return boxes
+
+
+def read_json_seeds(path, classes, frame_size):
+    with open(path) as f:
+        data = json.load(f)
+    seeds = {}
+    for frame_index, objects in data.items():
+        boxes = []
+        for obj in objects:
+            if "box" in obj:
+                x1, y1, x2, y2 = obj["box"]
+            elif "pixel_box" in obj:
+                if frame_size is None:
+                    raise AssertionError("pixel_box seeds need the size of the video")
+                W, H = frame_size
+                x1, y1, x2, y2 = obj["pixel_box"]
+                x1, x2 = x1 / W, x2 / W
+                y1, y2 = y1 / H, y2 / H
+            else:
+                raise AssertionError("Every seed object needs either a box or a pixel_box")
+            boxes.append([get_class_id(obj.get("class", 0), classes), x1, y1, x2, y2])
+        seeds[int(frame_index)] = boxes
+    return seeds
+
+
+def load_seeds(path, classes=None, start_frame=0, frame_size=None):
+    """
+    Loads the seed boxes of a json file, a yolo .txt file or a directory of yolo .txt files
+    Returns a dictionary of frame index -> list of [class_id, x1, y1, x2, y2] in normalized coordinates
+    """
+    if os.path.isdir(path):
+        seeds = {}
+        for name in os.listdir(path):
+            stem, ext = os.path.splitext(name)
+            if ext == ".txt" and stem.isdigit():
+                seeds[int(stem)] = read_yolo_seeds(os.path.join(path, name), classes)
+    elif path.endswith(".json"):
+        seeds = read_json_seeds(path, classes, frame_size)
+    else:
+        seeds = {start_frame: read_yolo_seeds(path, classes)}
+    # frames without any boxes do not seed anything
+    seeds = {k: v for k, v in seeds.items() if len(v) > 0}
+    if len(seeds) == 0:
+        raise AssertionError("The seed file " + path + " does not contain any boxes")
+    return seeds
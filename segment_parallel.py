@@ -0,0 +1,333 @@
+import bisect
+import cv2
+import json
+import os
+import time
+from adaptive_sampler import FixedSampler
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from annotation_writer import AnnotationWriter
+from box_utils import iou_matrix
+from headless import track_frames
+from worker_processes import mp_context
+
+# a video is cut into segments of similar length that are tracked in parallel processes
+# the cuts are seeded frames where there are seeds close to them, the other segments are tracked from a few frames
+# before their cut with the boxes of a pass over every few frames, and the boxes of the frames where two segments
+# overlap are compared to choose where the boxes of the next segment are written from
+
+
+def grid_frame(frame, start_pos, skip_frames):
+    # the first frame on or after frame that a run from start_pos visits, it visits start_pos + k * skip_frames
+    return start_pos + -(-(frame - start_pos) // skip_frames) * skip_frames
+
+
+def plan_segments(first_frame, frame_count, segments, overlap, stride, seed_frames=()):
+    """
+    Cuts the frames from first_frame to frame_count into about `segments` ranges of similar length
+    A cut is moved to the seeded frame closest to it within half a segment, the segment starts from its seeds there,
+    the other cuts are on the grid of stride from first_frame and their segment is tracked from overlap frames
+    before the cut
+    seed_frames: the frames where a serial run starts the trackers from seeds
+    Returns a list of (track_start, start, end) frames, end is None for the last segment
+    """
+    length = max(frame_count - first_frame, 1)
+    step = length / segments
+    restarts = sorted(set(f for f in seed_frames if first_frame < f < frame_count))
+    cuts = [first_frame]
+    seeded = set()
+    for i in range(1, segments):
+        target = first_frame + i * step
+        near = [f for f in restarts if abs(f - target) <= step / 2 and f > cuts[-1]]
+        if len(near) > 0:
+            cut = min(near, key=lambda f: abs(f - target))
+            seeded.add(cut)
+        else:
+            cut = first_frame + int(round((target - first_frame) / stride)) * stride
+            # the overlap of a segment has to be inside the range of the previous one
+            if cut - overlap <= cuts[-1] or cut >= frame_count:
+                continue
+        cuts.append(cut)
+    return [(start if start in seeded else max(start - overlap, first_frame), start, end)
+            for start, end in zip(cuts, cuts[1:] + [None])]
+
+
+def estimate_boxes(input_vid, seeds, frames, stride, **options):
+    """
+    Tracks the seeds over every stride-th frame with the tracking options of the segments
+    Yields the frame and its boxes for each of the given frames, which are on the grid of stride from the first seed,
+    as soon as the pass reaches it
+    """
+    wanted = set(frames)
+    if len(wanted) == 0:
+        return
+    for item, boxes, _ in track_frames(input_vid, seeds, end_frame=max(wanted) + 1, verbose=False,
+                                       **dict(options, skip_frames=stride)):
+        if item.index in wanted:
+            yield item.index, boxes
+
+
+def track_segment(job):
+    """
+    Tracks one segment in a worker process and saves the images of its range
+    Returns the boxes of the saved frames, the boxes of the overlap before the range, of the last overlap frames of
+    the range and of the first frame after it, which are compared with the neighbouring segments, and the frames
+    where the trackers started
+    """
+    start_time = time.time()
+    writer = AnnotationWriter(job["save_path"], images_only=True, **job["writer"])
+    sampler = job["sampler"] or FixedSampler(job["save_every"])
+    start, end = job["start"], job["end"]
+    tail_start = None if end is None else end - job["overlap"]
+    saved = []
+    head = []
+    tail = []
+    restarts = []
+    start_boxes = []
+    boundary = []
+    frames = 0
+    # the first frame of the next segment is tracked too
+    source = track_frames(job["video"], job["seeds"], start_pos=job["track_start"],
+                          end_frame=None if end is None else end + 1, verbose=False, **job["options"])
+    for item, boxes, seeded in source:
+        if end is not None and item.index >= end:
+            boundary = boxes
+            break
+        if seeded:
+            restarts.append((item.index, len(boxes)))
+        # the frames before the cut are only tracked to be compared with the previous segment
+        if item.index < start:
+            head.append((item.index, boxes))
+            continue
+        # the sampling starts again at the cut like on a seeded frame
+        if item.index == start:
+            start_boxes = boxes
+        if seeded or item.index == start:
+            sampler.reset()
+        frames += 1
+        if tail_start is not None and item.index >= tail_start:
+            tail.append((item.index, boxes))
+        # the name is the one the frame gets in a serial run
+        save_counter = job["start_number"] + item.index - job["first_frame"]
+        if len(boxes) > 0 and sampler.should_save(save_counter, item.index, boxes, item.track):
+            if writer.submit(save_counter, item.image, boxes, item.index):
+                h, w = item.image.shape[:2] if item.image is not None else (0, 0)
+                saved.append((save_counter, item.index, boxes, w, h))
+    source.close()
+    writer.close()
+    # only the frames with a saved image get an annotation
+    if writer.image_format != "video":
+        saved = [s for s in saved if os.path.exists(writer.image_path(s[0]))]
+    return {"track_start": job["track_start"], "start": start, "end": end, "frames": frames, "saved": saved,
+            "head": head, "tail": tail, "start_boxes": start_boxes, "boundary": boundary, "restarts": restarts,
+            "elapsed": time.time() - start_time, "counts": writer.counts()}
+
+
+def match_boundary(tracked, seeded, min_iou=0.3):
+    """
+    Pairs the boxes of the previous segment with the boxes of the next segment on a frame
+    by the highest IoU between boxes of the same class
+    Returns a list of (previous index, next index, IoU)
+    """
+    if len(tracked) == 0 or len(seeded) == 0:
+        return []
+    overlap = iou_matrix([b[1:] for b in tracked], [b[1:] for b in seeded])
+    for i, a in enumerate(tracked):
+        for j, b in enumerate(seeded):
+            if a[0] != b[0]:
+                overlap[i, j] = 0
+    pairs = []
+    while overlap.size > 0 and overlap.max() >= min_iou:
+        i, j = divmod(int(overlap.argmax()), overlap.shape[1])
+        pairs.append((i, j, float(overlap[i, j])))
+        overlap[i, :] = 0
+        overlap[:, j] = 0
+    return pairs
+
+
+def handover(previous, segment, min_iou=0.5):
+    """
+    Chooses the frame from which the boxes of the segment are written instead of the boxes of the previous segment
+    A segment that starts on its cut, from seeds or from the boxes of the previous segment, is written from the cut
+    Otherwise it is the frame of the overlap where every box of the previous segment matches a box of the segment
+    with the highest mean IoU, when there is no such frame the handover is not accepted
+    """
+    if len(segment["head"]) == 0:
+        pairs = match_boundary(previous["boundary"], segment["start_boxes"], min_iou)
+        return {"frame": segment["start"], "accepted": True, "pairs": pairs,
+                "score": sum(p[2] for p in pairs) / len(pairs) if len(pairs) > 0 else None,
+                "tracked": len(previous["boundary"]), "started": len(segment["start_boxes"])}
+    tracked = dict(previous["tail"])
+    best = {"frame": segment["start"], "accepted": False, "pairs": [], "score": None, "tracked": 0, "started": 0}
+    for index, boxes in segment["head"]:
+        if index not in tracked:
+            continue
+        pairs = match_boundary(tracked[index], boxes, min_iou)
+        matched = len(pairs) == len(tracked[index]) == len(boxes)
+        score = sum(p[2] for p in pairs) / len(pairs) if len(pairs) > 0 else (1.0 if matched else 0.0)
+        if best["score"] is None or (matched, score) > (best["accepted"], best["score"]):
+            best = {"frame": index, "accepted": matched, "pairs": pairs, "score": score,
+                    "tracked": len(tracked[index]), "started": len(boxes)}
+    return best
+
+
+def generation(result, frame):
+    # the position in the restarts of the trackers of a segment that tracked the frame
+    return bisect.bisect_right([index for index, _ in result["restarts"]], frame) - 1
+
+
+def stitch(results, handovers):
+    """
+    Links the tracks across the handovers, every object gets one track id over the whole video
+    The boxes the trackers of a segment were started with take the ids of the boxes of the previous segment they
+    match on the handover frame, the boxes of the trackers started again on a seeded frame get new ids
+    Returns for every segment the frames from which its trackers are written with their ids
+    """
+    starts = [results[0]["start"]] + [h["frame"] for h in handovers]
+    ends = starts[1:] + [None]
+    next_id = 0
+    ids = {}
+    tracks = []
+    for i, result in enumerate(results):
+        linked = {}
+        if i > 0:
+            previous = ids.get((i - 1, generation(results[i - 1], starts[i])), [])
+            for p, j, _ in handovers[i - 1]["pairs"]:
+                if p < len(previous):
+                    linked[j] = previous[p]
+        segment_tracks = []
+        first = generation(result, starts[i])
+        last = generation(result, ends[i] - 1) if ends[i] is not None else len(result["restarts"]) - 1
+        for g in range(max(first, 0), last + 1):
+            index, count = result["restarts"][g]
+            track_ids = []
+            for j in range(count):
+                if g == first and j in linked:
+                    track_ids.append(linked[j])
+                else:
+                    track_ids.append(next_id)
+                    next_id += 1
+            ids[(i, g)] = track_ids
+            segment_tracks.append({"from": max(index, starts[i]), "ids": track_ids})
+        tracks.append(segment_tracks)
+    return tracks
+
+
+def run_segments(input_vid, writer, seeds, save_counter=0, save_every=1, workers=2, segments=None, skip_frames=1,
+                 sampler=None, overlap=30, scout_stride=5, min_iou=0.5, **options):
+    """
+    Runs the headless tracking of a video in segments on workers processes, the images and annotations have the
+    same names as in a serial run with run_headless
+    segments: the number of segments, by default one for every process
+    overlap: the number of frames a segment that does not start on a seeded frame is tracked before its cut,
+    rounded up to a multiple of the stride of the estimated boxes
+    scout_stride: the stride of the pass that estimates the boxes these segments are started with, rounded up to a
+    multiple of skip_frames
+    min_iou: the lowest IoU of two boxes of the overlap that are the same object
+    sampler: chooses the frames that are saved, every worker gets a copy, by default every save_every-th frame
+    options: the tracking options of track_frames
+    """
+    start_time = time.time()
+    cap = cv2.VideoCapture(input_vid)
+    frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+    first_frame = min(seeds.keys())
+    # the segments start on the frames of a serial run and of the estimating pass
+    stride = skip_frames * max(1, -(-scout_stride // skip_frames))
+    overlap = stride * max(1, -(-overlap // stride))
+    seed_frames = [grid_frame(f, first_frame, skip_frames) for f in seeds.keys()]
+    plan = plan_segments(first_frame, frame_count, segments or workers, overlap, stride, seed_frames)
+    if len(plan) < workers:
+        print("warning: the video only has room for %d segments of more than %d frames, %d of the %d processes "
+              "track a segment" % (len(plan), overlap, len(plan), workers))
+    # the trackers of a segment run in its worker process
+    options = dict(options, skip_frames=skip_frames, tracker_workers=0)
+    writer_options = dict(writer.options, workers=max(1, writer.options["workers"] // workers))
+
+    def make_job(track_start, start, end, job_seeds):
+        return {"video": input_vid, "save_path": writer.save_path, "writer": writer_options, "seeds": job_seeds,
+                "track_start": track_start, "start": start, "end": end, "overlap": overlap,
+                "first_frame": first_frame, "start_number": save_counter, "save_every": save_every,
+                "sampler": sampler, "options": options}
+
+    def segment_seeds(track_start, end):
+        # the seeds that restart the trackers from the first frame of the segment to its end
+        return dict((f, s) for f, s in seeds.items() if grid_frame(f, first_frame, skip_frames) >= track_start and
+                    (end is None or grid_frame(f, first_frame, skip_frames) < end))
+
+    jobs = [make_job(track_start, start, end, segment_seeds(track_start, end)) for track_start, start, end in plan]
+    # the segments without a seed on their first frame wait for the estimated boxes
+    waiting = dict((job["track_start"], i) for i, job in enumerate(jobs)
+                   if all(grid_frame(f, first_frame, skip_frames) != job["track_start"] for f in job["seeds"]))
+    estimated = len(waiting)
+    results = [None] * len(plan)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=mp_context) as pool:
+        futures = dict((pool.submit(track_segment, job), i) for i, job in enumerate(jobs)
+                       if job["track_start"] not in waiting)
+        print("tracking %d segments on %d processes, %d of them from estimated boxes" % (len(plan), workers, estimated))
+        # the segments are started as soon as the pass reaches their first frame
+        estimate_start = time.time()
+        for frame, boxes in estimate_boxes(input_vid, seeds, list(waiting.keys()), stride, **options):
+            i = waiting.pop(frame)
+            jobs[i]["seeds"][frame] = boxes
+            futures[pool.submit(track_segment, jobs[i])] = i
+        # the segments the pass did not reach start without boxes and are tracked again from the previous one
+        for frame, i in waiting.items():
+            jobs[i]["seeds"][frame] = []
+            futures[pool.submit(track_segment, jobs[i])] = i
+        if estimated > 0:
+            print("estimated the boxes of %d segment starts in %0.2f s" % (estimated, time.time() - estimate_start))
+        for future in as_completed(futures):
+            i = futures[future]
+            results[i] = future.result()
+            r = results[i]
+            writer.merge(r["counts"])
+            print("segment %d: frames %d to %s from %d, %d frames in %0.2f s (%0.1f fps)" %
+                  (i, r["start"], r["end"] if r["end"] is not None else "end", r["track_start"], r["frames"],
+                   r["elapsed"], r["frames"] / max(r["elapsed"], 1e-6)))
+    handovers = []
+    for i in range(1, len(results)):
+        h = handover(results[i - 1], results[i], min_iou)
+        if not h["accepted"]:
+            # the boxes of the segment are not the objects of the previous segment, it is tracked again from the
+            # boxes the previous segment tracked on the cut
+            print("warning: at most %d of the %d boxes of segment %d match segment %d in the overlap, segment %d "
+                  "is tracked again from the boxes of segment %d" %
+                  (len(h["pairs"]), len(results[i - 1]["boundary"]), i - 1, i, i, i - 1))
+            job = make_job(jobs[i]["start"], jobs[i]["start"], jobs[i]["end"],
+                           segment_seeds(jobs[i]["start"], jobs[i]["end"]))
+            job["seeds"][jobs[i]["start"]] = results[i - 1]["boundary"]
+            retracked = track_segment(job)
+            writer.merge(retracked["counts"])
+            # the images the first run saved on other frames than the second one have no annotation
+            names = set(s[0] for s in retracked["saved"])
+            for s in results[i]["saved"]:
+                if s[0] not in names and writer.image_format != "video" and os.path.exists(writer.image_path(s[0])):
+                    os.remove(writer.image_path(s[0]))
+            results[i] = retracked
+            h = handover(results[i - 1], results[i], min_iou)
+        handovers.append(h)
+    tracks = stitch(results, handovers)
+    # the annotations are written here in the order of the names, the frames of an overlap after its handover
+    # frame get the boxes of the next segment
+    saved = 0
+    for i, r in enumerate(results):
+        later = dict(results[i + 1]["head"]) if i + 1 < len(results) else {}
+        for counter, index, boxes, w, h in r["saved"]:
+            if i + 1 < len(results) and index >= handovers[i]["frame"]:
+                boxes = later.get(index, boxes)
+            writer.write_annotation(counter, boxes, index, w, h)
+            saved += 1
+    with open(os.path.join(writer.save_path, "annotations", "segments.json"), 'w') as f:
+        json.dump({"segments": [{"track_start": r["track_start"], "start": r["start"], "end": r["end"],
+                                 "frames": r["frames"], "saved": len(r["saved"]), "seconds": r["elapsed"],
+                                 "tracks": t} for r, t in zip(results, tracks)],
+                   "handovers": [dict(h, pairs=[list(p) for p in h["pairs"]]) for h in handovers]}, f, indent=2)
+    for r, h in zip(results[1:], handovers):
+        print("cut at %d: boxes written from frame %d, %d of %d boxes match%s" %
+              (r["start"], h["frame"], len(h["pairs"]), h["tracked"],
+               ", mean IoU %0.3f" % h["score"] if h["score"] is not None else ""))
+    processed = sum(r["frames"] for r in results)
+    elapsed = time.time() - start_time
+    print("processed %d frames in %0.2f s (%0.1f fps), saved %d annotations" %
+          (processed, elapsed, processed / max(elapsed, 1e-6), saved))
+    return save_counter + processed * skip_frames
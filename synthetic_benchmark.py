@@ -0,0 +1,222 @@
+import argparse
+import cv2
+import json
+import numpy as np
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from box_utils import iou_matrix
+from seed_file import read_yolo_seeds
+
+# the annotation scripts are run as separate processes so the time, memory and files of one run are measured alone
+scripts = {"single": "automated_annotation.py", "multi": "automated_multi_class_annotation.py"}
+
+
+def generate_video(path, width, height, objects, frames, fps=30, seed=0):
+    """
+    Writes a video of textured rectangles bouncing over a noisy background
+    Returns the ground truth boxes as an array of shape (frames, objects, 4) in normalized coordinates
+    """
+    rng = np.random.default_rng(seed)
+    background = cv2.GaussianBlur(rng.integers(0, 255, (height, width, 3), dtype=np.uint8), (0, 0), 3)
+    sizes = np.stack([rng.uniform(0.06, 0.15, objects) * width, rng.uniform(0.08, 0.2, objects) * height], axis=1)
+    positions = np.stack([rng.uniform(0, width - sizes[:, 0]), rng.uniform(0, height - sizes[:, 1])], axis=1)
+    velocity = rng.uniform(-3, 3, (objects, 2)) * width / 640
+    # every object has its own texture so the trackers can tell them apart
+    textures = [cv2.resize(rng.integers(0, 255, (8, 8, 3), dtype=np.uint8), (int(w), int(h)),
+                           interpolation=cv2.INTER_NEAREST) for w, h in sizes]
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), fps, (width, height))
+    truth = np.zeros((frames, objects, 4))
+    for f in range(frames):
+        image = background.copy()
+        for n in range(objects):
+            x, y = positions[n].astype(int)
+            h, w = textures[n].shape[:2]
+            image[y:y + h, x:x + w] = textures[n]
+            truth[f, n] = [x / width, y / height, (x + w) / width, (y + h) / height]
+        writer.write(image)
+        # bounce on the borders
+        positions += velocity
+        for axis, limit in [(0, width), (1, height)]:
+            out = (positions[:, axis] < 0) | (positions[:, axis] + sizes[:, axis] >= limit - 1)
+            velocity[out, axis] *= -1
+            positions[:, axis] = np.clip(positions[:, axis], 0, limit - sizes[:, axis] - 1)
+    writer.release()
+    return truth
+
+
+def write_seeds(path, truth, class_name="object"):
+    # the ground truth boxes of the first frame seed the headless run
+    seeds = {"0": [{"class": class_name, "box": box.tolist()} for box in truth[0]]}
+    with open(path, 'w') as f:
+        json.dump(seeds, f)
+
+
+def accuracy(save_path, truth, objects):
+    # mean IoU of every ground truth box with the best matching saved box, the files are named by frame index
+    scores = []
+    missing = 0
+    for f in range(len(truth)):
+        path = os.path.join(save_path, "annotations", str(f) + ".txt")
+        if not os.path.exists(path):
+            missing += 1
+            continue
+        # the saved annotations are read like a yolo seed file, without their class ids
+        boxes = np.asarray([box[1:] for box in read_yolo_seeds(path, None)]).reshape(-1, 4)
+        gt = truth[f, :objects]
+        scores.append(iou_matrix(gt, boxes).max(axis=1).mean() if len(boxes) > 0 else 0.0)
+    return {"mean_iou": float(np.mean(scores)) if len(scores) > 0 else 0.0,
+            "min_iou": float(np.min(scores)) if len(scores) > 0 else 0.0, "missing_frames": missing}
+
+
+def folder_size(path):
+    total = 0
+    files = 0
+    for root, _, names in os.walk(path):
+        for name in names:
+            total += os.path.getsize(os.path.join(root, name))
+            files += 1
+    return total, files
+
+
+def run_script(script, video, seeds, save_path, tracker, extra):
+    """
+    Runs an annotation script headless, returns the wall time, the exit code and the peak memory in MB
+    """
+    # the scripts refuse to write into an existing folder, the outputs of an earlier benchmark are removed
+    if os.path.exists(save_path):
+        shutil.rmtree(save_path)
+    profile = save_path + ".profile.json"
+    # every frame is saved so the scripts do the same work and every frame is compared with the ground truth
+    command = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), scripts[script]),
+               "-i", video, "-s", save_path, "-n", "1", "--seed_file", seeds, "--tracker", tracker,
+               "--profile_output", profile] + extra
+    if script == "multi":
+        command += ["-c", "object"]
+    start = time.perf_counter()
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    output = process.stdout.read()
+    peak = None
+    if hasattr(os, "wait4"):
+        # wait4 returns the resource usage of this child alone, ru_maxrss is in kilobytes on linux
+        _, status, usage = os.wait4(process.pid, 0)
+        code = os.waitstatus_to_exitcode(status) if hasattr(os, "waitstatus_to_exitcode") else status
+        peak = usage.ru_maxrss / 1024
+        process.returncode = code
+    else:
+        code = process.wait()
+    elapsed = time.perf_counter() - start
+    stages = {}
+    if os.path.exists(profile):
+        with open(profile) as f:
+            stages = json.load(f)["stages"]
+        os.remove(profile)
+    return elapsed, code, peak, stages, output.decode(errors="replace")
+
+
+def run_case(work_dir, script, width, height, objects, frames, tracker, extra, seed=0):
+    name = "%s_%dx%d_%dobj_%dfr_%s" % (script, width, height, objects, frames, tracker)
+    video = os.path.join(work_dir, "video_%dx%d_%d_%d_%d.avi" % (width, height, objects, frames, seed))
+    truth_path = video + ".npy"
+    # the videos are generated once and reused by the other scripts and trackers
+    if not os.path.exists(truth_path):
+        np.save(truth_path, generate_video(video, width, height, objects, frames, seed=seed))
+    truth = np.load(truth_path)
+    seeds = video + ".json"
+    write_seeds(seeds, truth)
+    save_path = os.path.join(work_dir, name)
+    elapsed, code, peak, stages, output = run_script(script, video, seeds, save_path, tracker, extra)
+    if code != 0:
+        print(output)
+        return {"name": name, "error": "exit code " + str(code)}
+    # the single class script only tracks the first box of the seed file
+    tracked = 1 if script == "single" else objects
+    written, files = folder_size(save_path)
+    track = stages.get("track", {})
+    result = {"name": name, "script": script, "width": width, "height": height, "objects": objects,
+              "frames": frames, "tracker": tracker, "wall_s": elapsed, "fps": frames / max(elapsed, 1e-9),
+              "track_fps": 1000 / track["mean_ms"] if track.get("mean_ms") else None,
+              "mean_per_object_ms": track.get("mean_per_object_ms"), "peak_memory_mb": peak, "bytes_written": written,
+              "files_written": files, "stages": {k: v["per_frame_ms"] for k, v in stages.items()}}
+    result.update(accuracy(save_path, truth, tracked))
+    return result
+
+
+def compare(results, baseline, tolerance):
+    """
+    Returns the cases that are slower than the baseline by more than tolerance or lost more than 0.05 IoU
+    """
+    old = dict((r["name"], r) for r in baseline["results"] if "error" not in r)
+    regressions = []
+    for r in results:
+        if "error" in r:
+            regressions.append(r["name"] + ": " + r["error"])
+            continue
+        if r["name"] not in old:
+            continue
+        b = old[r["name"]]
+        if r["fps"] < b["fps"] * (1 - tolerance):
+            regressions.append("%s: %0.1f fps, was %0.1f" % (r["name"], r["fps"], b["fps"]))
+        if r["mean_iou"] < b["mean_iou"] - 0.05:
+            regressions.append("%s: mean IoU %0.3f, was %0.3f" % (r["name"], r["mean_iou"], b["mean_iou"]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Runs both annotation scripts headless on generated videos with "
+                                                 "known boxes and saves the speed, memory, output size and accuracy")
+    parser.add_argument("--resolutions", default="640x360,1280x720", help="the video sizes separated by ','")
+    parser.add_argument("--objects", default="1,4,16", help="the number of objects separated by ','")
+    parser.add_argument("--frames", default="150", help="the video lengths separated by ','")
+    parser.add_argument("--scripts", default="single,multi", help="the scripts to run separated by ','")
+    parser.add_argument("--trackers", default="dlib", help="the tracker backends separated by ','")
+    parser.add_argument("--extra", default="", help="more arguments for the scripts, for example "
+                                                    "\"--image_format png --writer_threads 4\"")
+    parser.add_argument("--work_dir", default=None, help="folder for the videos and outputs, by default a "
+                                                         "temporary folder")
+    parser.add_argument("--output", default="benchmark_results.json", help="json file to save the results")
+    parser.add_argument("--baseline", default=None, help="results of an earlier run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed relative frame rate loss")
+    parser.add_argument("--seed", type=int, default=0, help="random seed of the generated videos")
+    args = parser.parse_args()
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="annotation_benchmark_")
+    os.makedirs(work_dir, exist_ok=True)
+    resolutions = [tuple(int(v) for v in r.split('x')) for r in args.resolutions.split(',')]
+    results = []
+    for width, height in resolutions:
+        for objects in [int(o) for o in args.objects.split(',')]:
+            for frames in [int(f) for f in args.frames.split(',')]:
+                for script in args.scripts.split(','):
+                    for tracker in args.trackers.split(','):
+                        result = run_case(work_dir, script.strip(), width, height, objects, frames, tracker.strip(),
+                                          args.extra.split(), args.seed)
+                        results.append(result)
+                        if "error" in result:
+                            print("%-40s failed: %s" % (result["name"], result["error"]))
+                        else:
+                            peak = "%0.0f MB" % result["peak_memory_mb"] if result["peak_memory_mb"] else "-"
+                            per_object = "%0.3f" % result["mean_per_object_ms"] if result["mean_per_object_ms"] else "-"
+                            print("%-40s %7.1f fps %8s avg ms/object %8s %9.1f MB written  IoU %0.3f" %
+                                  (result["name"], result["fps"], per_object, peak, result["bytes_written"] / 1e6,
+                                   result["mean_iou"]))
+    summary = {"created": time.strftime("%Y-%m-%d %H:%M:%S"), "python": sys.version.split()[0],
+               "opencv": cv2.__version__, "cpus": os.cpu_count(), "work_dir": work_dir, "results": results}
+    with open(args.output, 'w') as f:
+        json.dump(summary, f, indent=2)
+    print("saved the results to", args.output)
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for line in regressions:
+            print("regression:", line)
+        if len(regressions) > 0:
+            sys.exit(1)
+        print("no regressions against", args.baseline)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+import cv2
+import numpy as np
+import os
+import pytest
+import sys
+
+# the modules of the scripts are in the root of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def video(tmp_path):
+    """
+    A 20 frame 64x48 video where the brightness of every frame is 10 times its index
+    """
+    path = str(tmp_path / "video.avi")
+    out = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), 10, (64, 48))
+    for i in range(20):
+        out.write(np.full((48, 64, 3), 10 * i, dtype=np.uint8))
+    out.release()
+    return path
+
+
+@pytest.fixture
+def moving_video(tmp_path):
+    """
+    A 60 frame 160x120 video of two textured squares moving right by one pixel a frame
+    Returns the path and the normalized [x1, y1, x2, y2] box of every square on every frame
+    """
+    path = str(tmp_path / "moving.avi")
+    out = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), 10, (160, 120))
+    rng = np.random.RandomState(0)
+    textures = [rng.randint(0, 255, (24, 24, 3)).astype(np.uint8) for _ in range(2)]
+    starts = [(10, 20), (40, 70)]
+    boxes = []
+    for i in range(60):
+        frame = np.full((120, 160, 3), 40, dtype=np.uint8)
+        frame_boxes = []
+        for (x, y), texture in zip(starts, textures):
+            frame[y:y + 24, x + i:x + i + 24] = texture
+            frame_boxes.append([(x + i) / 160, y / 120, (x + i + 24) / 160, (y + 24) / 120])
+        out.write(frame)
+        boxes.append(frame_boxes)
+    out.release()
+    return path, boxes
@@ -0,0 +1,67 @@
+import json
+import numpy as np
+import os
+import pytest
+from annotation_store import AnnotationStore, export_coco, export_yolo, frame_dtype, iterate_frames, label_dtype, \
+    store_paths
+
+
+@pytest.fixture
+def save_path(tmp_path):
+    os.makedirs(str(tmp_path / "annotations"))
+    return str(tmp_path)
+
+
+def read_back(save_path):
+    return dict((int(record["frame"]), [[int(l["class_id"]), float(l["cx"]), float(l["cy"]), float(l["w"]),
+                                         float(l["h"])] for l in labels])
+                for record, labels in iterate_frames(save_path))
+
+
+def test_round_trip_keeps_the_last_record_of_a_frame(save_path):
+    store = AnnotationStore(save_path)
+    store.append(3, [[0, 0.1, 0.2, 0.3, 0.6], [1, 0.5, 0.5, 0.7, 0.9]], source_frame=30, width=64, height=48)
+    store.append(1, [], source_frame=10, width=64, height=48)
+    # the frame saved again replaces its boxes
+    store.append(3, [[2, 0.0, 0.0, 0.5, 0.5]], source_frame=30, width=64, height=48)
+    store.close()
+    frames = read_back(save_path)
+    assert sorted(frames) == [1, 3]
+    assert frames[1] == []
+    assert frames[3] == [[2, 0.25, 0.25, 0.5, 0.5]]
+
+
+def test_export_yolo_and_coco(save_path, tmp_path):
+    store = AnnotationStore(save_path)
+    store.append(7, [[1, 0.25, 0.5, 0.75, 1.0]], source_frame=70, width=200, height=100)
+    store.close()
+    assert export_yolo(save_path, str(tmp_path / "labels")) == 1
+    with open(str(tmp_path / "labels" / "7.txt")) as f:
+        assert f.read() == "1 0.500000 0.750000 0.500000 0.500000"
+    assert export_coco(save_path, str(tmp_path / "coco.json")) == 1
+    with open(str(tmp_path / "coco.json")) as f:
+        coco = json.load(f)
+    assert coco["images"] == [{"id": 7, "file_name": "7.jpg", "width": 200, "height": 100, "source_frame": 70}]
+    assert coco["annotations"][0]["bbox"] == [50.0, 50.0, 100.0, 50.0]
+    assert [c["id"] for c in coco["categories"]] == [0, 1]
+
+
+def test_torn_records_are_cut_when_the_store_is_opened(save_path):
+    store = AnnotationStore(save_path)
+    store.append(0, [[0, 0.1, 0.1, 0.2, 0.2]])
+    store.append(1, [[0, 0.3, 0.3, 0.4, 0.4]])
+    store.close()
+    frames_path, labels_path = store_paths(save_path)
+    # a crash during the next frame left its boxes without a frame record and half of the frame record
+    with open(labels_path, 'ab') as f:
+        f.write(np.zeros(2, dtype=label_dtype).tobytes())
+    with open(frames_path, 'ab') as f:
+        f.write(np.zeros(1, dtype=frame_dtype).tobytes()[:frame_dtype.itemsize // 2])
+    store = AnnotationStore(save_path)
+    assert os.path.getsize(frames_path) == 2 * frame_dtype.itemsize
+    assert os.path.getsize(labels_path) == 2 * label_dtype.itemsize
+    store.append(2, [[0, 0.5, 0.5, 0.6, 0.6]])
+    store.close()
+    frames = read_back(save_path)
+    assert sorted(frames) == [0, 1, 2]
+    assert frames[2][0][1:3] == pytest.approx([0.55, 0.55])
@@ -0,0 +1,38 @@
+import cv2
+import numpy as np
+import os
+from annotation_writer import AnnotationWriter
+
+
+def make_writer(path, **options):
+    for folder in ["images", "annotations"]:
+        os.makedirs(os.path.join(path, folder))
+    return AnnotationWriter(path, **options)
+
+
+def test_saved_image_is_kept_when_only_the_annotation_changes(tmp_path):
+    path = str(tmp_path)
+    writer = make_writer(path, image_format="png")
+    original = np.random.RandomState(0).randint(0, 255, (24, 32, 3)).astype(np.uint8)
+    writer.submit(4, original, [[0, 0.1, 0.1, 0.5, 0.5]])
+    writer.flush()
+    # a frame shown again from the history is a compressed copy of the saved frame
+    writer.submit(4, np.zeros_like(original), [[1, 0.2, 0.2, 0.6, 0.6]], keep_image=True)
+    writer.close()
+    assert np.array_equal(cv2.imread(os.path.join(path, "images", "4.png")), original)
+    with open(os.path.join(path, "annotations", "4.txt")) as f:
+        assert f.read() == "1 0.400000 0.400000 0.400000 0.400000"
+    assert writer.counts()["written"] == 2
+
+
+def test_wait_queued_returns_when_the_earlier_frames_are_written(tmp_path):
+    path = str(tmp_path)
+    writer = make_writer(path, workers=2)
+    image = np.zeros((8, 8, 3), dtype=np.uint8)
+    for counter in range(5):
+        writer.submit(counter, image, [[0, 0.1, 0.1, 0.5, 0.5]])
+    writer.wait_queued(3)
+    for counter in range(3):
+        assert os.path.exists(os.path.join(path, "annotations", str(counter) + ".txt"))
+    writer.close()
+    assert len(writer.outstanding) == 0
@@ -0,0 +1,99 @@
+import cv2
+import json
+import numpy as np
+import os
+import pytest
+import runpy
+import threading
+from annotation_writer import AnnotationWriter
+from checkpoint import Checkpointer, checkpoint_path, read_checkpoint
+from json_files import write_json_atomic
+
+script = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "automated_multi_class_annotation.py")
+
+
+def test_write_json_atomic_replaces_the_file(tmp_path):
+    path = str(tmp_path / "state.json")
+    write_json_atomic(path, {"a": 1})
+    write_json_atomic(path, {"a": 2}, indent=2)
+    with open(path) as f:
+        assert json.load(f) == {"a": 2}
+    assert os.listdir(str(tmp_path)) == ["state.json"]
+
+
+def test_read_checkpoint_without_a_checkpoint(tmp_path):
+    with pytest.raises(AssertionError):
+        read_checkpoint(str(tmp_path))
+
+
+class BlockedWriter(AnnotationWriter):
+    """
+    A writer whose writes wait until they are released
+    """
+
+    def __init__(self, save_path):
+        super().__init__(save_path, workers=1)
+        self.release = threading.Event()
+
+    def write(self, *args):
+        self.release.wait()
+        super().write(*args)
+
+
+def test_checkpoint_is_saved_after_the_queued_frames(tmp_path):
+    path = str(tmp_path)
+    for folder in ["images", "annotations"]:
+        os.makedirs(os.path.join(path, folder))
+    writer = BlockedWriter(path)
+    checkpointer = Checkpointer(path, writer, every=1.0)
+    writer.submit(0, np.zeros((8, 8, 3), dtype=np.uint8), [[0, 0.1, 0.1, 0.5, 0.5]])
+    # the loop does not wait for the writer, the checkpoint waits for the frame named before it
+    checkpointer.save({"save_counter": 0, "next_counter": 1})
+    assert not os.path.exists(checkpoint_path(path))
+    writer.release.set()
+    checkpointer.close()
+    writer.close()
+    assert os.path.exists(os.path.join(path, "images", "0.jpg"))
+    assert read_checkpoint(path)["next_counter"] == 1
+    assert checkpointer.saved == 1
+
+
+def run_session(monkeypatch, video, save_path, keys, *options):
+    """
+    Runs the window script with the keys pressed in turn, 'draw' draws a box and 'none' shows the next frame
+    Returns the names of the saved images
+    """
+    keys = list(keys)
+    callbacks = []
+
+    def wait_key(delay=0):
+        if len(keys) == 0:
+            return ord('q')
+        key = keys.pop(0)
+        if key == "draw":
+            callback = callbacks[-1]
+            callback(cv2.EVENT_LBUTTONDOWN, 10, 20, 0, None)
+            callback(cv2.EVENT_MOUSEMOVE, 34, 44, 0, None)
+            callback(cv2.EVENT_LBUTTONUP, 34, 44, 0, None)
+            # the class of the box is picked from the menu
+            key = keys.pop(0)
+        return -1 if key == "none" else ord(key)
+    monkeypatch.setattr(cv2, "namedWindow", lambda *args: None)
+    monkeypatch.setattr(cv2, "imshow", lambda *args: None)
+    monkeypatch.setattr(cv2, "waitKey", wait_key)
+    monkeypatch.setattr(cv2, "setMouseCallback", lambda name, callback: callbacks.append(callback))
+    monkeypatch.setattr("sys.argv", [script, "-i", video, "-c", "square", "-s", save_path, "-n", "1", "-w", "160",
+                                     "--tracker", "mosse"] + list(options))
+    runpy.run_path(script, run_name="__main__")
+    return sorted(os.listdir(os.path.join(save_path, "images")), key=lambda name: int(name.split(".")[0]))
+
+
+def test_resumed_session_has_the_names_of_a_session_that_did_not_stop(moving_video, tmp_path, monkeypatch):
+    video, _ = moving_video
+    full = run_session(monkeypatch, video, str(tmp_path / "full"), ["draw", "1", "p"] + ["none"] * 6 + ["q"])
+    path = str(tmp_path / "resumed")
+    # the frame tracked when the session stops is saved before the checkpoint, the resumed session goes on after it
+    stopped = run_session(monkeypatch, video, path, ["draw", "1", "p"] + ["none"] * 3 + ["q"])
+    resumed = run_session(monkeypatch, video, path, ["p", "none", "none", "q"], "--resume")
+    assert len(stopped) == 4
+    assert resumed == full
@@ -0,0 +1,53 @@
+import argparse
+import cv2
+import pytest
+from frame_source import FrameSource, positive_int
+
+
+def read_all(source):
+    items = []
+    item = source.read()
+    while item is not None:
+        items.append(item)
+        item = source.read()
+    return items
+
+
+def test_reads_every_frame_then_none(video):
+    source = FrameSource(cv2.VideoCapture(video), 1.0, queue_depth=2)
+    items = read_all(source)
+    assert [item.index for item in items] == list(range(20))
+    # reading after the end does not wait for the stopped decode thread
+    assert source.read() is None
+    source.stop()
+
+
+def test_skip_frames_indices_and_brightness(video):
+    cap = cv2.VideoCapture(video)
+    # the caller opens the capture at start_pos
+    cap.set(cv2.CAP_PROP_POS_FRAMES, 1)
+    source = FrameSource(cap, 0.5, skip_frames=3, start_pos=1, seek_threshold=0)
+    items = read_all(source)
+    source.stop()
+    assert [item.index for item in items] == list(range(1, 20, 3))
+    for item in items:
+        assert abs(int(item.image.mean()) - 10 * item.index) <= 3
+        assert item.display.shape[:2] == (24, 32)
+
+
+def test_decode_thread_error_is_raised_by_read(video):
+    # a resize ratio of 0 makes cv2.resize fail on the decode thread
+    source = FrameSource(cv2.VideoCapture(video), 1.0, output_ratio=0.0)
+    with pytest.raises(cv2.error):
+        source.read()
+    # the error is raised again instead of waiting for another frame
+    with pytest.raises(cv2.error):
+        source.read()
+    source.stop()
+
+
+def test_positive_int():
+    assert positive_int("3") == 3
+    for value in ["0", "-2"]:
+        with pytest.raises(argparse.ArgumentTypeError):
+            positive_int(value)
@@ -0,0 +1,46 @@
+import numpy as np
+from keyframe_interpolation import KeyframeAnnotator, interpolate_boxes, match_boxes
+
+
+def test_linear_interpolation_between_keyframes():
+    key_boxes = [[[0, 0, 10, 10]], [[10, 0, 20, 10]], [[10, 20, 20, 30]]]
+    boxes = interpolate_boxes([0, 10, 20], key_boxes, [0, 5, 10, 15, 20])
+    assert boxes.shape == (5, 1, 4)
+    assert np.allclose(boxes[:, 0], [[0, 0, 10, 10], [5, 0, 15, 10], [10, 0, 20, 10], [10, 10, 20, 20],
+                                     [10, 20, 20, 30]])
+
+
+def test_spline_goes_through_the_keyframes_and_is_exact_for_constant_motion():
+    key_boxes = [[[0, 0, 10, 10]], [[10, 5, 20, 15]], [[20, 10, 30, 20]]]
+    boxes = interpolate_boxes([0, 10, 20], key_boxes, [0, 3, 10, 17, 20], method="spline")
+    linear = interpolate_boxes([0, 10, 20], key_boxes, [0, 3, 10, 17, 20])
+    assert np.allclose(boxes, linear)
+
+
+def test_missing_object_is_nan_only_next_to_its_missing_keyframe():
+    nan = [np.nan] * 4
+    key_boxes = [[[0, 0, 10, 10], [0, 0, 1, 1]], [[10, 0, 20, 10], nan], [[20, 0, 30, 10], nan]]
+    boxes = interpolate_boxes([0, 10, 20], key_boxes, [5, 15])
+    assert np.allclose(boxes[:, 0], [[5, 0, 15, 10], [15, 0, 25, 10]])
+    assert np.isnan(boxes[:, 1]).all()
+
+
+def test_match_boxes_pairs_the_closest_boxes_of_the_same_class():
+    old = [[0, 0.1, 0.1, 0.2, 0.2], [1, 0.5, 0.5, 0.6, 0.6], [0, 0.8, 0.8, 0.9, 0.9]]
+    new = [[0, 0.82, 0.8, 0.92, 0.9], [0, 0.12, 0.1, 0.22, 0.2], [1, 0.11, 0.1, 0.21, 0.2]]
+    assert sorted(match_boxes(old, new)) == [(0, 1), (1, 2), (2, 0)]
+    assert match_boxes([], new) == []
+
+
+def test_annotator_saves_the_buffered_frames_at_the_next_keyframe():
+    annotator = KeyframeAnnotator()
+    assert annotator.add_keyframe(0, [[0, 0.0, 0.0, 0.1, 0.1]]) == []
+    for index in range(1, 4):
+        annotator.buffer(index, 100 + index, "image" + str(index), None)
+    # the box moved and a second object appeared on the next keyframe
+    saved = annotator.add_keyframe(4, [[0, 0.4, 0.0, 0.5, 0.1], [1, 0.5, 0.5, 0.6, 0.6]])
+    assert [(counter, image, index) for counter, image, _, index in saved] == \
+        [(101, "image1", 1), (102, "image2", 2), (103, "image3", 3)]
+    # the new object has no box before its first keyframe
+    assert np.allclose(saved[1][2], [[0, 0.2, 0.0, 0.3, 0.1]])
+    assert len(annotator.pending) == 0
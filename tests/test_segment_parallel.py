@@ -0,0 +1,114 @@
+import json
+import os
+import segment_parallel
+from annotation_writer import AnnotationWriter
+from headless import run_headless
+from segment_parallel import grid_frame, handover, plan_segments, run_segments, stitch
+
+
+def segment(start, head=(), tail=(), boundary=(), start_boxes=(), restarts=None):
+    return {"start": start, "head": list(head), "tail": list(tail), "boundary": list(boundary),
+            "start_boxes": list(start_boxes), "restarts": restarts or [(start, len(start_boxes))]}
+
+
+def test_grid_frame():
+    assert grid_frame(5, 5, 2) == 5
+    assert grid_frame(6, 5, 2) == 7
+    assert grid_frame(7, 5, 2) == 7
+
+
+def test_plan_cuts_into_equal_overlapping_segments():
+    plan = plan_segments(0, 400, 4, 30, 10)
+    assert plan == [(0, 0, 100), (70, 100, 200), (170, 200, 300), (270, 300, None)]
+
+
+def test_plan_prefers_seeded_cuts():
+    # the seed at 190 is within half a segment of the cut at 200, the seed at 20 is not close to any cut
+    plan = plan_segments(0, 400, 4, 30, 10, seed_frames=[0, 20, 190])
+    assert plan == [(0, 0, 100), (70, 100, 190), (190, 190, 300), (270, 300, None)]
+
+
+def test_plan_short_video_has_fewer_segments():
+    plan = plan_segments(0, 100, 8, 30, 10)
+    assert len(plan) < 8
+    # every overlap is inside the range of the previous segment
+    for (_, start, _), (track_start, _, _) in zip(plan, plan[1:]):
+        assert track_start > start
+
+
+def test_handover_chooses_the_best_fully_matched_frame():
+    a, b = [0, 0.1, 0.1, 0.3, 0.3], [0, 0.6, 0.6, 0.8, 0.8]
+    shifted = [0, 0.12, 0.1, 0.32, 0.3]
+    previous = segment(0, tail=[(8, [a, b]), (9, [a, b])])
+    following = segment(10, head=[(8, [shifted, b]), (9, [a, b])])
+    h = handover(previous, following)
+    assert h["accepted"] and h["frame"] == 9 and h["score"] == 1.0
+    assert sorted((p, j) for p, j, _ in h["pairs"]) == [(0, 0), (1, 1)]
+
+
+def test_handover_rejects_a_lost_object():
+    a, b, c = [0, 0.1, 0.1, 0.3, 0.3], [0, 0.6, 0.6, 0.8, 0.8], [0, 0.4, 0.1, 0.5, 0.2]
+    # the started segment lost c, two of three boxes match exactly
+    previous = segment(0, tail=[(8, [a, b, c])])
+    following = segment(10, head=[(8, [a, b, [0, 0.9, 0.9, 1.0, 1.0]])])
+    h = handover(previous, following)
+    assert not h["accepted"]
+    assert len(h["pairs"]) == 2
+
+
+def test_handover_of_a_seeded_cut_is_the_cut():
+    a = [0, 0.1, 0.1, 0.3, 0.3]
+    h = handover(segment(0, boundary=[a]), segment(10, start_boxes=[a]))
+    assert h["accepted"] and h["frame"] == 10 and len(h["pairs"]) == 1
+
+
+def test_stitch_links_track_ids_across_handovers():
+    a, b = [0, 0.1, 0.1, 0.3, 0.3], [0, 0.6, 0.6, 0.8, 0.8]
+    results = [segment(0, start_boxes=[a, b]), segment(10, start_boxes=[b, a], restarts=[(6, 2), (15, 1)])]
+    # the second segment was started from b and a and started again from one seed on frame 15
+    handovers = [{"frame": 8, "pairs": [(0, 1, 1.0), (1, 0, 1.0)]}]
+    tracks = stitch(results, handovers)
+    assert tracks[0] == [{"from": 0, "ids": [0, 1]}]
+    assert tracks[1] == [{"from": 8, "ids": [1, 0]}, {"from": 15, "ids": [2]}]
+
+
+def read_annotations(path):
+    annotations = {}
+    for name in os.listdir(os.path.join(path, "annotations")):
+        if name.endswith(".txt") and name != "classes.txt":
+            with open(os.path.join(path, "annotations", name)) as f:
+                annotations[name] = [[float(v) for v in line.split()] for line in f.read().splitlines()]
+    return annotations
+
+
+def test_segments_are_tracked_again_when_the_estimate_lost_an_object(moving_video, tmp_path, monkeypatch, capsys):
+    video, truth = moving_video
+    seeds = {0: [[0] + truth[0][0], [0] + truth[0][1]]}
+
+    # an estimate that lost the second square, the second segment does not match the first one in its overlap
+    def lost_estimate(input_vid, seeds, frames, stride, **options):
+        for frame in sorted(frames):
+            yield frame, [[0] + truth[frame][0]]
+    monkeypatch.setattr(segment_parallel, "estimate_boxes", lost_estimate)
+    serial_path, parallel_path = str(tmp_path / "serial"), str(tmp_path / "parallel")
+    for path in [serial_path, parallel_path]:
+        for folder in ["images", "annotations"]:
+            os.makedirs(os.path.join(path, folder))
+    serial_writer = AnnotationWriter(serial_path, workers=1)
+    serial_counter = run_headless(video, serial_writer, seeds, save_every=5, tracker="mosse")
+    serial_writer.close()
+    parallel_writer = AnnotationWriter(parallel_path, workers=1)
+    parallel_counter = run_segments(video, parallel_writer, seeds, save_every=5, workers=2, overlap=10,
+                                    tracker="mosse")
+    parallel_writer.close()
+    assert "is tracked again from the boxes of segment 0" in capsys.readouterr().out
+    assert parallel_counter == serial_counter
+    serial, parallel = read_annotations(serial_path), read_annotations(parallel_path)
+    assert sorted(serial) == sorted(parallel)
+    assert sorted(os.listdir(os.path.join(serial_path, "images"))) == \
+        sorted(os.listdir(os.path.join(parallel_path, "images")))
+    # both squares are still annotated after the cut
+    assert all(len(boxes) == 2 for boxes in parallel.values())
+    with open(os.path.join(parallel_path, "annotations", "segments.json")) as f:
+        handovers = json.load(f)["handovers"]
+    assert len(handovers) == 1 and handovers[0]["accepted"] and len(handovers[0]["pairs"]) == 2
@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+from tracker_backends import InterpolationTrackers, create_trackers
+
+
+def square_frame(x, y):
+    # a textured square on a flat background so the correlation filters have something to follow
+    frame = np.full((120, 160), 40, dtype=np.uint8)
+    frame[y:y + 24, x:x + 24] = np.random.RandomState(0).randint(0, 255, (24, 24))
+    return frame
+
+
+def test_mosse_follows_a_moving_square():
+    trackers = create_trackers("mosse")
+    trackers.start(square_frame(30, 40), [[30, 40, 54, 64]])
+    for step in range(1, 11):
+        box = trackers.update(square_frame(30 + 2 * step, 40 + step))[0]
+    assert box == pytest.approx([50, 50, 74, 74], abs=2)
+    trackers.close()
+
+
+def test_interpolation_continues_the_motion_between_starts():
+    trackers = create_trackers("interpolate")
+    assert isinstance(trackers, InterpolationTrackers)
+    trackers.start(None, [[0, 0, 10, 10]])
+    trackers.update(None)
+    trackers.update(None)
+    # restarted two frames later 4 pixels to the right, the next frames move 2 pixels each
+    trackers.start(None, [[4, 0, 14, 10]])
+    assert trackers.update(None) == [[6, 0, 16, 10]]
+    assert trackers.update(None) == [[8, 0, 18, 10]]
+
+
+def test_unknown_tracker():
+    with pytest.raises(AssertionError):
+        create_trackers("camshift")
@@ -0,0 +1,129 @@
+import cv2
+import numpy as np
+
+# every backend tracks all the boxes of a frame together: start(image, boxes) initializes the trackers and
+# update(image) returns the new boxes in the same order, boxes are x_left, y_top, x_right, y_bottom in pixels
+# the images are the RGB or grayscale tracking frames of the frame source
+
+
+class OpenCVTrackers:
+    """
+    One OpenCV tracker (MOSSE, KCF or CSRT) per box
+    A box keeps its last position when its tracker loses the object
+    """
+
+    def __init__(self, factory):
+        self.factory = factory
+        self.trackers = []
+        self.positions = []
+
+    def color(self, image):
+        # the opencv trackers expect 3 channel images
+        if image.ndim == 2:
+            return cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+        return image
+
+    def start(self, image, boxes):
+        image = self.color(image)
+        self.trackers = []
+        self.positions = [list(box) for box in boxes]
+        for x1, y1, x2, y2 in self.positions:
+            self.trackers.append(self.factory())
+            self.trackers[-1].init(image, (int(x1), int(y1), int(x2 - x1), int(y2 - y1)))
+        return [list(box) for box in self.positions]
+
+    def update(self, image):
+        image = self.color(image)
+        for ind, opencv_tracker in enumerate(self.trackers):
+            ok, (x, y, w, h) = opencv_tracker.update(image)
+            if ok:
+                self.positions[ind] = [x, y, x + w, y + h]
+        return [list(box) for box in self.positions]
+
+    def close(self):
+        self.trackers = []
+
+
+class InterpolationTrackers:
+    """
+    Moves the boxes with the velocity measured between the last two starts instead of looking at the image
+    When the boxes are restarted on every keyframe this linearly continues the motion between keyframes,
+    it costs almost nothing and is the baseline the image based trackers are compared against
+    """
+
+    def __init__(self):
+        self.boxes = np.zeros((0, 4))
+        self.start_boxes = self.boxes
+        self.velocity = np.zeros((0, 4))
+        self.frames = 0
+
+    def start(self, image, boxes):
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        if len(boxes) == len(self.boxes) and self.frames > 0:
+            # the same objects as before, the velocity is the motion since the last start
+            self.velocity = (boxes - self.start_boxes) / self.frames
+        else:
+            self.velocity = np.zeros_like(boxes)
+        self.boxes = boxes
+        self.start_boxes = boxes
+        self.frames = 0
+        return self.boxes.tolist()
+
+    def update(self, image):
+        self.frames += 1
+        self.boxes = self.boxes + self.velocity
+        return self.boxes.tolist()
+
+    def close(self):
+        pass
+
+
+def opencv_factory(name):
+    # the opencv trackers moved to cv2.legacy in opencv 4.5.1 and are only in the contrib builds
+    for module in [cv2, getattr(cv2, "legacy", None)]:
+        if module is not None and hasattr(module, name + "_create"):
+            return getattr(module, name + "_create")
+    return None
+
+
+opencv_trackers = {"opencv_mosse": "TrackerMOSSE", "opencv_kcf": "TrackerKCF", "opencv_csrt": "TrackerCSRT"}
+tracker_names = ["dlib", "mosse", "interpolate"] + list(opencv_trackers.keys())
+
+
+def available_trackers():
+    names = ["dlib", "mosse", "interpolate"]
+    return names + [name for name, cls in opencv_trackers.items() if opencv_factory(cls) is not None]
+
+
+def create_trackers(name="dlib", workers=0):
+    """
+    Creates the tracker backend called name, the dlib trackers run in workers processes when workers > 1
+    """
+    if name == "dlib":
+        from parallel_tracking import DlibTrackers, ParallelDlibTrackers
+        # more than one worker updates the trackers in parallel processes
+        if workers > 1:
+            return ParallelDlibTrackers(workers)
+        return DlibTrackers()
+    if name == "mosse":
+        # the batched correlation filters update all the boxes in one pass without extra processes
+        from mosse_tracker import BatchedMosseTrackers
+        return BatchedMosseTrackers()
+    if name == "interpolate":
+        return InterpolationTrackers()
+    if name in opencv_trackers:
+        factory = opencv_factory(opencv_trackers[name])
+        if factory is None:
+            raise AssertionError("The tracker " + name + " is not available in this opencv build, "
+                                 "install opencv-contrib-python to use it")
+        return OpenCVTrackers(factory)
+    raise AssertionError("Unknown tracker " + name + ", the trackers are " + ", ".join(tracker_names))
+
+
+def add_tracker_arguments(parser):
+    # command line arguments shared by the scripts that track objects
+    parser.add_argument("--tracker", default="dlib", choices=tracker_names, required=False,
+                        help="the tracker backend, mosse are batched correlation filters for many objects")
+    parser.add_argument("--tracker_workers", default=0, type=int, required=False,
+                        help="number of processes that update the dlib trackers in parallel, 0 updates them in "
+                             "this process")
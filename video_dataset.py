@@ -0,0 +1,240 @@
+import argparse
+import cv2
+import json
+import numpy as np
+import os
+import shutil
+import subprocess
+import threading
+import time
+from collections import OrderedDict
+from annotation_store import read_store, latest_frames
+
+# with --image_format video no images are written, the session only keeps the path of the video in video.json
+# and the video frame of every saved frame in the annotation store, the frames are decoded again when they are read
+
+
+def write_video_reference(save_path, video_path):
+    with open(os.path.join(save_path, "video.json"), 'w') as f:
+        json.dump({"video": os.path.abspath(video_path)}, f)
+
+
+def read_video_reference(save_path):
+    path = os.path.join(save_path, "video.json")
+    if not os.path.exists(path):
+        raise AssertionError("There is no video.json in " + save_path + ", the session was not saved with "
+                             "--image_format video")
+    with open(path) as f:
+        return json.load(f)["video"]
+
+
+def probe_packets(video_path):
+    # the presentation time and keyframe flag of every packet of the video stream, None without ffprobe
+    if shutil.which("ffprobe") is None:
+        return None
+    command = ["ffprobe", "-v", "error", "-select_streams", "v:0", "-show_entries", "packet=pts_time,flags",
+               "-of", "csv=print_section=0", video_path]
+    try:
+        output = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    pts, keys = [], []
+    for line in output.decode().splitlines():
+        parts = line.strip().split(',')
+        if len(parts) < 2 or parts[0] in ("", "N/A"):
+            continue
+        pts.append(float(parts[0]))
+        keys.append("K" in parts[1])
+    if len(pts) == 0:
+        return None
+    # the packets are in decoding order, the frames are numbered in presentation order
+    order = np.argsort(pts, kind="stable")
+    return np.asarray(pts)[order], np.asarray(keys)[order]
+
+
+def build_seek_index(video_path):
+    """
+    The seek index of a video: the timestamp of every frame and the frames that are keyframes
+    Without ffprobe the timestamps are computed from the frame rate and the keyframes are unknown
+    """
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise AssertionError("Could not open the video " + video_path)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+    packets = probe_packets(video_path)
+    if packets is not None:
+        pts, keys = packets
+        return {"pts": pts - pts[0], "keyframes": np.flatnonzero(keys), "fps": fps}
+    return {"pts": np.arange(count) / fps, "keyframes": np.zeros(0, dtype=np.int64), "fps": fps}
+
+
+def load_seek_index(save_path, video_path):
+    # the index is built once per video and cached next to the annotations
+    path = os.path.join(save_path, "annotations", "seek_index.npz")
+    if os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(video_path):
+        data = np.load(path)
+        return {"pts": data["pts"], "keyframes": data["keyframes"], "fps": float(data["fps"])}
+    index = build_seek_index(video_path)
+    np.savez(path, pts=index["pts"], keyframes=index["keyframes"], fps=index["fps"])
+    return index
+
+
+class VideoFrames:
+    """
+    Decodes frames of a video by index with an LRU cache of decoded frames
+    A requested frame close ahead of the decoder position is reached by grabbing the frames in between,
+    otherwise the decoder seeks, frames in between that are in keep are cached on the way
+    """
+
+    def __init__(self, video_path, seek_index=None, cache_size=64, seek_threshold=50, keep=None):
+        self.video_path = video_path
+        self.seek_index = seek_index
+        self.cache_size = cache_size
+        self.seek_threshold = seek_threshold
+        self.keep = set() if keep is None else set(keep)
+        self.cap = None
+        self.position = 0
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+        # counters of the reads
+        self.hits = 0
+        self.decoded = 0
+        self.seeks = 0
+
+    def __getstate__(self):
+        # a video capture can not be pickled, every process of a data loader opens its own
+        state = self.__dict__.copy()
+        state.update(cap=None, position=0, cache=OrderedDict(), lock=None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def keyframe_before(self, index):
+        if self.seek_index is None or len(self.seek_index["keyframes"]) == 0:
+            return None
+        keyframes = self.seek_index["keyframes"]
+        k = np.searchsorted(keyframes, index, side="right") - 1
+        return int(keyframes[k]) if k >= 0 else 0
+
+    def timestamp(self, index):
+        if self.seek_index is None:
+            return None
+        return float(self.seek_index["pts"][index])
+
+    def should_seek(self, index):
+        if self.cap is None or index < self.position:
+            return True
+        keyframe = self.keyframe_before(index)
+        if keyframe is not None:
+            # a seek decodes from the keyframe before the frame, it only helps when that keyframe is ahead
+            return keyframe > self.position
+        return index - self.position > self.seek_threshold
+
+    def remember(self, index, image):
+        self.cache[index] = image
+        self.cache.move_to_end(index)
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    def get(self, index):
+        with self.lock:
+            if index in self.cache:
+                self.hits += 1
+                self.cache.move_to_end(index)
+                return self.cache[index]
+            if self.should_seek(index):
+                if self.cap is None:
+                    self.cap = cv2.VideoCapture(self.video_path)
+                self.cap.set(cv2.CAP_PROP_POS_FRAMES, index)
+                self.position = index
+                self.seeks += 1
+            # grab the frames up to the requested one, keeping the ones that will be asked for
+            while self.position < index:
+                if self.position in self.keep:
+                    ok, image = self.cap.read()
+                    if ok:
+                        self.remember(self.position, image)
+                else:
+                    ok = self.cap.grab()
+                if not ok:
+                    break
+                self.position += 1
+            ok, image = self.cap.read()
+            if not ok:
+                raise IndexError("Could not decode frame " + str(index) + " of " + self.video_path)
+            self.position = index + 1
+            self.decoded += 1
+            self.remember(index, image)
+            return image
+
+    def close(self):
+        if self.cap is not None:
+            self.cap.release()
+            self.cap = None
+
+    def report(self):
+        print("video frames: %d decoded, %d cache hits, %d seeks" % (self.decoded, self.hits, self.seeks))
+
+
+class VideoDataset:
+    """
+    Random access to the frames and boxes of a session saved with --image_format video
+    dataset[i] returns the BGR frame and an array of [class_id, center_x, center_y, width, height] rows
+    in the ratios of the frame, the frames are decoded lazily
+    """
+
+    def __init__(self, save_path, cache_size=64, seek_threshold=50):
+        self.save_path = save_path
+        self.video_path = read_video_reference(save_path)
+        frames, self.labels = read_store(save_path)
+        self.frames = frames[latest_frames(frames)]
+        if (self.frames["source_frame"] < 0).any():
+            raise AssertionError("Some saved frames have no video frame, the session can not be read from the video")
+        self.seek_index = load_seek_index(save_path, self.video_path)
+        self.video = VideoFrames(self.video_path, self.seek_index, cache_size, seek_threshold,
+                                 keep=self.frames["source_frame"].tolist())
+
+    def __len__(self):
+        return len(self.frames)
+
+    def boxes(self, i):
+        record = self.frames[i]
+        labels = self.labels[record["offset"]:record["offset"] + record["count"]]
+        return np.stack([labels["class_id"].astype(np.float32), labels["cx"], labels["cy"], labels["w"],
+                         labels["h"]], axis=1) if len(labels) > 0 else np.zeros((0, 5), dtype=np.float32)
+
+    def __getitem__(self, i):
+        if i < 0 or i >= len(self):
+            raise IndexError("index " + str(i) + " is out of range")
+        return self.video.get(int(self.frames[i]["source_frame"])), self.boxes(i)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Builds the seek index of a session saved with --image_format video "
+                                                 "and measures the random access speed")
+    parser.add_argument("-s", "--save_path", required=True, help="The path of the saved annotations")
+    parser.add_argument("--cache_size", type=int, default=64, help="number of decoded frames kept in memory")
+    parser.add_argument("--reads", type=int, default=200, help="number of random frames to read, 0 only builds "
+                                                               "the index")
+    args = parser.parse_args()
+    start = time.perf_counter()
+    dataset = VideoDataset(args.save_path, args.cache_size)
+    print("%d frames of %s, %d keyframes in the index (%0.2f s)" %
+          (len(dataset), dataset.video_path, len(dataset.seek_index["keyframes"]), time.perf_counter() - start))
+    if args.reads > 0 and len(dataset) > 0:
+        order = np.random.randint(0, len(dataset), args.reads)
+        start = time.perf_counter()
+        for i in order:
+            dataset[i]
+        elapsed = time.perf_counter() - start
+        print("%d random reads in %0.2f s (%0.1f ms per frame)" % (args.reads, elapsed, 1000 * elapsed / args.reads))
+        dataset.video.report()
+    dataset.video.close()
+
+
+if __name__ == "__main__":
+    main()
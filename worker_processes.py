@@ -0,0 +1,5 @@
+import multiprocessing as mp
+
+# the scripts parse the arguments and create the save path when they are imported, so the workers are forked
+# where possible instead of spawned to not run the scripts again
+mp_context = mp.get_context("fork") if "fork" in mp.get_all_start_methods() else mp.get_context()